@@ -0,0 +1,395 @@
+"""
+Banco de Pruebas de Rendimiento para compress.py
+================================================
+
+Genera clips sintéticos deterministas con ffmpeg (resolución, nivel de movimiento y
+duración fijos) y los codifica con exactamente el mismo comando que usa compress_video
+en cada modo, con HandBrakeCLI o con el backend ffmpeg (--encoder, --codec). Por cada
+clip y modo registra:
+- Tiempo real y segundos de CPU del proceso del encoder
+- Fotogramas por segundo de codificación
+- Proporción de tamaño salida/origen
+
+Uso:
+    python3 benchmark.py run -o base.json            # ejecutar y guardar el informe
+    python3 benchmark.py run -o nuevo.json --repeat 3
+    python3 benchmark.py compare base.json nuevo.json  # marca regresiones (código 1)
+    python3 benchmark.py run -o x265.json --encoder ffmpeg --codec libx265
+
+Los clips se guardan en ~/.cache/compress_mp4/benchmark y se reutilizan entre
+ejecuciones; su hash SHA-256 queda en el informe para comprobar que dos informes
+comparados usaron la misma entrada.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+try:
+    import resource
+except ImportError:  # Windows: sin segundos de CPU de los procesos hijos
+    resource = None
+
+import compress
+
+# Fuentes lavfi por nivel de movimiento. Todas son deterministas: testsrc2 es un
+# patrón animado fijo y el ruido usa una semilla constante.
+MOTION_SOURCES = {
+    'static': "smptehdbars=size={w}x{h}:rate={fps}",
+    'medium': "testsrc2=size={w}x{h}:rate={fps}",
+    'high': "testsrc2=size={w}x{h}:rate={fps},noise=alls=40:allf=t+u:all_seed=20240601",
+}
+
+RESOLUTIONS = {'360p': (640, 360), '720p': (1280, 720), '1080p': (1920, 1080)}
+
+CLIP_FPS = 30
+
+# Versión del formato del informe JSON
+REPORT_VERSION = 1
+
+# Cambio relativo (%) a partir del cual una métrica se considera regresión
+DEFAULT_THRESHOLDS = {'wall_seconds': 10.0, 'cpu_seconds': 10.0, 'encode_fps': 10.0, 'output_ratio': 2.0}
+
+# Dirección "mejor" de cada métrica: +1 si mayor es mejor, -1 si menor es mejor
+METRIC_DIRECTION = {'wall_seconds': -1, 'cpu_seconds': -1, 'encode_fps': 1, 'output_ratio': -1}
+
+
+def clip_name(resolution, motion, duration):
+    """Nombre de archivo del clip sintético."""
+    return f"clip_{resolution}_{motion}_{duration:g}s.mp4"
+
+
+def generate_clip(ffmpeg_path, path, resolution, motion, duration):
+    """
+    Genera un clip sintético con video H.264 de alta calidad y un tono de audio AAC.
+
+    El clip de origen se codifica con un solo hilo y marcas bitexact para que la misma
+    versión de ffmpeg produzca siempre el mismo archivo.
+
+    Args:
+        ffmpeg_path (str): Ruta del ejecutable de ffmpeg
+        path (str): Archivo de salida
+        resolution (str): Clave de RESOLUTIONS
+        motion (str): Clave de MOTION_SOURCES
+        duration (float): Duración en segundos
+    """
+    width, height = RESOLUTIONS[resolution]
+    video = MOTION_SOURCES[motion].format(w=width, h=height, fps=CLIP_FPS)
+    tmp_path = f"{path}.tmp.mp4"
+    subprocess.run(
+        [ffmpeg_path, '-hide_banner', '-loglevel', 'error', '-y',
+         '-f', 'lavfi', '-i', video,
+         '-f', 'lavfi', '-i', 'sine=frequency=440:sample_rate=48000',
+         '-t', f"{duration:g}", '-map', '0:v', '-map', '1:a',
+         '-c:v', 'libx264', '-preset', 'veryfast', '-crf', '12', '-pix_fmt', 'yuv420p',
+         '-threads', '1', '-g', str(CLIP_FPS * 2),
+         '-c:a', 'aac', '-b:a', '128k',
+         '-fflags', '+bitexact', '-flags:v', '+bitexact', '-flags:a', '+bitexact',
+         '-movflags', '+faststart', tmp_path],
+        check=True
+    )
+    os.replace(tmp_path, path)
+
+
+def file_sha256(path):
+    """Hash SHA-256 de un archivo."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def children_cpu_seconds():
+    """Segundos de CPU (usuario + sistema) consumidos por los procesos hijos terminados."""
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def encode_once(source, dest, mode, encoder, threads, width, duration):
+    """
+    Codifica un clip con el comando de compress_video y mide el proceso.
+
+    Returns:
+        dict: returncode, wall_seconds, cpu_seconds y avg_fps reportado por el encoder
+    """
+    command = encoder.build_command(source, dest, mode, threads=threads, source_width=width)
+    last = {}
+
+    def on_progress(event):
+        if event.avg_fps is not None:
+            last['avg_fps'] = event.avg_fps
+
+    cpu_before = children_cpu_seconds()
+    start = time.monotonic()
+    try:
+        returncode = compress.run_encoder(command, on_progress=on_progress, progress=encoder.progress(duration))
+    except compress.EncoderStalled as e:
+        print(f"⏱️  {os.path.basename(source)}: codificación detenida por el vigilante ({e})")
+        returncode = None
+    wall = time.monotonic() - start
+    cpu_after = children_cpu_seconds()
+    return {
+        'returncode': returncode,
+        'wall_seconds': wall,
+        'cpu_seconds': None if cpu_before is None else cpu_after - cpu_before,
+        'encoder_avg_fps': last.get('avg_fps'),
+    }
+
+
+def handbrake_version(handbrake_path):
+    """Primera línea de 'HandBrakeCLI --version' (o None)."""
+    try:
+        output = subprocess.run([handbrake_path, '--version'], capture_output=True, text=True,
+                                timeout=30).stdout
+    except (OSError, subprocess.SubprocessError):
+        return None
+    for line in output.splitlines():
+        if line.strip().startswith('HandBrake'):
+            return line.strip()
+    return None
+
+
+def run_benchmark(args):
+    """
+    Genera los clips que falten, codifica cada clip en cada modo y escribe el informe.
+
+    Returns:
+        int: Código de salida (0 si todas las codificaciones terminaron bien)
+    """
+    handbrake_path = compress.find_handbrake_cli()
+    ffmpeg_path = compress.find_ffmpeg()
+    if not ffmpeg_path:
+        print("❌ Error: Se necesita ffmpeg para generar los clips de prueba.")
+        return 2
+    if args.encoder == 'ffmpeg':
+        encoder = compress.FfmpegBackend(ffmpeg_path, codec=args.codec, preset=args.encoder_preset)
+    elif handbrake_path:
+        encoder = compress.HandBrakeBackend(handbrake_path, preset=args.encoder_preset)
+    else:
+        print("❌ Error: No se pudo encontrar 'HandBrakeCLI'.")
+        return 2
+
+    os.makedirs(args.clips_dir, exist_ok=True)
+    clips = []
+    for resolution in args.resolutions:
+        for motion in args.motions:
+            for duration in args.durations:
+                path = os.path.join(args.clips_dir, clip_name(resolution, motion, duration))
+                if not os.path.isfile(path):
+                    print(f"🎞️  Generando {os.path.basename(path)}...")
+                    generate_clip(ffmpeg_path, path, resolution, motion, duration)
+                clips.append((resolution, motion, duration, path))
+
+    results = []
+    failures = 0
+    work_dir = tempfile.mkdtemp(prefix='compress_benchmark_')
+    try:
+        for resolution, motion, duration, path in clips:
+            width, height = RESOLUTIONS[resolution]
+            frames = int(round(duration * CLIP_FPS))
+            source_size = os.path.getsize(path)
+            for mode in args.modes:
+                dest = os.path.join(work_dir, f"{mode}_{os.path.basename(path)}")
+                runs = []
+                for _ in range(args.repeat):
+                    if os.path.exists(dest):
+                        os.remove(dest)
+                    runs.append(encode_once(path, dest, mode, encoder, args.threads, width, duration))
+                ok = all(r['returncode'] == 0 for r in runs) and os.path.isfile(dest)
+                wall = statistics.median(r['wall_seconds'] for r in runs)
+                cpu_values = [r['cpu_seconds'] for r in runs if r['cpu_seconds'] is not None]
+                output_size = os.path.getsize(dest) if ok else 0
+                result = {
+                    'clip': os.path.basename(path),
+                    'mode': mode,
+                    'encoder': encoder.label,
+                    'resolution': resolution,
+                    'motion': motion,
+                    'duration': duration,
+                    'width': width,
+                    'height': height,
+                    'frames': frames,
+                    'clip_sha256': file_sha256(path),
+                    'ok': ok,
+                    'returncodes': [r['returncode'] for r in runs],
+                    'wall_seconds': round(wall, 4),
+                    'wall_seconds_runs': [round(r['wall_seconds'], 4) for r in runs],
+                    'cpu_seconds': round(statistics.median(cpu_values), 4) if cpu_values else None,
+                    'encode_fps': round(frames / wall, 3) if ok and wall > 0 else 0.0,
+                    'encoder_avg_fps': runs[-1]['encoder_avg_fps'],
+                    'source_size': source_size,
+                    'output_size': output_size,
+                    'output_ratio': round(output_size / source_size, 5) if ok else None,
+                }
+                results.append(result)
+                if not ok:
+                    failures += 1
+                    print(f"❌ {result['clip']} [{mode}]: la codificación falló")
+                else:
+                    print(f"✅ {result['clip']} [{mode}]: {wall:.2f}s, {result['encode_fps']:.1f} fps, "
+                          f"salida {result['output_ratio'] * 100:.1f}% del origen")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        'version': REPORT_VERSION,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'host': {
+            'platform': platform.platform(),
+            'machine': platform.machine(),
+            'processor': platform.processor(),
+            'cpu_count': os.cpu_count(),
+            'python': platform.python_version(),
+        },
+        'encoder': encoder.label,
+        'handbrake': handbrake_version(handbrake_path) if encoder.name == 'handbrake' else None,
+        'threads': args.threads,
+        'repeat': args.repeat,
+        'results': results,
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"📄 Informe guardado en {args.output}")
+    return 1 if failures else 0
+
+
+def compare_reports(base, new, thresholds):
+    """
+    Compara dos informes y detecta regresiones por clip y modo.
+
+    Args:
+        base (dict): Informe de referencia
+        new (dict): Informe a evaluar
+        thresholds (dict): Cambio relativo (%) tolerado por métrica
+
+    Returns:
+        tuple: (filas de comparación, lista de regresiones, lista de avisos)
+    """
+    warnings = []
+    if base.get('host', {}).get('platform') != new.get('host', {}).get('platform') or \
+            base.get('host', {}).get('cpu_count') != new.get('host', {}).get('cpu_count'):
+        warnings.append("los informes provienen de máquinas distintas")
+    if base.get('encoder', 'handbrake') != new.get('encoder', 'handbrake'):
+        warnings.append(f"encoder distinto: {base.get('encoder', 'handbrake')} → {new.get('encoder', 'handbrake')}")
+    elif base.get('handbrake') != new.get('handbrake'):
+        warnings.append(f"versión de HandBrake distinta: {base.get('handbrake')} → {new.get('handbrake')}")
+
+    base_results = {(r['clip'], r['mode']): r for r in base['results']}
+    rows = []
+    regressions = []
+    for result in new['results']:
+        key = (result['clip'], result['mode'])
+        reference = base_results.get(key)
+        if reference is None:
+            continue
+        if reference.get('clip_sha256') != result.get('clip_sha256'):
+            warnings.append(f"{key[0]}: el clip de origen cambió entre informes")
+        if not result['ok'] and reference['ok']:
+            regressions.append(f"{key[0]} [{key[1]}]: la codificación ahora falla")
+            continue
+        for metric, direction in METRIC_DIRECTION.items():
+            old, cur = reference.get(metric), result.get(metric)
+            if not old or cur is None:
+                continue
+            change = (cur - old) / old * 100
+            regressed = -change * direction > thresholds[metric]
+            rows.append((key[0], key[1], metric, old, cur, change, regressed))
+            if regressed:
+                regressions.append(f"{key[0]} [{key[1]}]: {metric} {old:g} → {cur:g} ({change:+.1f}%)")
+    return rows, regressions, warnings
+
+
+def run_compare(args):
+    """
+    Imprime la comparación de dos informes.
+
+    Returns:
+        int: 1 si hay regresiones, 0 si no
+    """
+    with open(args.base, encoding='utf-8') as f:
+        base = json.load(f)
+    with open(args.new, encoding='utf-8') as f:
+        new = json.load(f)
+    thresholds = dict(DEFAULT_THRESHOLDS)
+    for item in args.threshold:
+        metric, _, value = item.partition('=')
+        if metric not in thresholds:
+            print(f"❌ Métrica desconocida en --threshold: {metric}")
+            return 2
+        thresholds[metric] = float(value)
+
+    rows, regressions, warnings = compare_reports(base, new, thresholds)
+    for warning in warnings:
+        print(f"⚠️  {warning}")
+    print(f"{'Clip':<32} {'Modo':<5} {'Métrica':<14} {'Base':>10} {'Nuevo':>10} {'Cambio':>8}")
+    for clip, mode, metric, old, cur, change, regressed in rows:
+        flag = "  ❌" if regressed else ""
+        print(f"{clip:<32} {mode:<5} {metric:<14} {old:>10.4g} {cur:>10.4g} {change:>+7.1f}%{flag}")
+    if regressions:
+        print(f"\n❌ {len(regressions)} regresiones:")
+        for regression in regressions:
+            print(f"   {regression}")
+        return 1
+    print("\n✅ Sin regresiones")
+    return 0
+
+
+def parse_arguments():
+    """
+    Lee las opciones de línea de comandos.
+
+    Returns:
+        argparse.Namespace: Opciones de ejecución
+    """
+    parser = argparse.ArgumentParser(description="Banco de pruebas de rendimiento de compress.py.")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run = commands.add_parser('run', help="Codifica los clips sintéticos y guarda un informe JSON")
+    run.add_argument('-o', '--output', default='benchmark.json', help="Informe JSON de salida")
+    run.add_argument('--modes', nargs='+', choices=['cpu', 'gpu'],
+                     default=['cpu', 'gpu'] if sys.platform == 'darwin' else ['cpu'],
+                     help="Modos a medir (gpu requiere VideoToolbox; por defecto: cpu, y gpu en macOS)")
+    run.add_argument('--resolutions', nargs='+', choices=sorted(RESOLUTIONS), default=['360p', '720p', '1080p'])
+    run.add_argument('--motions', nargs='+', choices=sorted(MOTION_SOURCES), default=['static', 'medium', 'high'])
+    run.add_argument('--durations', nargs='+', type=float, default=[10.0], help="Duraciones en segundos")
+    run.add_argument('--repeat', type=int, default=1, help="Repeticiones por clip (se usa la mediana)")
+    run.add_argument('-t', '--threads', type=int, default=0,
+                     help="Hilos del encoder (por defecto: 0 = automático)")
+    run.add_argument('--encoder', choices=['handbrake', 'ffmpeg'], default='handbrake',
+                     help="Motor de codificación a medir (por defecto: handbrake)")
+    run.add_argument('--codec', choices=sorted(compress.FFMPEG_INTENTS),
+                     help="Códec de --encoder ffmpeg")
+    run.add_argument('--encoder-preset', metavar='PRESET', help="Preset fijo del encoder")
+    run.add_argument('--clips-dir', default=os.path.join(compress.CACHE_DIR, 'benchmark'),
+                     help="Directorio de los clips sintéticos")
+
+    compare = commands.add_parser('compare', help="Compara dos informes y marca regresiones")
+    compare.add_argument('base', help="Informe de referencia")
+    compare.add_argument('new', help="Informe a evaluar")
+    compare.add_argument('--threshold', metavar='MÉTRICA=PORCENTAJE', action='append', default=[],
+                         help="Tolerancia por métrica, p. ej. wall_seconds=15 (repetible)")
+
+    args = parser.parse_args()
+    if args.command == 'run' and args.repeat < 1:
+        parser.error("--repeat debe ser mayor o igual a 1")
+    if args.command == 'run' and args.codec and args.encoder != 'ffmpeg':
+        parser.error("--codec requiere --encoder ffmpeg")
+    return args
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    if args.command == 'run':
+        sys.exit(run_benchmark(args))
+    sys.exit(run_compare(args))
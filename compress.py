@@ -28,158 +28,703 @@ import threading
 import tempfile
 import re
 import shutil
+import queue
+import argparse
+import json
+import mmap
+import struct
+import hashlib
+import itertools
+import functools
+import math
+import select
+import ctypes
+import ctypes.util
+import bisect
+import heapq
+import urllib.request
+import urllib.error
+import atexit
+import socket
+import sqlite3
+import statistics
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from array import array
+from collections import OrderedDict
 
 # Importar send2trash con manejo de contexto sudo
 try:
     from send2trash import send2trash as _send2trash
     def send2trash(path):
+        """Mueve a la papelera una ruta o una lista de rutas (en una sola operación)."""
         try:
             _send2trash(path)
         except Exception as e:
             if "Expected a folder" in str(e):
-                # Fallback para contexto sudo: usar AppleScript nativo
+                # Fallback para contexto sudo: usar AppleScript nativo (un solo proceso por lote)
                 import subprocess
-                subprocess.run(['osascript', '-e', f'tell app "Finder" to move POSIX file "{path}" to trash'], check=True)
+                paths = [path] if isinstance(path, str) else path
+                files = ', '.join(f'POSIX file "{item}"' for item in paths)
+                subprocess.run(['osascript', '-e', f'tell app "Finder" to move {{{files}}} to trash'], check=True)
             else:
                 raise
 except ImportError:
     def send2trash(path):
         raise ImportError("send2trash no está disponible.")
 
-# --- Variables Globales de Estadísticas ---
-total_videos = 0
-total_compression_time = 0
-total_original_size = 0
-total_compressed_size = 0
-total_energy_consumed = 0.0  # Energía total consumida en kWh
 
-
-class PowerMonitor:
+class CompressionStats:
     """
-    Monitorea el consumo energético real durante la compresión de video usando powermetrics.
-    
-    Características:
-    - Captura datos reales de CPU, GPU y ANE en chips Apple Silicon
-    - Diferencia entre consumo en reposo y durante compresión
-    - Calcula energía total consumida en kWh con precisión del hardware
-    - Funciona en background sin interferir con el proceso de compresión
+    Acumula las estadísticas de compresión de forma segura entre hilos.
+
+    Reemplaza a las antiguas variables globales (total_videos, total_original_size, ...)
+    que compress_video modificaba directamente: con varios trabajos concurrentes
+    cada resultado se registra bajo un lock.
     """
-    
+
     def __init__(self):
-        self.is_monitoring = False
-        self.power_data = []
-        self.monitor_thread = None
-        self.temp_file = None
-        self.powermetrics_process = None
-        
-    def start_monitoring(self):
+        self._lock = threading.Lock()
+        self.total_videos = 0
+        self.total_compression_time = 0.0  # Suma de tiempos de codificación por video
+        self.total_original_size = 0
+        self.total_compressed_size = 0
+        self.total_energy_consumed = 0.0   # Energía total consumida en kWh
+        self.failed_videos = 0
+        self.wall_time = 0.0               # Tiempo real transcurrido de los lotes
+        self.encoded_work = 0.0            # Unidades de trabajo codificadas (ver encode_work)
+        self.skipped_videos = 0
+        self.skipped_size = 0
+        self.skipped_work = 0.0
+        self.deduplicated_videos = 0       # Copias idénticas resueltas sin codificar
+        self.io_hidden_time = 0.0          # E/S de red ocultada por la precarga al scratch
+        self.io_wait_time = 0.0            # Espera restante a que terminara la precarga
+        self.remuxed_videos = 0            # Copias de flujos: solo se rehízo el contenedor
+        self.audio_copied_videos = 0       # Copias de flujos: video copiado, audio recodificado
+        self.stream_copy_time = 0.0
+        self.rejected = []                 # (origen, motivo) de las salidas que no pasaron la verificación
+        self.mode = None
+
+    def record_success(self, result):
         """
-        Inicia el monitoreo energético en background usando powermetrics.
-        Requiere permisos sudo previamente verificados.
+        Registra un video comprimido correctamente.
+
+        Args:
+            result (dict): Resultado retornado por compress_video
         """
-        if self.is_monitoring:
-            return
-            
-        # Crear archivo temporal para datos de powermetrics
-        self.temp_file = tempfile.NamedTemporaryFile(mode='w+', delete=False, suffix='.txt')
-        self.temp_file.close()
-        
-        # Comando optimizado: muestrea cada 5 segundos CPU, GPU y ANE
-        cmd = [
-            'sudo', 'powermetrics',
-            '-s', 'cpu_power,gpu_power',  # Solo CPU y GPU para eficiencia
-            '-n', '-1',                   # Monitoreo continuo hasta que se detenga
-            '-i', '5000',                 # Muestra cada 5 segundos
-            '--output-file', self.temp_file.name
-        ]
-        
-        try:
-            # Iniciar powermetrics como subproceso
-            self.powermetrics_process = subprocess.Popen(
-                cmd, 
-                stdout=subprocess.DEVNULL, 
-                stderr=subprocess.DEVNULL
-            )
-            self.is_monitoring = True
-            
-        except Exception as e:
-            print(f"⚠️  Error iniciando monitoreo energético: {e}")
-            self._cleanup()
-    
-    def stop_monitoring(self):
+        with self._lock:
+            self.total_videos += 1
+            self.total_original_size += result['original_size']
+            self.total_compressed_size += result['compressed_size']
+            if result.get('stream_copy'):
+                # Sin codificación: no cuenta en el costo medido por unidad de trabajo
+                if result['stream_copy'] == 'remux':
+                    self.remuxed_videos += 1
+                else:
+                    self.audio_copied_videos += 1
+                self.stream_copy_time += result['elapsed']
+                return
+            self.total_compression_time += result['elapsed']
+            self.total_energy_consumed += result.get('energy', 0.0)
+            self.encoded_work += result.get('work', 0.0)
+            if result.get('deduplicated'):
+                self.deduplicated_videos += 1
+            self.io_hidden_time += result.get('io_hidden', 0.0)
+            self.io_wait_time += result.get('io_wait', 0.0)
+
+    def record_skip(self, result):
         """
-        Detiene el monitoreo y calcula el consumo energético total.
-        Retorna el consumo en kWh.
+        Registra un video omitido por ya estar codificado eficientemente.
+
+        Args:
+            result (dict): Resultado de compress_video con 'skipped': True
         """
-        if not self.is_monitoring:
-            return 0.0
-            
-        self.is_monitoring = False
-        
-        # Terminar proceso powermetrics
-        if self.powermetrics_process:
-            self.powermetrics_process.terminate()
-            try:
-                self.powermetrics_process.wait(timeout=5)
-            except subprocess.TimeoutExpired:
-                self.powermetrics_process.kill()
-        
-        # Esperar un momento para que se escriban los últimos datos
-        time.sleep(2)
-        
-        # Calcular consumo energético total
-        energy_kwh = self._calculate_energy_consumption()
-        self._cleanup()
-        
-        return energy_kwh
-    
-    def _calculate_energy_consumption(self):
+        with self._lock:
+            self.skipped_videos += 1
+            self.skipped_size += result['original_size']
+            self.skipped_work += result.get('work', 0.0)
+
+    def avoided_encode_time(self):
         """
-        Analiza los datos de powermetrics y calcula el consumo energético total.
-        Retorna: Energía consumida en kWh.
+        Estima el tiempo de codificación evitado por los videos omitidos.
+        Usa el costo medido en esta ejecución (segundos por unidad de trabajo) o,
+        si aún no hay mediciones, DEFAULT_ENCODE_COST del modo.
         """
-        if not self.temp_file or not os.path.exists(self.temp_file.name):
-            return 0.0
-            
+        with self._lock:
+            if self.encoded_work > 0:
+                cost = self.total_compression_time / self.encoded_work
+            else:
+                cost = DEFAULT_ENCODE_COST.get(self.mode, DEFAULT_ENCODE_COST['cpu'])
+            return self.skipped_work * cost
+
+    def record(self, result):
+        """
+        Registra el resultado de compress_video según su tipo.
+
+        Args:
+            result (dict): Resultado de compress_video (None si falló)
+        """
+        if result and result.get('skipped'):
+            self.record_skip(result)
+        elif result:
+            self.record_success(result)
+        else:
+            self.record_failure()
+
+    def record_failure(self):
+        """Registra un video cuya compresión falló."""
+        with self._lock:
+            self.failed_videos += 1
+
+    def record_rejection(self, source_path, reason):
+        """Registra una salida rechazada por la verificación (el video cuenta además como fallido)."""
+        with self._lock:
+            self.rejected.append((source_path, reason))
+
+    def add_wall_time(self, seconds):
+        """Acumula el tiempo real de un lote procesado por process_videos."""
+        with self._lock:
+            self.wall_time += seconds
+
+
+# --- Estadísticas Globales ---
+stats = CompressionStats()
+
+
+class JobConsole:
+    """
+    Salida de consola ordenada por trabajo.
+
+    Con un único trabajo imprime en vivo (incluida la línea de progreso). Con varios
+    trabajos concurrentes acumula los mensajes de cada video y los imprime como un
+    bloque contiguo al terminar, para que no se mezclen las líneas de distintos procesos.
+    """
+
+    _print_lock = threading.Lock()
+
+    def __init__(self, label=None, live=True):
+        self.label = label
+        self.live = live
+        self._lines = []
+
+    def log(self, message):
+        """Imprime (o acumula) un mensaje del trabajo."""
+        if self.live:
+            with JobConsole._print_lock:
+                print(message)
+        else:
+            self._lines.append(message.strip('\n'))
+
+    def progress(self, event):
+        """Actualiza la línea de progreso con un ProgressEvent (solo en modo en vivo)."""
+        if self.live:
+            line = f"\rProgreso: {int(event.percent)}%"
+            if event.fps is not None:
+                line += f" - {event.fps:.1f} fps"
+            if event.eta is not None:
+                minutes, seconds = divmod(event.eta, 60)
+                line += f" - ETA {minutes // 60:02d}:{minutes % 60:02d}:{seconds:02d}"
+            with JobConsole._print_lock:
+                sys.stdout.write(line + "   ")
+                sys.stdout.flush()
+
+    def progress_done(self):
+        """Marca el progreso como completado."""
+        if self.live:
+            with JobConsole._print_lock:
+                sys.stdout.write("\rProgreso: 100% - ¡Completado!      \n")
+                sys.stdout.flush()
+        else:
+            self._lines.append("Progreso: 100% - ¡Completado!")
+
+    def flush(self):
+        """Imprime de una vez los mensajes acumulados del trabajo."""
+        if not self._lines:
+            return
+        with JobConsole._print_lock:
+            print()
+            if self.label:
+                print(f"── {self.label} " + "─" * max(0, 46 - len(self.label)))
+            for line in self._lines:
+                print(f"   {line}")
+            sys.stdout.flush()
+        self._lines = []
+
+
+# --- Métricas del Lote (formato de exposición de Prometheus) ---
+
+class MetricsHistogram:
+    """Histograma acumulativo con límites fijos (semántica 'le' de Prometheus)."""
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            cumulative += count
+            le = '+Inf' if bound == float('inf') else repr(float(bound))
+            lines.append(f'{name}_bucket{{le="{le}"}} {cumulative}')
+        lines.append(f"{name}_sum {self.sum!r}")
+        lines.append(f"{name}_count {self.count}")
+        return lines
+
+
+class BatchMetrics:
+    """
+    Métricas de los lotes en curso para servirlas por HTTP o escribirlas a un archivo.
+
+    - Los resultados de cada trabajo llegan como eventos de progreso de compress_video
+      (on_event se registra con add_progress_listener)
+    - process_videos informa la profundidad de la cola y la ocupación de los trabajadores
+    - probe_video informa la latencia de cada análisis
+    Mientras enabled sea False, todas las actualizaciones se ignoran.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self._lock = threading.Lock()
+        self._jobs = {'done': 0, 'failed': 0, 'skipped': 0, 'deduplicated': 0}
+        self._probes = {}
+        self._bytes_in = 0
+        self._bytes_out = 0
+        self._bytes_saved = 0
+        self._queue_depth = 0
+        self._workers = 0
+        self._busy = 0
+        self._busy_seconds = 0.0
+        self._running = {}   # video -> (fps actuales, bytes escritos)
+        self.encode_duration = MetricsHistogram((5, 15, 30, 60, 120, 300, 600, 1800, 3600, 7200))
+        self.bytes_saved = MetricsHistogram((1e6, 1e7, 5e7, 1e8, 5e8, 1e9, 5e9, 1e10))
+        self.probe_duration = MetricsHistogram((0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5))
+        self.energy = MetricsHistogram((0.1, 0.5, 1, 2, 5, 10, 25, 50, 100))
+
+    def on_event(self, record):
+        """Receptor de eventos de progreso (ver add_progress_listener)."""
+        if not self.enabled:
+            return
+        event, source = record['event'], record['source']
+        with self._lock:
+            if event == 'progress':
+                self._running[source] = (record.get('fps') or 0.0, record.get('bytes_written', 0))
+                return
+            self._running.pop(source, None)
+            if event in self._jobs:
+                self._jobs[event] += 1
+            if event == 'done':
+                self._bytes_in += record['original_size']
+                self._bytes_out += record['compressed_size']
+                self.encode_duration.observe(record['elapsed'])
+                saved = max(0, record['original_size'] - record['compressed_size'])
+                self._bytes_saved += saved
+                self.bytes_saved.observe(saved)
+                if record.get('energy'):
+                    self.energy.observe(record['energy'] * 1000)
+
+    def observe_probe(self, source, seconds):
+        """Registra un análisis de video y su origen ('cache', 'native' o 'handbrake')."""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._probes[source] = self._probes.get(source, 0) + 1
+            self.probe_duration.observe(seconds)
+
+    def set_queue_depth(self, depth):
+        if self.enabled:
+            with self._lock:
+                self._queue_depth = depth
+
+    def add_workers(self, count):
+        """Suma (o resta, con count negativo) trabajadores al pool."""
+        if self.enabled:
+            with self._lock:
+                self._workers += count
+
+    def worker_busy(self, busy, seconds=0.0):
+        """Marca un trabajador como ocupado o libre (con los segundos que estuvo ocupado)."""
+        if self.enabled:
+            with self._lock:
+                self._busy += 1 if busy else -1
+                self._busy_seconds += seconds
+
+    def render(self):
+        """
+        Genera las métricas en el formato de texto de Prometheus.
+        Retorna: str con la exposición completa.
+        """
+        def metric(name, kind, help_text, samples):
+            out.append(f"# HELP {name} {help_text}")
+            out.append(f"# TYPE {name} {kind}")
+            out.extend(samples)
+
+        out = []
+        with self._lock:
+            metric('compress_jobs_total', 'counter', 'Trabajos terminados por resultado.',
+                   [f'compress_jobs_total{{status="{k}"}} {v}' for k, v in self._jobs.items()])
+            metric('compress_input_bytes_total', 'counter', 'Bytes de origen de los videos comprimidos.',
+                   [f"compress_input_bytes_total {self._bytes_in}"])
+            metric('compress_output_bytes_total', 'counter', 'Bytes de salida de los videos comprimidos.',
+                   [f"compress_output_bytes_total {self._bytes_out}"])
+            metric('compress_saved_bytes_total', 'counter', 'Bytes ahorrados por los videos comprimidos.',
+                   [f"compress_saved_bytes_total {self._bytes_saved}"])
+            metric('compress_queue_depth', 'gauge', 'Videos esperando en la cola.',
+                   [f"compress_queue_depth {self._queue_depth}"])
+            metric('compress_workers', 'gauge', 'Trabajadores del pool.',
+                   [f"compress_workers {self._workers}"])
+            metric('compress_workers_busy', 'gauge', 'Trabajadores codificando ahora.',
+                   [f"compress_workers_busy {self._busy}"])
+            metric('compress_worker_busy_seconds_total', 'counter',
+                   'Segundos acumulados de trabajadores ocupados.',
+                   [f"compress_worker_busy_seconds_total {self._busy_seconds!r}"])
+            metric('compress_encode_fps', 'gauge', 'Fotogramas por segundo de los trabajos en curso.',
+                   [f"compress_encode_fps {sum(fps for fps, _ in self._running.values())!r}"])
+            metric('compress_encode_bytes_written', 'gauge', 'Bytes escritos por los trabajos en curso.',
+                   [f"compress_encode_bytes_written {sum(b for _, b in self._running.values())}"])
+            metric('compress_probes_total', 'counter', 'Análisis de video por origen.',
+                   [f'compress_probes_total{{source="{k}"}} {v}' for k, v in sorted(self._probes.items())])
+            metric('compress_encode_duration_seconds', 'histogram', 'Duración de cada codificación.',
+                   self.encode_duration.render('compress_encode_duration_seconds'))
+            metric('compress_video_saved_bytes', 'histogram', 'Bytes ahorrados por video.',
+                   self.bytes_saved.render('compress_video_saved_bytes'))
+            metric('compress_probe_duration_seconds', 'histogram', 'Latencia de cada análisis de video.',
+                   self.probe_duration.render('compress_probe_duration_seconds'))
+            metric('compress_energy_watt_hours', 'histogram', 'Energía consumida por video.',
+                   self.energy.render('compress_energy_watt_hours'))
+        return '\n'.join(out) + '\n'
+
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+    """Sirve GET /metrics con las métricas globales."""
+
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = metrics.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(bind):
+    """
+    Sirve las métricas en http://HOST:PUERTO/metrics desde un hilo de fondo.
+
+    Args:
+        bind (tuple): (host, puerto) donde escuchar
+
+    Returns:
+        ThreadingHTTPServer: Servidor iniciado
+    """
+    server = ThreadingHTTPServer(bind, _MetricsRequestHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def start_metrics_file(path, interval=15.0):
+    """
+    Reescribe periódicamente las métricas en un archivo (p. ej. para el textfile
+    collector de node_exporter). Cada escritura es atómica y se hace una última al salir.
+
+    Args:
+        path (str): Archivo de métricas
+        interval (float): Segundos entre escrituras
+    """
+    def write():
+        tmp_path = f"{path}.tmp"
         try:
-            with open(self.temp_file.name, 'r') as f:
-                content = f.read()
-            
-            # Extraer valores de potencia usando regex
-            cpu_powers = re.findall(r'CPU Power: (\d+) mW', content)
-            gpu_powers = re.findall(r'GPU Power: (\d+) mW', content)
-            
-            if not cpu_powers:
-                return 0.0
-            
-            # Convertir a watts y calcular promedio
-            avg_cpu_power = sum(int(p) for p in cpu_powers) / len(cpu_powers) / 1000  # mW a W
-            avg_gpu_power = sum(int(p) for p in gpu_powers) / len(gpu_powers) / 1000 if gpu_powers else 0
-            
-            # Potencia total promedio durante la compresión
-            total_avg_power = avg_cpu_power + avg_gpu_power
-            
-            # Duración del monitoreo: número de muestras × intervalo (5 segundos)
-            duration_hours = len(cpu_powers) * 5 / 3600  # Convertir a horas
-            
-            # Energía = Potencia × Tiempo
-            energy_kwh = total_avg_power * duration_hours / 1000  # W⋅h a kWh
-            
-            return energy_kwh
-            
-        except Exception as e:
-            print(f"⚠️  Error calculando consumo energético: {e}")
-            return 0.0
-    
-    def _cleanup(self):
-        """Limpia archivos temporales y recursos."""
-        if self.temp_file and os.path.exists(self.temp_file.name):
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(metrics.render())
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"⚠️  No se pudo escribir el archivo de métricas: {e}")
+
+    def loop():
+        while True:
+            write()
+            time.sleep(interval)
+
+    threading.Thread(target=loop, daemon=True).start()
+    atexit.register(write)
+
+
+# --- Métricas Globales ---
+metrics = BatchMetrics()
+
+
+# --- Monitoreo Energético ---
+
+class EnergyBackend:
+    """
+    Interfaz de las fuentes de energía del monitoreo.
+
+    Cada backend expone un contador de energía acumulada en julios que solo crece;
+    EnergySampler se encarga de muestrearlo y repartirlo entre los trabajos.
+    """
+
+    name = 'base'
+
+    def available(self):
+        """Retorna True si el backend puede usarse en este sistema."""
+        return False
+
+    def start(self):
+        """Prepara el backend antes de la primera lectura."""
+
+    def read(self):
+        """Retorna la energía acumulada en julios desde start()."""
+        raise NotImplementedError
+
+    def close(self):
+        """Libera los recursos del backend."""
+
+
+class RaplBackend(EnergyBackend):
+    """
+    Energía de los paquetes de CPU en Linux vía RAPL (/sys/class/powercap).
+
+    Lee los contadores energy_uj de cada dominio de paquete (intel-rapl:N, también
+    expuesto en CPUs AMD) y corrige el desbordamiento con max_energy_range_uj.
+    Desde 2020 estos archivos suelen ser legibles solo por root.
+    """
+
+    name = 'rapl'
+    POWERCAP_DIR = '/sys/class/powercap'
+
+    def __init__(self):
+        self._zones = []     # [ruta de energy_uj, rango máximo, última lectura]
+        self._joules = 0.0
+
+    def _discover(self):
+        zones = []
+        try:
+            names = sorted(os.listdir(self.POWERCAP_DIR))
+        except OSError:
+            return zones
+        for name in names:
+            # Solo dominios de paquete (intel-rapl:0), no subdominios (intel-rapl:0:0)
+            if not re.fullmatch(r"intel-rapl:\d+", name):
+                continue
+            zone_dir = os.path.join(self.POWERCAP_DIR, name)
             try:
-                os.unlink(self.temp_file.name)
-            except:
-                pass
-        self.temp_file = None
-        self.powermetrics_process = None
+                with open(os.path.join(zone_dir, 'max_energy_range_uj')) as f:
+                    max_range = int(f.read())
+                energy_path = os.path.join(zone_dir, 'energy_uj')
+                with open(energy_path) as f:
+                    last = int(f.read())
+            except (OSError, ValueError):
+                continue
+            zones.append([energy_path, max_range, last])
+        return zones
+
+    def available(self):
+        return sys.platform.startswith('linux') and bool(self._discover())
+
+    def start(self):
+        self._zones = self._discover()
+        self._joules = 0.0
+
+    def read(self):
+        for zone in self._zones:
+            try:
+                with open(zone[0]) as f:
+                    raw = int(f.read())
+            except (OSError, ValueError):
+                continue
+            delta = raw - zone[2]
+            if delta < 0:
+                delta += zone[1]  # El contador dio la vuelta
+            zone[2] = raw
+            self._joules += delta / 1e6
+        return self._joules
+
+
+class PowermetricsBackend(EnergyBackend):
+    """
+    Energía de CPU y GPU en macOS leyendo la salida de powermetrics en streaming.
+
+    Cada muestra se integra con su duración real (campo 'ms elapsed' de la cabecera),
+    sin archivos temporales ni suposiciones sobre el intervalo.
+    """
+
+    name = 'powermetrics'
+    HEADER_REGEX = re.compile(r"\*\*\* Sampled system activity .*\(([\d.]+)ms elapsed\)")
+    POWER_REGEX = re.compile(r"^(CPU|GPU|ANE|Combined) Power.*?: (\d+) mW")
+
+    def __init__(self, interval_ms=1000):
+        self.interval_ms = interval_ms
+        self._process = None
+        self._reader = None
+        self._lock = threading.Lock()
+        self._joules = 0.0
+
+    def available(self):
+        return sys.platform == 'darwin' and check_powermetrics_permissions()
+
+    def start(self):
+        self._joules = 0.0
+        self._process = subprocess.Popen(
+            ['sudo', '-n', 'powermetrics', '-s', 'cpu_power,gpu_power',
+             '-n', '-1', '-i', str(self.interval_ms)],
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            universal_newlines=True, encoding='utf-8', errors='ignore'
+        )
+        self._reader = threading.Thread(target=self._read_stream, daemon=True)
+        self._reader.start()
+
+    def _read_stream(self):
+        elapsed = 0.0
+        powers = {}
+
+        def flush():
+            if elapsed > 0 and powers:
+                # La potencia combinada ya incluye CPU + GPU + ANE
+                milliwatts = powers.get('Combined', sum(powers.values()))
+                with self._lock:
+                    self._joules += milliwatts / 1000 * elapsed
+            powers.clear()
+
+        for line in self._process.stdout:
+            header = self.HEADER_REGEX.search(line)
+            if header:
+                flush()
+                elapsed = float(header.group(1)) / 1000
+                continue
+            match = self.POWER_REGEX.search(line.strip())
+            if match:
+                powers[match.group(1)] = int(match.group(2))
+                if match.group(1) == 'Combined':
+                    flush()
+        flush()
+
+    def read(self):
+        with self._lock:
+            return self._joules
+
+    def close(self):
+        if self._process and self._process.poll() is None:
+            self._process.terminate()
+            try:
+                self._process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self._process.kill()
+        self._process = None
+
+
+def create_energy_backend():
+    """
+    Elige el primer backend de energía disponible (RAPL en Linux, powermetrics en macOS).
+    Retorna: Una instancia de EnergyBackend o None si no hay ninguno.
+    """
+    for backend in (RaplBackend(), PowermetricsBackend()):
+        if backend.available():
+            return backend
+    return None
+
+
+class EnergySampler:
+    """
+    Muestrea un EnergyBackend en un hilo de fondo y atribuye la energía a los trabajos.
+
+    - Integra la energía de forma incremental entre lecturas con marcas de tiempo reales
+    - Con varios trabajos concurrentes reparte cada intervalo a partes iguales entre los
+      trabajos activos; al iniciar o terminar un trabajo se toma una muestra inmediata
+      para que los intervalos se corten exactamente en esos instantes
+    - stop() es inmediato: no hay esperas fijas
+    """
+
+    def __init__(self, backend, interval=1.0):
+        self.backend = backend
+        self.interval = interval
+        self.total_joules = 0.0
+        self._active = {}      # token -> julios atribuidos
+        self._next_token = 1
+        self._last_energy = 0.0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self.backend.start()
+        self._last_energy = self.backend.read()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def _sample_locked(self):
+        energy = self.backend.read()
+        delta = max(0.0, energy - self._last_energy)
+        self._last_energy = energy
+        self.total_joules += delta
+        if self._active:
+            share = delta / len(self._active)
+            for token in self._active:
+                self._active[token] += share
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            with self._lock:
+                self._sample_locked()
+
+    def begin_job(self):
+        """Registra el inicio de un trabajo. Retorna un token para end_job()."""
+        with self._lock:
+            self._sample_locked()
+            token = self._next_token
+            self._next_token += 1
+            self._active[token] = 0.0
+            return token
+
+    def end_job(self, token):
+        """Registra el fin de un trabajo. Retorna la energía atribuida en kWh."""
+        with self._lock:
+            self._sample_locked()
+            joules = self._active.pop(token, 0.0)
+        return joules / 3.6e6
+
+    def stop(self):
+        """Detiene el muestreo y el backend."""
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        self.backend.close()
+
+
+# --- Monitoreo Energético Global (se inicia en el flujo principal) ---
+energy_sampler = None
+
+
+def start_energy_sampler():
+    """
+    Inicia el monitoreo energético global si hay algún backend disponible.
+    Retorna: El EnergySampler iniciado o None.
+    """
+    global energy_sampler
+    backend = create_energy_backend()
+    if backend is None:
+        return None
+    try:
+        energy_sampler = EnergySampler(backend).start()
+        atexit.register(energy_sampler.stop)
+    except Exception as e:
+        print(f"⚠️  Error iniciando monitoreo energético: {e}")
+        energy_sampler = None
+    return energy_sampler
 
 
 def check_powermetrics_permissions():
@@ -199,389 +744,5135 @@ def check_powermetrics_permissions():
         return False
 
 
-def find_handbrake_cli():
+def find_handbrake_cli():
+    """
+    Busca el ejecutable de HandBrakeCLI de forma inteligente.
+    Primero verifica el PATH del sistema, luego la ubicación estándar en /Applications.
+    Retorna: La ruta al ejecutable o None si no se encuentra.
+    """
+    path = shutil.which('HandBrakeCLI')
+    if path:
+        return path
+
+    default_path = '/Applications/HandBrakeCLI'
+    if os.path.isfile(default_path):
+        return default_path
+
+    return None
+
+# --- Analizador Nativo MP4/MOV (ISO-BMFF) ---
+
+# Códecs de video conocidos por su fourcc en la caja stsd
+MP4_VIDEO_CODECS = {
+    b'avc1': 'h264', b'avc3': 'h264',
+    b'hvc1': 'hevc', b'hev1': 'hevc', b'dvh1': 'hevc', b'dvhe': 'hevc',
+    b'av01': 'av1', b'vp09': 'vp9', b'vp08': 'vp8',
+    b'mp4v': 'mpeg4', b'jpeg': 'mjpeg', b's263': 'h263',
+    b'apch': 'prores', b'apcn': 'prores', b'apcs': 'prores', b'apco': 'prores', b'ap4h': 'prores',
+}
+
+
+# Códecs de audio conocidos por su fourcc en la caja stsd
+MP4_AUDIO_CODECS = {
+    b'mp4a': 'aac', b'ac-3': 'ac3', b'ec-3': 'eac3', b'Opus': 'opus', b'alac': 'alac',
+    b'fLaC': 'flac', b'.mp3': 'mp3', b'lpcm': 'pcm', b'sowt': 'pcm', b'twos': 'pcm',
+}
+
+
+class MP4ParseError(ValueError):
+    """El archivo no es un contenedor ISO-BMFF (MP4/MOV) válido o le falta información."""
+
+
+def _iter_mp4_boxes(buf, start, end):
+    """
+    Recorre las cajas ISO-BMFF entre start y end sin leer su contenido.
+
+    Soporta tamaños de 64 bits (size == 1) y cajas que llegan hasta el final
+    del archivo (size == 0). Se detiene ante una caja truncada o inválida.
+
+    Yields:
+        tuple: (tipo, inicio_del_contenido, fin_de_la_caja)
+    """
+    offset = start
+    while offset + 8 <= end:
+        size, box_type = struct.unpack_from('>I4s', buf, offset)
+        header = 8
+        if size == 1:
+            if offset + 16 > end:
+                return
+            size = struct.unpack_from('>Q', buf, offset + 8)[0]
+            header = 16
+        elif size == 0:
+            size = end - offset
+        if size < header or offset + size > end:
+            return
+        yield box_type, offset + header, offset + size
+        offset += size
+
+
+def _find_mp4_box(buf, start, end, box_type):
+    """Retorna (inicio_del_contenido, fin) de la primera caja del tipo indicado, o None."""
+    for found_type, body, box_end in _iter_mp4_boxes(buf, start, end):
+        if found_type == box_type:
+            return body, box_end
+    return None
+
+
+def _parse_mp4_track(buf, start, end):
+    """
+    Extrae la información de una caja trak (tkhd, mdhd, hdlr, stsd y stsz).
+
+    Returns:
+        dict: Tipo de pista, dimensiones, duración, fourcc y muestras
+    """
+    track = {'handler': b'', 'width': 0, 'height': 0, 'timescale': 0, 'duration': 0,
+             'fourcc': b'', 'sample_count': 0, 'sample_bytes': 0}
+
+    tkhd = _find_mp4_box(buf, start, end, b'tkhd')
+    if tkhd:
+        body = tkhd[0]
+        # Ancho y alto de presentación en punto fijo 16.16 al final de tkhd
+        dims_offset = body + (88 if buf[body] == 1 else 76)
+        if dims_offset + 8 <= tkhd[1]:
+            width, height = struct.unpack_from('>II', buf, dims_offset)
+            track['width'], track['height'] = width >> 16, height >> 16
+
+    mdia = _find_mp4_box(buf, start, end, b'mdia')
+    if not mdia:
+        return track
+
+    for box_type, body, box_end in _iter_mp4_boxes(buf, *mdia):
+        if box_type == b'mdhd':
+            if buf[body] == 1:
+                track['timescale'], track['duration'] = struct.unpack_from('>IQ', buf, body + 20)
+            else:
+                track['timescale'], track['duration'] = struct.unpack_from('>II', buf, body + 12)
+        elif box_type == b'hdlr':
+            track['handler'] = bytes(buf[body + 8:body + 12])
+        elif box_type == b'minf':
+            stbl = _find_mp4_box(buf, body, box_end, b'stbl')
+            if stbl:
+                _parse_mp4_sample_table(buf, stbl[0], stbl[1], track)
+    return track
+
+
+def _parse_mp4_sample_table(buf, start, end, track):
+    """Lee de stbl el fourcc de la primera entrada de stsd y el tamaño de las muestras (stsz)."""
+    for box_type, body, box_end in _iter_mp4_boxes(buf, start, end):
+        if box_type == b'stsd' and body + 16 <= box_end:
+            entry = body + 8  # version/flags + entry_count
+            track['fourcc'] = bytes(buf[entry + 4:entry + 8])
+            # VisualSampleEntry: ancho y alto codificados a 32 bytes del inicio de la entrada
+            if entry + 36 <= box_end:
+                track['coded_width'], track['coded_height'] = struct.unpack_from('>HH', buf, entry + 32)
+        elif box_type == b'stsz' and body + 12 <= box_end:
+            sample_size, sample_count = struct.unpack_from('>II', buf, body + 4)
+            track['sample_count'] = sample_count
+            if sample_size:
+                track['sample_bytes'] = sample_size * sample_count
+            elif body + 12 + sample_count * 4 <= box_end:
+                sizes = array('I')
+                sizes.frombytes(buf[body + 12:body + 12 + sample_count * 4])
+                if sys.byteorder == 'little':
+                    sizes.byteswap()
+                track['sample_bytes'] = sum(sizes)
+
+
+def parse_mp4(source_path):
+    """
+    Analiza un MP4/MOV leyendo solo las cajas necesarias (moov/trak/tkhd/mdhd/stsd/stsz).
+
+    El archivo se mapea en memoria, por lo que solo se leen del disco las páginas de
+    las cabeceras: la caja mdat se salta por su tamaño aunque moov esté al final.
+
+    Args:
+        source_path (str): Ruta del archivo de video
+
+    Returns:
+        dict: width, height, duration (s), duration_ms, codec, fourcc, sample_count,
+              bitrate (bps) y fps de la pista de video, audio_codec ('' si no hay audio),
+              audio_bitrate (bps) y faststart (moov antes de los datos)
+
+    Raises:
+        MP4ParseError: Si el archivo no es ISO-BMFF o no tiene pista de video
+    """
+    with open(source_path, 'rb') as f:
+        file_size = os.fstat(f.fileno()).st_size
+        if file_size < 8:
+            raise MP4ParseError("archivo demasiado pequeño")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            moov = _find_mp4_box(buf, 0, file_size, b'moov')
+            if not moov:
+                raise MP4ParseError("no se encontró la caja moov")
+            mdat = _find_mp4_box(buf, 0, file_size, b'mdat')
+
+            movie_duration = 0.0
+            tracks = []
+            for box_type, body, box_end in _iter_mp4_boxes(buf, *moov):
+                if box_type == b'mvhd':
+                    if buf[body] == 1:
+                        timescale, duration = struct.unpack_from('>IQ', buf, body + 20)
+                    else:
+                        timescale, duration = struct.unpack_from('>II', buf, body + 12)
+                    if timescale:
+                        movie_duration = duration / timescale
+                elif box_type == b'trak':
+                    tracks.append(_parse_mp4_track(buf, body, box_end))
+
+    video = next((t for t in tracks if t['handler'] == b'vide'), None)
+    if video is None:
+        raise MP4ParseError("no hay pista de video")
+    audio = next((t for t in tracks if t['handler'] == b'soun'), None)
+
+    duration = video['duration'] / video['timescale'] if video['timescale'] else movie_duration
+    width = video['width'] or video.get('coded_width', 0)
+    height = video['height'] or video.get('coded_height', 0)
+
+    if duration > 0 and video['sample_bytes']:
+        bitrate = int(video['sample_bytes'] * 8 / duration)
+    elif movie_duration > 0:
+        bitrate = int(file_size * 8 / movie_duration)
+    else:
+        bitrate = 0
+    audio_duration = audio['duration'] / audio['timescale'] if audio and audio['timescale'] else 0
+
+    return {
+        'width': width,
+        'height': height,
+        'duration': duration,
+        'duration_ms': int(duration * 1000),
+        'codec': MP4_VIDEO_CODECS.get(video['fourcc'], video['fourcc'].decode('latin-1').strip()),
+        'fourcc': video['fourcc'].decode('latin-1'),
+        'sample_count': video['sample_count'],
+        'bitrate': bitrate,
+        'fps': round(video['sample_count'] / duration, 3) if duration > 0 else 0.0,
+        'audio_codec': (MP4_AUDIO_CODECS.get(audio['fourcc'], audio['fourcc'].decode('latin-1').strip())
+                        if audio else ''),
+        'audio_bitrate': int(audio['sample_bytes'] * 8 / audio_duration) if audio_duration > 0 else 0,
+        # moov antes de mdat: el video se puede reproducir mientras se descarga
+        'faststart': mdat is None or moov[0] < mdat[0],
+    }
+
+
+def mp4_keyframe_times(source_path):
+    """
+    Obtiene los instantes (en segundos) de los fotogramas clave de la pista de video
+    a partir de las cajas stss (muestras de sincronización) y stts (duraciones).
+    Si no hay stss, todas las muestras son fotogramas clave.
+
+    Args:
+        source_path (str): Ruta del archivo de video
+
+    Returns:
+        list: Instantes ordenados de los fotogramas clave
+
+    Raises:
+        MP4ParseError: Si el archivo no es ISO-BMFF o no tiene pista de video
+    """
+    with open(source_path, 'rb') as f:
+        file_size = os.fstat(f.fileno()).st_size
+        if file_size < 8:
+            raise MP4ParseError("archivo demasiado pequeño")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            moov = _find_mp4_box(buf, 0, file_size, b'moov')
+            if not moov:
+                raise MP4ParseError("no se encontró la caja moov")
+            for box_type, body, box_end in _iter_mp4_boxes(buf, *moov):
+                if box_type != b'trak':
+                    continue
+                mdia = _find_mp4_box(buf, body, box_end, b'mdia')
+                if not mdia:
+                    continue
+                hdlr = _find_mp4_box(buf, mdia[0], mdia[1], b'hdlr')
+                if not hdlr or bytes(buf[hdlr[0] + 8:hdlr[0] + 12]) != b'vide':
+                    continue
+                mdhd = _find_mp4_box(buf, mdia[0], mdia[1], b'mdhd')
+                minf = _find_mp4_box(buf, mdia[0], mdia[1], b'minf')
+                stbl = minf and _find_mp4_box(buf, minf[0], minf[1], b'stbl')
+                if not mdhd or not stbl:
+                    break
+                timescale = struct.unpack_from('>I', buf, mdhd[0] + (20 if buf[mdhd[0]] == 1 else 12))[0]
+                stts = _find_mp4_box(buf, stbl[0], stbl[1], b'stts')
+                stss = _find_mp4_box(buf, stbl[0], stbl[1], b'stss')
+                if not stts or not timescale:
+                    break
+
+                runs = struct.unpack_from('>I', buf, stts[0] + 4)[0]
+                runs = [struct.unpack_from('>II', buf, stts[0] + 8 + i * 8) for i in range(runs)]
+                if stss:
+                    count = struct.unpack_from('>I', buf, stss[0] + 4)[0]
+                    sync_samples = array('I')
+                    sync_samples.frombytes(buf[stss[0] + 8:stss[0] + 8 + count * 4])
+                    if sys.byteorder == 'little':
+                        sync_samples.byteswap()
+                else:
+                    sync_samples = range(1, sum(run[0] for run in runs) + 1)
+
+                # Recorrer las duraciones de stts en paralelo con las muestras clave
+                times = []
+                ticks, run_index = 0, 0
+                run_first = 1
+                for key_sample in sync_samples:
+                    while run_index < len(runs) and key_sample >= run_first + runs[run_index][0]:
+                        ticks += runs[run_index][0] * runs[run_index][1]
+                        run_first += runs[run_index][0]
+                        run_index += 1
+                    if run_index >= len(runs):
+                        break
+                    times.append((ticks + (key_sample - run_first) * runs[run_index][1]) / timescale)
+                return times
+    raise MP4ParseError("no hay pista de video")
+
+
+# Directorio de caché persistente (respeta XDG_CACHE_HOME)
+CACHE_DIR = os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'), 'compress_mp4')
+
+
+class ProbeCache:
+    """
+    Caché persistente en disco de los resultados de análisis de video.
+
+    Cada entrada se identifica por la ruta del archivo y solo es válida mientras el
+    tamaño, el mtime y el inodo coincidan; así un archivo reemplazado o modificado
+    vuelve a analizarse. La caché es LRU y se limita a max_entries entradas y a
+    max_bytes bytes en disco (al guardar se desalojan las menos usadas hasta caber).
+    Cuenta aciertos y fallos para reportar el ahorro en las estadísticas.
+    """
+
+    # Versión del formato: las entradas de versiones anteriores se descartan y los
+    # archivos se vuelven a analizar (la 2 agregó audio_bitrate y faststart)
+    VERSION = 2
+
+    def __init__(self, path=None, max_entries=20000, max_bytes=8 * 1024 ** 2):
+        self.path = path or os.path.join(CACHE_DIR, 'probe_cache.json')
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.enabled = True
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._dirty = False
+
+    @staticmethod
+    def _identity(path):
+        """Retorna (tamaño, mtime_ns, inodo) del archivo o None si no existe."""
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return [st.st_size, st.st_mtime_ns, st.st_ino]
+
+    def _load(self):
+        """Carga la caché desde disco la primera vez que se usa."""
+        if self._loaded:
+            return
+        self._loaded = True
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') != self.VERSION:
+                return
+            for key, entry in data.get('entries', []):
+                self._entries[key] = entry
+        except (OSError, ValueError, TypeError):
+            self._entries = OrderedDict()
+
+    def get(self, path):
+        """
+        Busca el análisis de un archivo en la caché.
+
+        Returns:
+            dict: Metadatos guardados, o None si no hay entrada válida
+        """
+        if not self.enabled:
+            return None
+        key = os.path.abspath(path)
+        identity = self._identity(key)
+        with self._lock:
+            self._load()
+            entry = self._entries.get(key)
+            if entry is not None and identity is not None and entry['id'] == identity and 'info' in entry:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return dict(entry['info'])
+            self.misses += 1
+            return None
+
+    def put(self, path, info):
+        """Guarda el análisis de un archivo, desalojando las entradas menos usadas."""
+        if not self.enabled:
+            return
+        key = os.path.abspath(path)
+        identity = self._identity(key)
+        if identity is None:
+            return
+        with self._lock:
+            self._load()
+            self._store(key, identity)['info'] = dict(info)
+
+    def _store(self, key, identity):
+        """Entrada vigente de una clave (nueva si el archivo cambió); requiere el lock."""
+        entry = self._entries.get(key)
+        if entry is None or entry['id'] != identity:
+            entry = self._entries[key] = {'id': identity}
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        self._dirty = True
+        return entry
+
+    def get_extra(self, path, name):
+        """
+        Busca un dato adicional del archivo (p. ej. su huella) guardado junto al análisis.
+
+        Returns:
+            Valor guardado o None si no hay entrada válida
+        """
+        if not self.enabled:
+            return None
+        key = os.path.abspath(path)
+        identity = self._identity(key)
+        with self._lock:
+            self._load()
+            entry = self._entries.get(key)
+            if entry is not None and identity is not None and entry['id'] == identity:
+                return entry.get(name)
+            return None
+
+    def put_extra(self, path, name, value):
+        """Guarda un dato adicional del archivo, válido mientras el archivo no cambie."""
+        if not self.enabled:
+            return
+        key = os.path.abspath(path)
+        identity = self._identity(key)
+        if identity is None:
+            return
+        with self._lock:
+            self._load()
+            self._store(key, identity)[name] = value
+
+    def save(self):
+        """Escribe la caché en disco de forma atómica (solo si cambió)."""
+        with self._lock:
+            if not self.enabled or not self._dirty:
+                return
+            # Entradas en orden LRU; las menos usadas se desalojan hasta caber en max_bytes
+            # (json.dumps escapa a ASCII: la longitud es el tamaño en bytes)
+            encoded = [json.dumps(item, separators=(',', ':')) for item in self._entries.items()]
+            header = f'{{"version":{self.VERSION},"entries":['
+            total = len(header) + 2 + sum(len(item) + 1 for item in encoded)
+            evicted = 0
+            while total > self.max_bytes and evicted < len(encoded):
+                total -= len(encoded[evicted]) + 1
+                evicted += 1
+            for key in list(itertools.islice(self._entries, evicted)):
+                del self._entries[key]
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                tmp_path = f"{self.path}.{os.getpid()}.tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    f.write(header + ','.join(encoded[evicted:]) + ']}')
+                os.replace(tmp_path, self.path)
+                self._dirty = False
+            except OSError as e:
+                print(f"⚠️  No se pudo guardar la caché de análisis: {e}")
+
+
+# --- Caché Global de Análisis ---
+probe_cache = ProbeCache()
+
+
+def scan_video_with_handbrake(source_path, handbrake_path):
+    """
+    Analiza un video con el escaneo de HandBrakeCLI (sin codificar).
+    Parámetros:
+        source_path (str): La ruta al video de origen.
+        handbrake_path (str): La ruta al ejecutable de HandBrakeCLI.
+    Retorna: dict con width, height, duration (s), codec, bitrate (bps) y fps.
+             Los campos que no se pueden determinar quedan en 0 o ''.
+    """
+    info = {'width': 0, 'height': 0, 'duration': 0.0, 'codec': '', 'bitrate': 0, 'fps': 0.0}
+    command = [handbrake_path, '-i', source_path, '--scan']
+    # HandBrakeCLI imprime la información del escaneo en stderr.
+    process = subprocess.run(command, capture_output=True, text=True, encoding='utf-8', errors='ignore')
+    output = process.stderr
+
+    # Resumen de HandBrake: "+ size: 1920x1080, ..., 29.970 fps"
+    match = re.search(r"\+ size: (\d+)x(\d+)(?:.*?([\d.]+) fps)?", output)
+    if match:
+        info['width'] = int(match.group(1))  # El grupo 1 es el ancho.
+        info['height'] = int(match.group(2))
+        if match.group(3):
+            info['fps'] = float(match.group(3))
+
+    # Duración: "+ duration: 00:10:05" o "Duration: 00:10:05.23" de libavformat
+    match = (re.search(r"\+ duration: (\d+):(\d+):(\d+(?:\.\d+)?)", output)
+             or re.search(r"Duration: (\d+):(\d+):(\d+(?:\.\d+)?)", output))
+    if match:
+        info['duration'] = int(match.group(1)) * 3600 + int(match.group(2)) * 60 + float(match.group(3))
+
+    # Flujo de video: "Stream #0:0: Video: h264 (High) ..., 7990 kb/s, 29.97 fps"
+    match = re.search(r"Video: (\w+)([^\n]*)", output)
+    if match:
+        info['codec'] = match.group(1).lower()
+        stream_bitrate = re.search(r"(\d+) kb/s", match.group(2))
+        if stream_bitrate:
+            info['bitrate'] = int(stream_bitrate.group(1)) * 1000
+        if not info['fps']:
+            stream_fps = re.search(r"([\d.]+) fps", match.group(2))
+            if stream_fps:
+                info['fps'] = float(stream_fps.group(1))
+
+    # Bitrate total del contenedor como respaldo
+    if not info['bitrate']:
+        match = re.search(r"Duration: [^\n]*bitrate: (\d+) kb/s", output)
+        if match:
+            info['bitrate'] = int(match.group(1)) * 1000
+
+    return info
+
+
+def probe_video(source_path, handbrake_path=None):
+    """
+    Obtiene los metadatos de un video usando la caché persistente.
+    Sin entrada válida en caché se usa el analizador nativo de MP4/MOV y, solo si
+    el contenedor no se puede leer, el escaneo de HandBrakeCLI.
+    Parámetros:
+        source_path (str): La ruta al video de origen.
+        handbrake_path (str): La ruta al ejecutable de HandBrakeCLI (opcional).
+    Retorna: dict con width, height, duration, codec, bitrate y fps, o None si falla.
+    """
+    probe_start = time.monotonic()
+    info = probe_cache.get(source_path)
+    if info is not None:
+        metrics.observe_probe('cache', time.monotonic() - probe_start)
+        return info
+    try:
+        info = parse_mp4(source_path)
+    except (MP4ParseError, OSError, ValueError, struct.error):
+        info = None
+    if info is None or info['width'] <= 0:
+        if not handbrake_path:
+            return info
+        try:
+            info = scan_video_with_handbrake(source_path, handbrake_path)
+        except Exception:
+            return None
+        metrics.observe_probe('handbrake', time.monotonic() - probe_start)
+    else:
+        metrics.observe_probe('native', time.monotonic() - probe_start)
+    # Solo se guardan análisis útiles para no cachear fallos transitorios
+    if info['width'] > 0:
+        probe_cache.put(source_path, info)
+    return info
+
+
+def get_video_width(source_path, handbrake_path):
+    """
+    Obtiene el ancho de un video a partir de su análisis (caché o escaneo de HandBrakeCLI).
+    Parámetros:
+        source_path (str): La ruta al video de origen.
+        handbrake_path (str): La ruta al ejecutable de HandBrakeCLI.
+    Retorna: El ancho del video como un entero, o 0 si no se puede determinar.
+    """
+    info = probe_video(source_path, handbrake_path)
+    return info['width'] if info else 0  # Si algo falla, 0 para no aplicar redimensión.
+
+# --- Decisión Previa a la Codificación ---
+
+# Umbrales de bits por píxel por frame (bpp) según modo y códec de origen.
+# Un archivo por debajo del umbral ya está codificado de forma eficiente: volver a
+# codificarlo con los ajustes del modo ahorraría poco o incluso crecería.
+#   cpu: x264 CRF 26 a 1080p/30fps produce ~0.05 bpp
+#   gpu: vt_h265 CRF 19 conserva más detalle, pero HEVC ya es ~40% más eficiente que H.264
+SKIP_BPP_THRESHOLDS = {
+    'cpu': {'h264': 0.060, 'hevc': 0.090, 'av1': 0.110, 'vp9': 0.090},
+    'gpu': {'h264': 0.040, 'hevc': 0.070, 'av1': 0.085, 'vp9': 0.070},
+}
+
+# Segundos de codificación por segundo de video 1080p/30fps cuando aún no hay
+# mediciones de la ejecución actual (para estimar el tiempo evitado)
+DEFAULT_ENCODE_COST = {'cpu': 0.6, 'gpu': 0.25}
+
+
+def output_geometry(info, mode):
+    """
+    Calcula la resolución y los fps de salida que producirá el modo seleccionado.
+    Ambos modos limitan el ancho a 1920px y la tasa a 30fps.
+
+    Returns:
+        tuple: (ancho, alto, fps) de salida
+    """
+    width, height = info.get('width', 0), info.get('height', 0)
+    if width > 1920:
+        height = int(height * 1920 / width)
+        width = 1920
+    fps = min(info.get('fps') or 30.0, 30.0)
+    return width, height, fps
+
+
+def encode_work(info, mode):
+    """
+    Unidades de trabajo de codificación: segundos de video equivalentes a 1080p/30fps.
+    Sirven para convertir tiempos medidos en estimaciones para otros archivos.
+    """
+    if not info:
+        return 0.0
+    width, height, fps = output_geometry(info, mode)
+    return (info.get('duration') or 0.0) * (width * height) / (1920 * 1080) * fps / 30.0
+
+
+# Copia de flujos: un video ya eficiente en estos códecs, sin reducción de resolución
+# ni de fps, no se recodifica aunque haya que arreglar el contenedor o el audio
+STREAM_COPY_CODECS = ('h264', 'hevc')
+# Audio AAC por encima de este bitrate se recodifica al de salida (AUDIO_BITRATE_KBPS)
+STREAM_COPY_MAX_AUDIO_KBPS = 160
+# Velocidad supuesta de una copia de flujos (limitada por el disco) para las predicciones
+STREAM_COPY_BYTES_PER_SECOND = 150 * 1024 ** 2
+
+
+def decide_stream_copy(info, mode):
+    """
+    Decide si un video cuyo flujo de video ya es eficiente necesita una copia de flujos.
+
+    Returns:
+        tuple: (acción, motivo) con acción 'remux' (copiar todos los flujos a un MP4 con
+               faststart) o 'copy' (copiar el video y recodificar el audio a AAC), o None
+               si no hay nada que arreglar o el video no se puede copiar tal cual
+    """
+    if info.get('codec') not in STREAM_COPY_CODECS or 'faststart' not in info:
+        return None
+    width, height, fps = output_geometry(info, mode)
+    if (width, height) != (info['width'], info['height']) or (info.get('fps') or 0) > fps + 0.5:
+        return None
+    audio = info.get('audio_codec')
+    if audio and audio != 'aac':
+        return 'copy', f"audio {audio} → AAC"
+    if audio and info.get('audio_bitrate', 0) > STREAM_COPY_MAX_AUDIO_KBPS * 1000:
+        return 'copy', f"audio de {info['audio_bitrate'] // 1000} kbps → {AUDIO_BITRATE_KBPS} kbps"
+    if not info['faststart']:
+        return 'remux', "sin faststart"
+    if info.get('fourcc') == 'hev1':
+        return 'remux', "etiqueta hev1 → hvc1"
+    return None
+
+
+def decide_encoding(info, mode, thresholds=None, stream_copy=False):
+    """
+    Decide si vale la pena recodificar un video según sus bits por píxel por frame.
+
+    Args:
+        info (dict): Metadatos de probe_video
+        mode (str): 'cpu' o 'gpu'
+        thresholds (dict): Umbrales bpp por modo y códec (por defecto SKIP_BPP_THRESHOLDS)
+        stream_copy (bool): Permite las copias de flujos (requiere ffmpeg): un video ya
+                            eficiente con el contenedor o el audio mejorables se copia
+                            en lugar de omitirse (ver decide_stream_copy)
+
+    Returns:
+        tuple: (acción, motivo, bpp) con acción 'encode', 'skip', 'remux' o 'copy'
+    """
+    if not info or not info.get('bitrate') or not info.get('width'):
+        return 'encode', "sin metadatos suficientes", None
+
+    thresholds = SKIP_BPP_THRESHOLDS if thresholds is None else thresholds
+    width, height, fps = output_geometry(info, mode)
+    if width * height * fps <= 0:
+        return 'encode', "sin metadatos suficientes", None
+
+    # bpp respecto a la salida: al reducir 4K a 1080p el mismo bitrate rinde más por píxel
+    bpp = info['bitrate'] / (width * height * fps)
+    limit = thresholds.get(mode, {}).get(info.get('codec', ''))
+    if limit is not None and bpp < limit:
+        reason = f"{info['codec']} ya eficiente ({bpp:.3f} bpp < {limit:.3f})"
+        fix = decide_stream_copy(info, mode) if stream_copy else None
+        if fix:
+            return fix[0], f"{reason}; {fix[1]}", bpp
+        return 'skip', reason, bpp
+    return 'encode', f"{bpp:.3f} bpp", bpp
+
+
+# --- Diario de Trabajos (Reanudación tras Caídas) ---
+
+class JobJournal:
+    """
+    Diario append-only (JSON lines) de las transiciones de estado de cada video:
+    queued → encoding → encoded → verified → trashed (o skipped / failed).
+
+    Las escrituras se vuelcan al sistema operativo en cada registro, pero fsync se
+    agrupa cada fsync_every registros o fsync_interval segundos; las transiciones
+    críticas (antes de enviar el original a la papelera) fuerzan un fsync.
+    Al reabrirse, el diario se reproduce para reanudar un lote interrumpido.
+    """
+
+    COMPLETED_STATES = ('verified', 'trashed')
+
+    def __init__(self, path, fsync_every=32, fsync_interval=2.0):
+        self.path = path
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._file = None
+        self._pending = 0
+        self._last_sync = time.monotonic()
+
+    @staticmethod
+    def default_path(directory):
+        """Ruta del diario para un directorio de videos (dentro de CACHE_DIR)."""
+        key = hashlib.sha1(os.path.abspath(directory).encode('utf-8')).hexdigest()[:16]
+        return os.path.join(CACHE_DIR, 'journals', f"{key}.jsonl")
+
+    def open(self):
+        """Reproduce el diario existente y lo abre para agregar registros."""
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._jobs = {}
+        needs_newline = False
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    needs_newline = not line.endswith('\n')
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # Última línea truncada por una caída
+                    source = record.pop('src', None)
+                    if source:
+                        self._jobs.setdefault(source, {}).update(record)
+        except FileNotFoundError:
+            pass
+        self._file = open(self.path, 'a', encoding='utf-8')
+        if needs_newline:
+            self._file.write('\n')
+        return self
+
+    def __len__(self):
+        return len(self._jobs)
+
+    def __bool__(self):
+        # Un diario recién creado no tiene trabajos pero sigue activo (los llamadores usan `if journal:`)
+        return True
+
+    def get(self, source):
+        """Retorna el último estado conocido (con sus datos) de un video, o None."""
+        with self._lock:
+            job = self._jobs.get(source)
+            return dict(job) if job else None
+
+    def completed(self):
+        """Retorna los trabajos terminados (verificados o con el original en la papelera)."""
+        with self._lock:
+            return [dict(job, source=source) for source, job in self._jobs.items()
+                    if job.get('state') in self.COMPLETED_STATES]
+
+    def record(self, source, state, sync=False, **fields):
+        """
+        Agrega una transición de estado al diario.
+
+        Args:
+            source (str): Ruta del video de origen
+            state (str): Nuevo estado
+            sync (bool): Forzar fsync inmediato
+            **fields: Datos adicionales del trabajo (tamaños, tiempos, destino...)
+        """
+        record = {'state': state, 't': round(time.time(), 3)}
+        record.update(fields)
+        line = json.dumps(dict(record, src=source), separators=(',', ':')) + '\n'
+        with self._lock:
+            self._jobs.setdefault(source, {}).update(record)
+            if self._file is None:
+                return
+            self._file.write(line)
+            self._file.flush()
+            self._pending += 1
+            now = time.monotonic()
+            if sync or self._pending >= self.fsync_every or now - self._last_sync >= self.fsync_interval:
+                os.fsync(self._file.fileno())
+                self._pending = 0
+                self._last_sync = now
+
+    def close(self, finished=False):
+        """
+        Cierra el diario. Si el lote terminó, lo archiva como .done para que una
+        ejecución futura sobre el mismo directorio empiece desde cero.
+        """
+        with self._lock:
+            if self._file is None:
+                return
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+            self._file = None
+            if finished:
+                os.replace(self.path, self.path + '.done')
+
+
+# Diferencia de duración tolerada entre la salida y el origen: relativa, con un mínimo en
+# segundos (el redondeo de los últimos fotogramas y el audio AAC cambian unos ms)
+VERIFY_DURATION_TOLERANCE = 0.02
+VERIFY_DURATION_MIN = 2.0
+
+# Crecimiento tolerado de un remux: solo rehace el contenedor (faststart, etiqueta hvc1)
+# y su salida pesa casi lo mismo que el original, a veces unos bytes más
+REMUX_SIZE_TOLERANCE = 0.01
+
+
+def verify_output(dest_path, duration=None, max_size=None, growth=0.0):
+    """
+    Verificación rápida de una salida antes de descartar su original (solo lee cabeceras):
+    el contenedor MP4 se puede analizar, la duración coincide con la del origen dentro de
+    la tolerancia y el tamaño es menor que max_size.
+
+    Args:
+        dest_path (str): Salida a verificar
+        duration (float): Duración del origen en segundos (None = no se compara)
+        max_size (int): Tamaño del original en bytes (None = no se compara)
+        growth (float): Crecimiento relativo aceptado sobre max_size (0 = debe ser menor;
+                        REMUX_SIZE_TOLERANCE para los remux)
+
+    Returns:
+        str: Motivo del rechazo, o None si la salida es válida
+    """
+    try:
+        size = os.path.getsize(dest_path)
+        output = parse_mp4(dest_path)
+    except (MP4ParseError, OSError, ValueError, struct.error) as e:
+        return f"la salida no se puede analizar ({e})"
+    if output['duration'] <= 0:
+        return "la salida no tiene duración"
+    if duration and abs(output['duration'] - duration) > max(VERIFY_DURATION_MIN,
+                                                             duration * VERIFY_DURATION_TOLERANCE):
+        return f"la salida dura {output['duration']:.1f}s y el origen {duration:.1f}s"
+    if max_size is not None and growth and size > max_size * (1 + growth):
+        return (f"la salida ({size / 1024 ** 2:.1f} MB) supera al original "
+                f"({max_size / 1024 ** 2:.1f} MB) en más del {growth:.0%}")
+    if max_size is not None and not growth and size >= max_size:
+        return (f"la salida ({size / 1024 ** 2:.1f} MB) no es menor que el original "
+                f"({max_size / 1024 ** 2:.1f} MB)")
+    return None
+
+
+def reject_output(source_path, dest_path, reason, console, journal=None):
+    """
+    Descarta una salida que no pasó verify_output: el original se conserva y el rechazo
+    se registra en el diario y en las estadísticas.
+    """
+    console.log(f"\n🛑 Salida rechazada: {os.path.basename(source_path)} — {reason}. "
+                f"Se conserva el original.")
+    try:
+        os.remove(dest_path)
+    except OSError:
+        pass
+    if journal:
+        journal.record(source_path, 'failed', error=f"verificación: {reason}")
+    stats.record_rejection(source_path, reason)
+    emit_progress('failed', source_path, error=reason, rejected=True)
+
+
+# Originales verificados que se envían juntos a la papelera y espera máxima (s) de un lote
+DISPOSAL_BATCH = 16
+DISPOSAL_LINGER = 5.0
+
+
+class SourceDisposer:
+    """
+    Etapa en segundo plano que envía a la papelera los originales ya verificados.
+
+    compress_video solo encola el original (tras verificar la salida y registrarla en el
+    diario como 'verified'); un hilo los agrupa y los mueve en lotes de DISPOSAL_BATCH,
+    o cuando el primero lleva DISPOSAL_LINGER segundos esperando, con una sola llamada
+    a send2trash (y un solo osascript en el respaldo de sudo). Si el lote falla, se
+    reintenta archivo por archivo para aislar los que no se pudieron mover. Si el
+    proceso termina antes, el diario conserva el estado y la reanudación los descarta.
+    """
+
+    def __init__(self, batch_size=DISPOSAL_BATCH, linger=DISPOSAL_LINGER):
+        self.batch_size = batch_size
+        self.linger = linger
+        self.trashed = 0
+        self.batches = 0
+        self.errors = []          # (ruta, error) de los originales que no se pudieron mover
+        self._pending = deque()   # (ruta, diario, instante de llegada)
+        self._queued = {}         # ruta -> veces encolada y aún no procesada
+        self._callbacks = {}      # ruta -> funciones a llamar cuando se procese (when_disposed)
+        self._busy = False
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def submit(self, source_path, journal=None):
+        """Encola un original cuya salida ya se verificó."""
+        with self._cond:
+            self._pending.append((source_path, journal, time.monotonic()))
+            self._queued[source_path] = self._queued.get(source_path, 0) + 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+            self._cond.notify_all()
+
+    def _take_batch(self):
+        """Espera a que haya un lote listo y lo retira de la cola; requiere el lock."""
+        while True:
+            if self._pending:
+                wait = self._pending[0][2] + self.linger - time.monotonic()
+                if len(self._pending) >= self.batch_size or wait <= 0:
+                    break
+                self._cond.wait(wait)
+            else:
+                self._cond.wait()
+        batch = [self._pending.popleft() for _ in range(min(self.batch_size, len(self._pending)))]
+        self._busy = True
+        return batch
+
+    def _run(self):
+        while True:
+            with self._cond:
+                batch = self._take_batch()
+            self._dispose(batch)
+            with self._cond:
+                self._busy = False
+                self._cond.notify_all()
+
+    def _dispose(self, batch):
+        paths = [path for path, _, _ in batch if os.path.exists(path)]
+        failed = {}
+        if paths:
+            try:
+                send2trash(paths)
+            except Exception:
+                # Reintento individual para saber qué archivos fallaron
+                for path in paths:
+                    try:
+                        send2trash(path)
+                    except Exception as e:
+                        failed[path] = str(e)
+        for path, journal, _ in batch:
+            if path in failed:
+                print(f"⚠️  Advertencia: No se pudo mover a papelera: {failed[path]}")
+                print(f"   El archivo original permanece en: {path}")
+                continue
+            if journal:
+                journal.record(path, 'trashed')
+        callbacks = []
+        with self._cond:
+            self.trashed += len(batch) - len(failed)
+            self.batches += 1
+            self.errors.extend(failed.items())
+            for path, _, _ in batch:
+                self._queued[path] -= 1
+                if not self._queued[path]:
+                    del self._queued[path]
+                    callbacks.extend(self._callbacks.pop(path, []))
+        for callback in callbacks:
+            callback()
+
+    def when_disposed(self, source_path, callback):
+        """
+        Llama a callback cuando el original haya salido de la cola (movido a la papelera
+        o no); si no está encolado, de inmediato.
+        """
+        with self._cond:
+            if source_path in self._queued:
+                self._callbacks.setdefault(source_path, []).append(callback)
+                return
+        callback()
+
+    def flush(self):
+        """Envía ya los originales pendientes y espera a que terminen (fin de un lote)."""
+        with self._cond:
+            if self._thread is None:
+                return
+            self.linger, linger = 0.0, self.linger
+            self._cond.notify_all()
+            while self._pending or self._busy:
+                self._cond.wait()
+            self.linger = linger
+
+
+# --- Descarte Global de Originales ---
+source_disposer = SourceDisposer()
+
+
+def resume_job(job, source_path, dest_path, journal, console):
+    """
+    Decide qué hacer con un video que ya aparece en el diario.
+
+    - verified: la salida es válida, solo falta enviar el original a la papelera
+    - trashed: terminado; si el original sigue ahí (p. ej. restaurado) se conserva la salida
+    - encoded: la salida terminó pero no se verificó; se comprueba antes de seguir
+    - queued/encoding/failed/skipped: la salida parcial se elimina y se recodifica
+
+    Returns:
+        bool: True si el video debe (re)codificarse
+    """
+    state = job.get('state')
+    if job.get('original_size') not in (None, os.path.getsize(source_path)):
+        state = None  # El origen cambió desde que se registró: se trata como nuevo
+
+    if state == 'encoded':
+        info = probe_video(source_path)
+        growth = REMUX_SIZE_TOLERANCE if job.get('stream_copy') == 'remux' else 0.0
+        problem = verify_output(dest_path, (info or {}).get('duration'), job.get('original_size'), growth)
+        if problem is None:
+            journal.record(source_path, 'verified', sync=True)
+            stats.record_success(job)
+            state = 'verified'
+        else:
+            console.log(f"♻️  Salida de una ejecución anterior no válida ({problem}), se recodificará: "
+                        f"{os.path.basename(dest_path)}")
+
+    if state == 'verified':
+        source_disposer.submit(source_path, journal)
+        return False
+    if state == 'trashed':
+        return False
+
+    # Eliminar salidas parciales antes de recodificar
+    if state and os.path.isfile(dest_path):
+        try:
+            os.remove(dest_path)
+        except OSError:
+            pass
+    return True
+
+
+def get_compression_mode():
+    """
+    Presenta al usuario las opciones de compresión disponibles.
+    
+    Returns:
+        str: 'cpu' para compresión por software o 'gpu' para aceleración hardware optimizada
+    """
+    print("\nSeleccione el modo de compresión:")
+    mode = get_user_input(
+        " [1] CPU (Calidad con x264)\n"
+        " [2] GPU (Alta Calidad + Máxima Velocidad - Optimizado Apple Silicon)\n"
+        " : ",
+        ['1', '2']
+    )
+    return 'cpu' if mode == '1' else 'gpu'
+
+# --- División de Videos Largos por Fotogramas Clave ---
+
+# Solo se dividen videos de al menos esta duración: por debajo, el costo de arrancar
+# varios procesos, codificar el audio aparte y concatenar no compensa
+SPLIT_MIN_DURATION = 20 * 60
+
+# Duración mínima de cada segmento (limita el número de segmentos en videos medianos)
+SPLIT_MIN_SEGMENT = 5 * 60
+
+
+def find_ffmpeg():
+    """
+    Busca el ejecutable de ffmpeg en el PATH y en las rutas habituales de Homebrew.
+    Retorna: La ruta al ejecutable o None si no se encuentra.
+    """
+    path = shutil.which('ffmpeg')
+    if path:
+        return path
+    for candidate in ('/opt/homebrew/bin/ffmpeg', '/usr/local/bin/ffmpeg'):
+        if os.path.isfile(candidate):
+            return candidate
+    return None
+
+
+def plan_split(source_path, info, segments, min_duration=SPLIT_MIN_DURATION):
+    """
+    Decide si un video se divide y calcula sus segmentos.
+
+    Cada corte se coloca en el fotograma clave más cercano al reparto uniforme, de
+    modo que cada segmento empieza en un GOP cerrado y se puede concatenar sin
+    recodificar.
+
+    Args:
+        source_path (str): Ruta del video
+        info (dict): Metadatos de probe_video
+        segments (int): Número deseado de segmentos
+        min_duration (float): Duración mínima del video para dividirlo
+
+    Returns:
+        list: Lista de (inicio, duración) en segundos; la última duración es None
+              (hasta el final). Lista vacía si no conviene dividir.
+    """
+    duration = (info or {}).get('duration') or 0.0
+    if segments < 2 or duration < min_duration or not find_ffmpeg():
+        return []
+    segments = min(segments, int(duration // SPLIT_MIN_SEGMENT))
+    if segments < 2:
+        return []
+    try:
+        keyframes = mp4_keyframe_times(source_path)
+    except (MP4ParseError, OSError, ValueError, struct.error):
+        return []
+
+    cuts = [0.0]
+    for i in range(1, segments):
+        target = duration * i / segments
+        index = bisect.bisect_left(keyframes, target)
+        nearby = keyframes[max(0, index - 1):index + 1]
+        if not nearby:
+            continue
+        cut = min(nearby, key=lambda t: abs(t - target))
+        if cut - cuts[-1] >= SPLIT_MIN_SEGMENT / 2 and duration - cut >= SPLIT_MIN_SEGMENT / 2:
+            cuts.append(cut)
+    if len(cuts) < 2:
+        return []
+    return [(start, end - start) for start, end in zip(cuts, cuts[1:])] + [(cuts[-1], None)]
+
+
+def probe_audio_stream(ffmpeg_path, source_path):
+    """
+    Indica si un video tiene pista de audio según la lista de flujos que imprime ffmpeg
+    (para los análisis del escaneo de HandBrakeCLI, que no informan el audio).
+
+    Returns:
+        bool: True si ffmpeg lista algún flujo de audio
+    """
+    try:
+        output = subprocess.run([ffmpeg_path, '-hide_banner', '-i', source_path],
+                                stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                                timeout=60).stderr.decode('utf-8', 'replace')
+    except (OSError, subprocess.TimeoutExpired):
+        return False
+    return re.search(r'Stream #\d+:\d+.*: Audio:', output) is not None
+
+
+def encode_segmented(source_path, dest_path, mode, handbrake_path, info, segments,
+                     threads=0, on_progress=None, tuning=None, timeout=None, cancel=None):
+    """
+    Codifica un video largo en varios segmentos simultáneos y los une sin pérdidas.
+
+    - Cada segmento se codifica solo con video usando los ajustes del modo
+    - El audio se codifica una sola vez para todo el video, así no hay saltos ni
+      silencios de AAC en las uniones
+    - ffmpeg concatena los segmentos (-c copy) con marcas de tiempo continuas y
+      multiplexa el audio, dejando el moov al inicio (+faststart)
+    - Todos los procesos corren bajo el vigilante (timeout y cancel); el primer segmento
+      que falla o se detiene termina a los demás y a la extracción del audio
+
+    Args:
+        source_path (str): Ruta del video de origen
+        dest_path (str): Ruta del MP4 final
+        mode (str): 'cpu' o 'gpu'
+        handbrake_path (str): Ruta del ejecutable HandBrakeCLI (si no hay otro backend activo)
+        info (dict): Metadatos de probe_video
+        segments (list): Segmentos de plan_split
+        threads (int): Hilos del encoder por segmento (0 = repartir los núcleos)
+        on_progress (callable): Recibe el ProgressEvent global (fps sumados de los
+                                segmentos, ETA del segmento más lento)
+        tuning (dict): Ajustes de la búsqueda automática (opcional)
+        timeout (float): Segundos máximos de cada proceso (None = sin límite)
+        cancel (threading.Event): Cancela todos los procesos al activarse (opcional)
+
+    Returns:
+        int: 0 si todo salió bien, distinto de 0 si falló algún paso
+
+    Raises:
+        EncoderStalled: Si el vigilante terminó algún proceso
+        EncoderCancelled: Si se activó cancel
+    """
+    ffmpeg_path = find_ffmpeg()
+    encoder = active_encoder(handbrake_path)
+    work_dir = tempfile.mkdtemp(prefix=WORK_DIR_PREFIX + 'segments_', dir=os.path.dirname(dest_path))
+    if encoder.software(mode) and not threads:
+        threads = max(1, (os.cpu_count() or 1) // len(segments))
+
+    duration = info.get('duration') or 1.0
+    weights = [(length if length is not None else duration - start) / duration for start, length in segments]
+    progress = [ProgressEvent(0.0) for _ in segments]
+    progress_lock = threading.Lock()
+    returncodes = [None] * len(segments)
+    stalled = []
+    abort = CancelGroup(cancel)
+    segment_paths = [os.path.join(work_dir, f"segment_{i:03d}.mp4") for i in range(len(segments))]
+    audio_path = os.path.join(work_dir, 'audio.m4a')
+    if 'audio_codec' in info:
+        has_audio = bool(info['audio_codec'])
+    else:
+        has_audio = probe_audio_stream(ffmpeg_path, source_path)
+
+    def record_stall(e):
+        # Las cancelaciones provocadas por el fallo de otro segmento no son la causa
+        if not isinstance(e, EncoderCancelled) or (cancel is not None and cancel.is_set()):
+            stalled.append(e)
+
+    def encode_segment(i):
+        start, length = segments[i]
+        command = encoder.build_command(source_path, segment_paths[i], mode, threads=threads,
+                                        source_width=info.get('width', 0), audio=False,
+                                        start=start if start > 0 else None, length=length,
+                                        tuning=tuning)
+
+        def report(event):
+            with progress_lock:
+                progress[i] = event
+                running = [e for e in progress if e.percent < 100.0]
+                total = ProgressEvent(
+                    sum(e.percent * w for e, w in zip(progress, weights)),
+                    bytes_written=sum(e.bytes_written for e in progress))
+                # Cada campo se agrega solo si todos los segmentos activos lo reportan
+                # (ffmpeg no da ETA con speed=0x ni avg_fps en su primera línea)
+                if all(e.fps is not None for e in running):
+                    total.fps = sum(e.fps for e in running)
+                if all(e.avg_fps is not None for e in running):
+                    total.avg_fps = sum(e.avg_fps for e in running)
+                if all(e.eta is not None for e in running):
+                    total.eta = max((e.eta for e in running), default=0)
+            if on_progress:
+                on_progress(total)
+
+        try:
+            returncodes[i] = run_encoder(command, on_progress=report, output_path=segment_paths[i],
+                                         progress=encoder.progress(length if length is not None
+                                                                   else duration - start),
+                                         timeout=timeout, cancel=abort)
+        except EncoderStalled as e:
+            record_stall(e)
+            returncodes[i] = 1
+        if returncodes[i] != 0:
+            abort.set()
+
+    try:
+        workers = [threading.Thread(target=encode_segment, args=(i,)) for i in range(len(segments))]
+        for thread in workers:
+            thread.start()
+
+        # Audio completo en paralelo con los segmentos de video
+        audio_ok = True
+        if has_audio:
+            try:
+                audio_ok = run_encoder(
+                    [ffmpeg_path, '-hide_banner', '-nostdin', '-loglevel', 'error', '-stats', '-y',
+                     '-i', source_path, '-vn', '-c:a', 'aac', '-b:a', '96k', audio_path],
+                    output_path=audio_path, progress=FfmpegProgress(duration), timeout=timeout,
+                    cancel=abort
+                ) == 0 and os.path.isfile(audio_path)
+            except EncoderStalled as e:
+                record_stall(e)
+                audio_ok = False
+            if not audio_ok:
+                abort.set()
+
+        for thread in workers:
+            thread.join()
+        if stalled:
+            raise stalled[0]
+        if any(code != 0 for code in returncodes) or not audio_ok:
+            return 1
+
+        # Lista para el demuxer concat de ffmpeg
+        list_path = os.path.join(work_dir, 'segments.txt')
+        with open(list_path, 'w', encoding='utf-8') as f:
+            for path in segment_paths:
+                escaped = path.replace("'", "'\\''")
+                f.write(f"file '{escaped}'\n")
+
+        command = [ffmpeg_path, '-hide_banner', '-nostdin', '-loglevel', 'error', '-stats', '-y',
+                   '-f', 'concat', '-safe', '0', '-i', list_path]
+        if has_audio:
+            command += ['-i', audio_path, '-map', '0:v', '-map', '1:a']
+        command += ['-c', 'copy', '-movflags', '+faststart', dest_path]
+        return run_encoder(command, output_path=dest_path, progress=FfmpegProgress(duration),
+                           timeout=timeout, cancel=cancel)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def build_handbrake_command(source_path, dest_path, mode, handbrake_path, threads=0,
+                            source_width=0, audio=True, start=None, length=None, tuning=None):
+    """
+    Construye la línea de comandos de HandBrakeCLI para el modo seleccionado.
+    - CPU: x264 con CRF 26, siempre limitado a 1920px de ancho
+    - GPU: VideoToolbox H.265 con CRF 19, solo reduce si el origen supera 1920px
+
+    Args:
+        source_path (str): Ruta del archivo de video origen
+        dest_path (str): Ruta de destino del archivo comprimido
+        mode (str): 'cpu' o 'gpu'
+        handbrake_path (str): Ruta del ejecutable HandBrakeCLI
+        threads (int): Hilos del encoder x264 (0 = automático)
+        source_width (int): Ancho del origen (0 = desconocido)
+        audio (bool): Incluir audio AAC; False genera solo video
+        start (float): Segundo de inicio para codificar un segmento (opcional)
+        length (float): Duración del segmento en segundos (opcional)
+        tuning (dict): Preset y calidad elegidos por la búsqueda automática (opcional);
+                       reemplazan los valores fijos del modo. Con 'bitrate' (kbps) se
+                       codifica a bitrate medio en lugar de calidad constante y con
+                       'multi_pass' se hace en dos pasadas (solo x264)
+
+    Returns:
+        list: Comando listo para subprocess
+    """
+    # Configuración base común para ambos modos
+    command = [
+        handbrake_path,
+        '-i', source_path,
+        '-o', dest_path,
+        '-f', 'mp4',
+        '--optimize',
+        '-r', '30',           # Frame rate 30fps estándar
+    ]
+    if audio:
+        command += [
+            '-E', 'ca_aac',   # Audio AAC de alta calidad
+            '-B', '96',       # Bitrate audio 96kbps (eficiente)
+        ]
+    else:
+        command += ['-a', 'none']
+
+    # Configuraciones específicas por modo de compresión
+    if mode == 'cpu':
+        # CPU: Configuración probada del usuario con x264 eficiente
+        command += [
+            '-e', 'x264',                   # Encoder x264: rápido y confiable
+            '-q', '26',                     # CRF 26: configuración probada del usuario
+        ]
+        # Limitar hilos de x264 cuando hay varios trabajos en paralelo
+        if threads and threads > 0:
+            command += ['--encopts', f'threads={int(threads)}']
+        if tuning and tuning.get('quality') is not None:
+            command[command.index('-q') + 1] = str(tuning['quality'])
+    else:  # mode == 'gpu'
+        # GPU: CRF optimizado para máxima calidad visual con compresión eficiente
+        # ⚡ NUEVO: Optimizaciones específicas para Apple Silicon agregadas ⚡
+        command += [
+            '-e', 'vt_h265',                # VideoToolbox H.265 (hardware)
+            '-q', '19',                     # CRF 19 = calidad muy alta con compresión eficiente
+            '--encopts',                    # Opciones avanzadas VideoToolbox
+            'look-ahead-frame-count=40:'    # Look-ahead 40 frames para mejores decisiones
+            'bframes=1:'                    # B-frames habilitados para eficiencia
+            'ref=5:'                        # 5 frames de referencia para mejor predicción
+            'qpmin=10:'                     # QP mínimo para preservar detalles
+            'qpmax=30:'                     # QP máximo para controlar calidad
+            'max-frame-delay=1',            # ⚡ NUEVO: Optimización de latencia para Apple Silicon
+            # ⚡ NUEVO: Hardware decoder para pipeline GPU completo en Apple Silicon ⚡
+            '--enable-hw-decoding', 'videotoolbox'  # Mejora velocidad sin afectar calidad
+        ]
+        if tuning and tuning.get('quality') is not None:
+            command[command.index('-q') + 1] = str(tuning['quality'])
+    if tuning and tuning.get('preset'):
+        command += ['--encoder-preset', tuning['preset']]
+    if tuning and tuning.get('bitrate'):
+        # Bitrate medio para cumplir un tamaño: sustituye la calidad constante
+        index = command.index('-q')
+        command[index:index + 2] = ['-b', str(int(tuning['bitrate']))]
+        if tuning.get('multi_pass') and mode == 'cpu':
+            command += ['--multi-pass', '--turbo']
+
+    # Redimensionar videos 4K a 1080p para mejor compresión
+    # En CPU siempre (configuración original); en GPU solo si es mayor a 1920px
+    if mode == 'cpu' or source_width > 1920:
+        command += ['-w', '1920']
+
+    # Rango de tiempo para codificar solo un segmento
+    if start is not None:
+        command += ['--start-at', f'seconds:{start:.3f}']
+    if length is not None:
+        command += ['--stop-at', f'seconds:{length:.3f}']
+    return command
+
+
+# Regex para capturar progreso del proceso HandBrake. Ejemplo de línea:
+# "Encoding: task 1 of 1, 45.67 % (123.45 fps, avg 120.00 fps, ETA 00h01m23s)"
+HANDBRAKE_PROGRESS_REGEX = re.compile(
+    r"Encoding: task \d+ of \d+, (\d+\.\d+)\s*%"
+    r"(?: \((\d+\.\d+) fps, avg (\d+\.\d+) fps, ETA (\d+)h(\d+)m(\d+)s\))?"
+)
+
+# Intervalo mínimo (s) entre eventos de progreso de un mismo proceso
+PROGRESS_MIN_INTERVAL = 0.5
+
+
+class ProgressEvent:
+    """
+    Progreso de una codificación en un instante.
+
+    Atributos:
+        percent (float): Porcentaje completado (0-100)
+        fps (float): Fotogramas por segundo actuales (None si HandBrake aún no lo reporta)
+        avg_fps (float): Fotogramas por segundo promedio (None si no se conoce)
+        eta (int): Segundos restantes estimados por HandBrake (None si no se conoce)
+        bytes_written (int): Bytes escritos hasta ahora en el archivo de salida
+    """
+
+    __slots__ = ('percent', 'fps', 'avg_fps', 'eta', 'bytes_written')
+
+    def __init__(self, percent, fps=None, avg_fps=None, eta=None, bytes_written=0):
+        self.percent = percent
+        self.fps = fps
+        self.avg_fps = avg_fps
+        self.eta = eta
+        self.bytes_written = bytes_written
+
+    def as_dict(self):
+        """Retorna el evento como diccionario serializable."""
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+def parse_handbrake_progress(line, output_path=None):
+    """
+    Convierte una línea de progreso de HandBrakeCLI en un ProgressEvent.
+
+    Args:
+        line (str): Línea de salida de HandBrakeCLI
+        output_path (str): Archivo de salida cuyo tamaño se reporta (opcional)
+
+    Returns:
+        ProgressEvent: Evento de progreso o None si la línea no es de progreso
+    """
+    match = HANDBRAKE_PROGRESS_REGEX.search(line)
+    if not match:
+        return None
+    percent, fps, avg_fps, hours, minutes, seconds = match.groups()
+    event = ProgressEvent(float(percent))
+    if fps is not None:
+        event.fps = float(fps)
+        event.avg_fps = float(avg_fps)
+        event.eta = int(hours) * 3600 + int(minutes) * 60 + int(seconds)
+    if output_path:
+        try:
+            event.bytes_written = os.path.getsize(output_path)
+        except OSError:
+            pass
+    return event
+
+
+class HandBrakeProgress:
+    """Analizador de las líneas de progreso de HandBrakeCLI (ver parse_handbrake_progress)."""
+
+    marker = 'Encoding:'
+
+    def parse(self, line, output_path=None):
+        return parse_handbrake_progress(line, output_path)
+
+
+# Línea de estadísticas de ffmpeg (-stats), p. ej.:
+# "frame= 1234 fps= 56 q=28.0 size=  1024kB time=00:00:41.13 bitrate= 204.0kbits/s speed=1.87x"
+FFMPEG_STATS_REGEX = re.compile(
+    r"frame=\s*(\d+)\s+fps=\s*([\d.]+).*?time=\s*(\d+):(\d+):(\d+(?:\.\d+)?).*?speed=\s*([\d.]+)x"
+)
+
+
+class FfmpegProgress:
+    """
+    Analizador de la línea de estadísticas de ffmpeg.
+
+    ffmpeg no reporta porcentaje ni ETA: se calculan con la duración a codificar y la
+    velocidad relativa (speed); los fps medios se miden desde el inicio del proceso.
+    """
+
+    marker = 'time='
+
+    def __init__(self, duration=None):
+        self.duration = duration or 0.0
+        self._start = time.monotonic()
+
+    def parse(self, line, output_path=None):
+        match = FFMPEG_STATS_REGEX.search(line)
+        if not match:
+            return None  # Líneas iniciales con time=N/A
+        frames, fps, hours, minutes, seconds, speed = match.groups()
+        position = int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+        percent = min(100.0, position / self.duration * 100) if self.duration else 0.0
+        elapsed = time.monotonic() - self._start
+        event = ProgressEvent(round(percent, 2), fps=float(fps),
+                              avg_fps=round(int(frames) / elapsed, 2) if elapsed > 0 else None)
+        if float(speed) > 0 and self.duration:
+            event.eta = int(max(0.0, self.duration - position) / float(speed))
+        if output_path:
+            try:
+                event.bytes_written = os.path.getsize(output_path)
+            except OSError:
+                pass
+        return event
+
+
+# --- Vigilancia de Trabajos Estancados ---
+
+# Ventana mínima sin avances tras la cual un encoder se considera estancado
+STALL_MIN_SECONDS = 120
+# Ventana antes del primer avance (escaneo del origen, inicio de los decodificadores)
+STALL_STARTUP_SECONDS = 300
+# La ventana crece hasta este múltiplo del intervalo típico entre avances
+STALL_GAP_FACTOR = 20
+# Tiempo máximo de un trabajo: múltiplo del tiempo predicho, con un mínimo en segundos
+JOB_TIMEOUT_FACTOR = 10
+JOB_TIMEOUT_MIN = 30 * 60
+# Intervalo de comprobación del vigilante
+WATCHDOG_INTERVAL = 5.0
+
+# --- Límites Globales del Vigilante (se configuran en el flujo principal) ---
+stall_seconds = STALL_MIN_SECONDS        # 0 = sin vigilancia de estancamiento
+job_timeout_factor = JOB_TIMEOUT_FACTOR  # 0 = sin tiempo máximo
+
+
+class EncoderStalled(RuntimeError):
+    """El vigilante terminó el encoder por falta de avances o por exceder su tiempo máximo."""
+
+
+class EncoderCancelled(EncoderStalled):
+    """
+    El vigilante terminó el encoder porque el trabajo se canceló (p. ej. un trabajador de la
+    granja perdió su arriendo). La salida a medias se descarta y el original no se toca.
+    """
+
+
+class CancelGroup:
+    """
+    Cancelación compartida por los procesos de un mismo trabajo (p. ej. los segmentos de
+    encode_segmented): se activa con set(), para que el primero que falla termine a los
+    demás, o cuando se activa la cancelación del trabajo completo (parent). Se pasa a
+    run_encoder en lugar de un threading.Event.
+    """
+
+    def __init__(self, parent=None):
+        self.parent = parent
+        self._event = threading.Event()
+
+    def set(self):
+        self._event.set()
+
+    def is_set(self):
+        return self._event.is_set() or (self.parent is not None and self.parent.is_set())
+
+
+class EncodeWatchdog:
+    """
+    Vigila un proceso del encoder y lo termina si deja de avanzar o excede su tiempo máximo.
+
+    Cuentan como avance un porcentaje mayor en la salida de progreso y cualquier cambio
+    de tamaño o mtime del archivo de salida (así el faststart final, que reescribe el
+    archivo sin imprimir progreso, no parece un estancamiento). La ventana se adapta
+    al ritmo del trabajo: STALL_GAP_FACTOR veces la media móvil del intervalo entre
+    avances, nunca menos de stall_seconds; antes del primer avance es STALL_STARTUP_SECONDS.
+    Las comprobaciones esperan en un Event, así que detener el vigilante es inmediato.
+    Si se indica cancel (threading.Event), el proceso también se termina cuando se activa.
+    """
+
+    def __init__(self, process, output_path=None, timeout=None, window=None,
+                 interval=WATCHDOG_INTERVAL, cancel=None):
+        self.process = process
+        self.output_path = output_path
+        self.timeout = timeout
+        self.window = stall_seconds if window is None else window
+        self.interval = interval
+        self.cancel = cancel
+        self.cancelled = False
+        self.reason = None
+        self._start = self._last_advance = time.monotonic()
+        self._percent = -1.0
+        self._gap = None
+        self._output_state = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def advance(self, event):
+        """Registra un evento de progreso; solo cuenta si el porcentaje aumentó."""
+        if event.percent > self._percent:
+            self._percent = event.percent
+            self._touch()
+
+    def _touch(self):
+        now = time.monotonic()
+        gap = now - self._last_advance
+        self._gap = gap if self._gap is None else 0.8 * self._gap + 0.2 * gap
+        self._last_advance = now
+
+    def stall_window(self):
+        """Segundos sin avances tolerados en este momento."""
+        if self._gap is None:
+            return max(STALL_STARTUP_SECONDS, self.window)
+        return max(self.window, STALL_GAP_FACTOR * self._gap)
+
+    def _check_output(self):
+        if not self.output_path:
+            return
+        try:
+            st = os.stat(self.output_path)
+        except OSError:
+            return
+        state = (st.st_size, st.st_mtime_ns)
+        if state != self._output_state:
+            if self._output_state is not None:
+                self._touch()
+            self._output_state = state
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            if self.process.poll() is not None:
+                return
+            self._check_output()
+            now = time.monotonic()
+            if self.cancel is not None and self.cancel.is_set():
+                self.cancelled = True
+                self.reason = "trabajo cancelado"
+            elif self.timeout and now - self._start > self.timeout:
+                self.reason = f"superó el tiempo máximo de {self.timeout / 60:.0f} min"
+            elif self.window and now - self._last_advance > self.stall_window():
+                self.reason = f"sin avances durante {now - self._last_advance:.0f} s"
+            if self.reason:
+                self.process.kill()
+                return
+
+    def stop(self):
+        """Detiene la vigilancia (el proceso ya terminó)."""
+        self._stop.set()
+        self._thread.join()
+
+
+def job_timeout(info, mode, original_size=0):
+    """
+    Tiempo máximo (s) de un trabajo: job_timeout_factor veces el tiempo predicho con el
+    historial de resultados (o el costo por defecto del modo), nunca menos de JOB_TIMEOUT_MIN.
+
+    Returns:
+        float: Segundos, o None sin límite (factor 0 o sin duración conocida)
+    """
+    if not job_timeout_factor or not info or not info.get('duration'):
+        return None
+    if results_ledger is not None:
+        predicted = results_ledger.predictor(mode, active_encoder().label).predict(
+            info, original_size)['seconds']
+    else:
+        predicted = encode_work(info, mode) * DEFAULT_ENCODE_COST.get(mode, DEFAULT_ENCODE_COST['cpu'])
+    return max(JOB_TIMEOUT_MIN, job_timeout_factor * predicted)
+
+
+def run_encoder(command, on_progress=None, output_path=None, min_interval=PROGRESS_MIN_INTERVAL,
+                progress=None, timeout=None, cancel=None):
+    """
+    Ejecuta el encoder (HandBrakeCLI o ffmpeg) y reporta el progreso como eventos.
+
+    Solo se analizan las líneas de progreso cuando toca emitir un evento (como mucho uno
+    cada min_interval segundos); el resto cuesta una búsqueda de subcadena. Un
+    EncodeWatchdog termina el proceso si deja de avanzar o supera timeout.
+
+    Args:
+        command (list): Comando a ejecutar
+        on_progress (callable): Función que recibe cada ProgressEvent
+        output_path (str): Archivo de salida para reportar bytes escritos (opcional)
+        min_interval (float): Segundos mínimos entre eventos
+        progress: Analizador de progreso del encoder (por defecto, el de HandBrakeCLI)
+        timeout (float): Segundos máximos del proceso (None = sin límite)
+        cancel (threading.Event): Cancela el trabajo al activarse (opcional)
+
+    Returns:
+        int: Código de salida del proceso
+
+    Raises:
+        EncoderStalled: Si el vigilante terminó el proceso
+        EncoderCancelled: Si se activó cancel
+    """
+    if cancel is not None and cancel.is_set():
+        raise EncoderCancelled("trabajo cancelado")
+    progress = progress or HandBrakeProgress()
+    process = subprocess.Popen(
+        command, 
+        stdout=subprocess.PIPE, 
+        stderr=subprocess.STDOUT, 
+        universal_newlines=True, 
+        encoding='utf-8', 
+        errors='ignore'
+    )
+    watchdog = (EncodeWatchdog(process, output_path, timeout, cancel=cancel)
+                if stall_seconds or timeout or cancel is not None else None)
+    next_emit = 0.0
+    pending = None
+    try:
+        for line in process.stdout:
+            if progress.marker not in line:
+                continue
+            now = time.monotonic()
+            if now < next_emit:
+                pending = line
+                continue
+            pending = None
+            event = progress.parse(line, output_path)
+            if event:
+                if watchdog:
+                    watchdog.advance(event)
+                if on_progress:
+                    on_progress(event)
+                next_emit = now + min_interval
+        process.wait()
+    finally:
+        if watchdog:
+            watchdog.stop()
+        if process.poll() is None:
+            # Se sale por una excepción: el encoder no debe quedar huérfano
+            process.kill()
+            process.wait()
+    if watchdog and watchdog.reason:
+        raise (EncoderCancelled if watchdog.cancelled else EncoderStalled)(watchdog.reason)
+    # Último progreso retenido por la limitación de frecuencia
+    if pending and on_progress:
+        event = progress.parse(pending, output_path)
+        if event:
+            on_progress(event)
+    return process.returncode
+
+
+# --- Backends de Codificación ---
+
+# Ajustes de ffmpeg equivalentes a la intención de cada modo:
+#   cpu: compresión rápida y confiable (como x264 CRF 26 veryfast)
+#   gpu: alta calidad (como vt_h265 -q 19)
+# La escala CRF de x265 y SVT-AV1 no equivale a la de x264: a calidad visual parecida,
+# x265 usa ~2 puntos más y SVT-AV1 (escala 0-63) bastantes más.
+FFMPEG_INTENTS = {
+    'libx264': {'cpu': {'quality': 26, 'preset': 'veryfast', 'tune': 'film'},
+                'gpu': {'quality': 21, 'preset': 'fast'}},
+    'libx265': {'cpu': {'quality': 28, 'preset': 'veryfast'},
+                'gpu': {'quality': 23, 'preset': 'fast'}},
+    'libsvtav1': {'cpu': {'quality': 35, 'preset': 10},
+                  'gpu': {'quality': 30, 'preset': 8}},
+    'hevc_videotoolbox': {'cpu': {'quality': 55}, 'gpu': {'quality': 65}},
+}
+
+# Espacio de búsqueda de --auto-tune por códec de ffmpeg: (presets del más rápido al más
+# lento, calidades de menor a mayor tamaño, si el tamaño es monótono en la calidad).
+# En VideoToolbox -q:v mayor es más calidad, así que se prueban todas.
+FFMPEG_TUNE_SPACE = {
+    'libx264': (['veryfast', 'faster', 'fast', 'medium', 'slow'], [30, 28, 26, 24, 22, 20], True),
+    'libx265': (['veryfast', 'faster', 'fast', 'medium', 'slow'], [32, 30, 28, 26, 24, 22], True),
+    'libsvtav1': ([10, 8, 6, 4], [42, 38, 35, 32, 28, 24], True),
+    'hevc_videotoolbox': ([], [45, 55, 65, 75], False),   # VideoToolbox no tiene -preset
+}
+
+# Códecs de ffmpeg sin opción -preset (--encoder-preset no se aplica)
+FFMPEG_NO_PRESET = ('hevc_videotoolbox',)
+
+
+class EncoderBackend:
+    """
+    Interfaz de los motores de codificación.
+
+    Cada backend traduce la intención del modo ('cpu' o 'gpu'), los hilos, el rango de
+    tiempo y los ajustes de la búsqueda automática (tuning) a una línea de comandos, y
+    aporta el analizador de su salida de progreso para run_encoder.
+    """
+
+    name = 'base'
+
+    def __init__(self, path, preset=None):
+        self.path = path
+        self.preset = preset   # Preset fijo del usuario (tuning['preset'] tiene prioridad)
+
+    @property
+    def label(self):
+        """Nombre del backend con su códec, para mensajes, cachés e informes."""
+        return self.name
+
+    def build_command(self, source_path, dest_path, mode, threads=0, source_width=0, audio=True,
+                      start=None, length=None, tuning=None):
+        """Construye el comando de codificación (mismos argumentos que build_handbrake_command)."""
+        raise NotImplementedError
+
+    def progress(self, duration=None):
+        """Analizador de progreso para run_encoder; duration es la duración a codificar."""
+        raise NotImplementedError
+
+    def software(self, mode):
+        """True si el modo codifica en CPU (los hilos se reparten entre trabajos)."""
+        return mode == 'cpu'
+
+    def tune_space(self, mode):
+        """Retorna (presets, calidades, monótono) para choose_tuning; sin presets se prueba solo la calidad."""
+        raise NotImplementedError
+
+    def describe(self, mode):
+        """Descripción corta de la codificación para la consola."""
+        return f"{self.label} ({mode.upper()})"
+
+
+class HandBrakeBackend(EncoderBackend):
+    """HandBrakeCLI con los ajustes probados de cada modo (x264 / VideoToolbox H.265)."""
+
+    name = 'handbrake'
+
+    def build_command(self, source_path, dest_path, mode, threads=0, source_width=0, audio=True,
+                      start=None, length=None, tuning=None):
+        if self.preset and not (tuning and tuning.get('preset')):
+            tuning = dict(tuning or {}, preset=self.preset)
+        return build_handbrake_command(source_path, dest_path, mode, self.path, threads=threads,
+                                       source_width=source_width, audio=audio, start=start,
+                                       length=length, tuning=tuning)
+
+    def progress(self, duration=None):
+        return HandBrakeProgress()
+
+    def tune_space(self, mode):
+        return TUNE_PRESETS[mode], TUNE_QUALITIES[mode], TUNE_MONOTONIC[mode]
+
+    def describe(self, mode):
+        if mode == 'cpu':
+            return "CPU (x264 Optimizado)"
+        return "GPU (Alta Calidad + Compresión Eficiente Optimizada)"
+
+
+class FfmpegBackend(EncoderBackend):
+    """
+    ffmpeg con libx264, libx265, SVT-AV1 o VideoToolbox HEVC.
+
+    Produce la misma salida que los comandos de HandBrakeCLI: MP4 con faststart, 30fps
+    constantes, ancho máximo de 1920px sin ampliar y audio AAC de 96 kbps. Sin códec
+    explícito, 'cpu' usa libx264 y 'gpu' usa VideoToolbox en macOS y libx265 en el resto.
+    Con bitrate (objetivo de tamaño) codifica en una pasada con VBV; multi_pass se ignora.
+    """
+
+    name = 'ffmpeg'
+
+    def __init__(self, path, codec=None, preset=None):
+        super().__init__(path, preset)
+        self.codec = codec
+
+    def codec_for(self, mode):
+        if self.codec:
+            return self.codec
+        if mode == 'cpu':
+            return 'libx264'
+        return 'hevc_videotoolbox' if sys.platform == 'darwin' else 'libx265'
+
+    @property
+    def label(self):
+        return f"ffmpeg/{self.codec}" if self.codec else 'ffmpeg'
+
+    def build_command(self, source_path, dest_path, mode, threads=0, source_width=0, audio=True,
+                      start=None, length=None, tuning=None):
+        codec = self.codec_for(mode)
+        intent = FFMPEG_INTENTS[codec][mode]
+        tuning = tuning or {}
+        preset = None if codec in FFMPEG_NO_PRESET else (tuning.get('preset') or self.preset
+                                                         or intent.get('preset'))
+        quality = tuning.get('quality') if tuning.get('quality') is not None else intent['quality']
+
+        command = [self.path, '-hide_banner', '-nostdin', '-loglevel', 'error', '-stats', '-y']
+        if start is not None:
+            command += ['-ss', f'{start:.3f}']
+        command += ['-i', source_path]
+        if length is not None:
+            command += ['-t', f'{length:.3f}']
+        command += ['-map', '0:v:0']
+        if audio:
+            command += ['-map', '0:a:0?']
+
+        # 30fps constantes y ancho máximo de 1920px (nunca se amplía)
+        command += ['-vf', "fps=30,scale=w='min(1920,iw)':h=-2", '-c:v', codec]
+        if codec != 'hevc_videotoolbox':
+            command += ['-pix_fmt', 'yuv420p']
+        if preset is not None:
+            command += ['-preset', str(preset)]
+        if intent.get('tune'):
+            command += ['-tune', intent['tune']]
+
+        if tuning.get('bitrate'):
+            kbps = int(tuning['bitrate'])
+            command += ['-b:v', f'{kbps}k', '-maxrate', f'{int(kbps * 1.5)}k', '-bufsize', f'{kbps * 2}k']
+        elif codec == 'hevc_videotoolbox':
+            command += ['-q:v', str(quality)]
+        else:
+            command += ['-crf', str(quality)]
+
+        # Hilos explícitos por trabajo
+        if codec == 'libx265':
+            params = 'log-level=error'
+            if threads and threads > 0:
+                params += f':pools={int(threads)}'
+            command += ['-x265-params', params]
+        elif codec == 'libsvtav1' and threads and threads > 0:
+            command += ['-svtav1-params', f'lp={int(threads)}']
+        elif threads and threads > 0:
+            command += ['-threads', str(int(threads))]
+        if codec in ('libx265', 'hevc_videotoolbox'):
+            command += ['-tag:v', 'hvc1']  # Reproducible en QuickTime / Apple
+
+        command += ['-c:a', 'aac', '-b:a', f'{AUDIO_BITRATE_KBPS}k'] if audio else ['-an']
+        command += ['-movflags', '+faststart', '-f', 'mp4', dest_path]
+        return command
+
+    def progress(self, duration=None):
+        return FfmpegProgress(duration)
+
+    def software(self, mode):
+        return self.codec_for(mode) != 'hevc_videotoolbox'
+
+    def tune_space(self, mode):
+        presets, qualities, monotonic = FFMPEG_TUNE_SPACE[self.codec_for(mode)]
+        return presets, qualities, monotonic
+
+    def describe(self, mode):
+        codec = self.codec_for(mode)
+        intent = FFMPEG_INTENTS[codec][mode]
+        preset = None if codec in FFMPEG_NO_PRESET else self.preset or intent.get('preset')
+        details = f"calidad {intent['quality']}" + (f", preset {preset}" if preset is not None else "")
+        return f"ffmpeg {codec} ({details})"
+
+
+# --- Backend Global (se configura en el flujo principal) ---
+encoder_backend = None
+
+
+def active_encoder(handbrake_path=None):
+    """Backend configurado con --encoder o, si no hay ninguno, HandBrakeCLI."""
+    return encoder_backend or HandBrakeBackend(handbrake_path)
+
+
+# --- Flujo de Eventos de Progreso ---
+progress_listeners = []
+
+
+def add_progress_listener(callback):
+    """
+    Registra una función que recibe todos los eventos de progreso de los trabajos.
+
+    Cada evento es un diccionario con 'event' ('start', 'progress', 'done', 'failed'
+    o 'skipped'), 'time', 'source' y los campos propios del evento (los de
+    ProgressEvent en 'progress', tamaños y tiempos en 'done').
+
+    Args:
+        callback (callable): Función que recibe el diccionario del evento
+    """
+    progress_listeners.append(callback)
+
+
+def emit_progress(event_type, source_path, **fields):
+    """
+    Envía un evento de progreso a todas las funciones registradas.
+
+    Args:
+        event_type (str): Tipo de evento
+        source_path (str): Video al que se refiere el evento
+        **fields: Campos adicionales del evento
+    """
+    if not progress_listeners:
+        return
+    record = {'event': event_type, 'time': round(time.time(), 3), 'source': source_path}
+    record.update(fields)
+    for callback in progress_listeners:
+        try:
+            callback(record)
+        except Exception as e:
+            print(f"⚠️  Error en receptor de progreso: {e}")
+
+
+class ProgressLog:
+    """
+    Receptor de eventos de progreso que escribe una línea JSON por evento.
+
+    El archivo se abre en modo adición y se vacía tras cada línea, para que otras
+    herramientas puedan seguirlo con 'tail -f'.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def __call__(self, record):
+        line = json.dumps(record, ensure_ascii=False) + '\n'
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+# --- Copia Local de Trabajo (Scratch) y Precarga ---
+
+class ScratchStager:
+    """
+    Etapa de E/S para bibliotecas en red (SMB/NFS): copia los próximos videos a un
+    disco local rápido mientras se codifican los actuales.
+
+    - Un único hilo copia los videos en el orden en que se encolan, con un máximo de
+      prefetch copias adelantadas, un límite de espacio (max_bytes) y un límite de
+      ancho de banda opcional (bytes/s) para no saturar la red
+    - compress_video lee la copia local (acquire) y codifica la salida en el scratch;
+      commit la devuelve al destino con un renombrado atómico
+    - Por cada video se mide el tiempo de copia y la espera que aún quedó al empezar:
+      la diferencia es la E/S que la precarga ocultó tras otras codificaciones
+    """
+
+    CHUNK = 4 * 1024 * 1024
+
+    def __init__(self, scratch_dir, prefetch=2, max_bytes=None, bandwidth=None):
+        self.scratch_dir = os.path.abspath(scratch_dir)
+        os.makedirs(self.scratch_dir, exist_ok=True)
+        self.prefetch = max(1, prefetch)
+        if max_bytes is None:
+            max_bytes = int(shutil.disk_usage(self.scratch_dir).free * 0.8)
+        self.max_bytes = max_bytes
+        self.bandwidth = bandwidth
+        self._entries = {}       # origen -> estado de su copia local
+        self._order = deque()    # orígenes pendientes de copiar
+        self._used = 0           # bytes ocupados por copias locales
+        self._ahead = 0          # copias hechas o en curso aún no tomadas por un trabajo
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _local_name(self, path, prefix=''):
+        digest = hashlib.blake2b(os.path.abspath(path).encode('utf-8', 'surrogateescape'),
+                                 digest_size=6).hexdigest()
+        return os.path.join(self.scratch_dir, f"{prefix}{digest}_{os.path.basename(path)}")
+
+    def copy(self, source_path, dest_path):
+        """Copia un archivo respetando el límite de ancho de banda. Retorna los segundos empleados."""
+        start = time.monotonic()
+        copied = 0
+        with open(source_path, 'rb') as src, open(dest_path, 'wb') as dst:
+            for chunk in iter(lambda: src.read(self.CHUNK), b''):
+                dst.write(chunk)
+                copied += len(chunk)
+                if self.bandwidth:
+                    ahead = copied / self.bandwidth - (time.monotonic() - start)
+                    if ahead > 0:
+                        time.sleep(ahead)
+            dst.flush()
+            os.fsync(dst.fileno())
+        shutil.copystat(source_path, dest_path)
+        return time.monotonic() - start
+
+    def request(self, source_path):
+        """Pide la precarga de un video (se llama al encolarlo)."""
+        with self._cond:
+            if source_path in self._entries:
+                return
+            try:
+                size = os.path.getsize(source_path)
+            except OSError:
+                return
+            self._entries[source_path] = {'state': 'pending', 'size': size, 'path': None,
+                                          'copy_seconds': 0.0, 'ready': threading.Event()}
+            self._order.append(source_path)
+            self._cond.notify_all()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                # Esperar a que haya un pedido, hueco de precarga y espacio para él
+                while True:
+                    while self._order and self._entries.get(self._order[0]) is None:
+                        self._order.popleft()
+                    if self._order:
+                        entry = self._entries[self._order[0]]
+                        if entry['size'] > self.max_bytes:
+                            # No cabe nunca: se leerá directamente del origen
+                            entry['state'] = 'direct'
+                            entry['ready'].set()
+                            self._order.popleft()
+                            continue
+                        if self._ahead < self.prefetch and self._used + entry['size'] <= self.max_bytes:
+                            break
+                    self._cond.wait()
+                source_path = self._order.popleft()
+                entry['state'] = 'copying'
+                entry['path'] = self._local_name(source_path)
+                self._used += entry['size']
+                self._ahead += 1
+            try:
+                entry['copy_seconds'] = self.copy(source_path, entry['path'])
+                state = 'ready'
+            except OSError as e:
+                print(f"⚠️  No se pudo copiar al scratch {os.path.basename(source_path)}: {e}")
+                state = 'direct'
+            with self._cond:
+                if entry['state'] == 'abandoned' or state == 'direct':
+                    # Liberado durante la copia o copia fallida: no queda copia local
+                    if entry['state'] == 'abandoned' and self._entries.get(source_path) is entry:
+                        del self._entries[source_path]
+                    self._ahead -= 1
+                    self._discard(entry)
+                    state = 'direct'
+                entry['state'] = state
+                entry['ready'].set()
+                self._cond.notify_all()
+
+    def _discard(self, entry):
+        """Borra la copia local de una entrada y libera su espacio; requiere el lock."""
+        if entry['path']:
+            try:
+                os.remove(entry['path'])
+            except OSError:
+                pass
+            self._used -= entry['size']
+            entry['path'] = None
+
+    def acquire(self, source_path):
+        """
+        Toma la copia local de un video para codificarlo, esperando si aún se copia.
+
+        Returns:
+            tuple: (ruta a leer, segundos esperados, segundos de copia)
+        """
+        self.request(source_path)
+        with self._cond:
+            entry = self._entries.get(source_path)
+        if entry is None:
+            return source_path, 0.0, 0.0
+        start = time.monotonic()
+        entry['ready'].wait()
+        waited = time.monotonic() - start
+        with self._cond:
+            if entry['state'] != 'ready':
+                return source_path, waited, 0.0
+            entry['state'] = 'acquired'
+            self._ahead -= 1
+            self._cond.notify_all()
+            return entry['path'], waited, entry['copy_seconds']
+
+    def scratch_output(self, dest_path):
+        """Ruta en el scratch donde codificar la salida de un video."""
+        return self._local_name(dest_path, prefix='out_')
+
+    def commit(self, scratch_path, dest_path):
+        """
+        Devuelve una salida del scratch a su destino: copia a un archivo temporal junto
+        al destino y renombrado atómico, de modo que el destino nunca queda a medias.
+        """
+        partial_path = f"{dest_path}.partial"
+        try:
+            os.replace(scratch_path, dest_path)  # Mismo sistema de archivos
+            return
+        except OSError:
+            pass
+        try:
+            self.copy(scratch_path, partial_path)
+            os.replace(partial_path, dest_path)
+        finally:
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+        os.remove(scratch_path)
+
+    def release(self, source_path):
+        """Borra la copia local de un video terminado (o que no llegó a codificarse)."""
+        with self._cond:
+            entry = self._entries.pop(source_path, None)
+            if entry is None:
+                return
+            if entry['state'] == 'copying':
+                # Se borra cuando termine la copia en curso
+                self._entries[source_path] = entry
+                entry['state'] = 'abandoned'
+                return
+            if entry['state'] == 'ready':
+                self._ahead -= 1
+            self._discard(entry)
+            self._cond.notify_all()
+
+
+# --- Scratch Global (se configura en el flujo principal) ---
+scratch_stager = None
+
+
+# --- Búsqueda Automática de Ajustes por Video ---
+
+# Candidatos de la búsqueda, con los presets del más rápido al más lento.
+# En x264 un CRF mayor produce siempre un archivo menor, así que las calidades se
+# prueban de menor a mayor tamaño y la búsqueda se detiene en la primera que cumple.
+# En VideoToolbox la escala de calidad no es un CRF, así que se prueban todas.
+TUNE_PRESETS = {'cpu': ['veryfast', 'faster', 'fast', 'medium', 'slow'], 'gpu': [None]}
+TUNE_QUALITIES = {'cpu': [30, 28, 26, 24, 22, 20], 'gpu': [16, 19, 22, 25, 28]}
+TUNE_MONOTONIC = {'cpu': True, 'gpu': False}
+TUNE_WINDOWS = 3           # Ventanas de prueba por video
+TUNE_WINDOW_SECONDS = 4.0  # Duración de cada ventana
+DEFAULT_TARGET_SSIM = 0.97
+
+SSIM_REGEX = re.compile(r"SSIM .*All:(\d+(?:\.\d+)?)")
+
+
+class TuningCache:
+    """
+    Caché persistente de las decisiones de la búsqueda automática por tipo de contenido.
+
+    La clave resume el contenido (modo, códec de origen, resolución y fps de salida,
+    bits por píxel del origen y objetivos), de modo que los videos parecidos de una
+    misma biblioteca reutilizan la decisión sin repetir las pruebas.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(CACHE_DIR, 'tuning_cache.json')
+        self.enabled = True
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._dirty = False
+
+    def _load(self):
+        if self._loaded:
+            return
+        self._loaded = True
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self._entries = dict(json.load(f).get('entries', {}))
+        except (OSError, ValueError, TypeError, AttributeError):
+            self._entries = {}
+
+    def get(self, key):
+        """Retorna la decisión guardada para la clave o None."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            self._load()
+            entry = self._entries.get(key)
+            return dict(entry) if entry is not None else None
+
+    def put(self, key, decision):
+        """Guarda la decisión de un tipo de contenido."""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._load()
+            self._entries[key] = dict(decision)
+            self._dirty = True
+
+    def save(self):
+        """Escribe la caché en disco de forma atómica (solo si cambió)."""
+        with self._lock:
+            if not self.enabled or not self._dirty:
+                return
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                tmp_path = f"{self.path}.{os.getpid()}.tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump({'version': 1, 'entries': self._entries}, f, indent=1)
+                os.replace(tmp_path, self.path)
+                self._dirty = False
+            except OSError as e:
+                print(f"⚠️  No se pudo guardar la caché de ajustes: {e}")
+
+
+# --- Caché Global de Ajustes ---
+tuning_cache = TuningCache()
+
+
+def tuning_content_key(info, mode, tune):
+    """
+    Clave del tipo de contenido de un video para la caché de ajustes.
+
+    Los bits por píxel se agrupan en escalones de media octava: dos videos del mismo
+    origen y complejidad parecida caen en el mismo escalón.
+    """
+    width, height, fps = output_geometry(info, mode)
+    bitrate = info.get('bitrate') or 0
+    bpp_step = 'na'
+    if bitrate and width * height * fps > 0:
+        bpp_step = round(math.log2(bitrate / (width * height * fps)) * 2) / 2
+    return (f"{mode}|{info.get('codec') or 'unknown'}|{height}p|{int(round(fps))}fps|bpp{bpp_step}"
+            f"|ssim{tune.get('target_ssim', DEFAULT_TARGET_SSIM)}|ratio{tune.get('target_ratio')}")
+
+
+def tune_windows(duration):
+    """
+    Elige las ventanas de prueba repartidas a lo largo del video.
+    Retorna: Lista de (inicio, duración) en segundos; vacía si el video es muy corto.
+    """
+    if duration < 2 * TUNE_WINDOW_SECONDS:
+        return [(0.0, duration)] if duration >= 2 else []
+    count = max(1, min(TUNE_WINDOWS, int(duration // (2 * TUNE_WINDOW_SECONDS))))
+    return [(duration * (i + 1) / (count + 1) - TUNE_WINDOW_SECONDS / 2, TUNE_WINDOW_SECONDS)
+            for i in range(count)]
+
+
+def measure_ssim(ffmpeg_path, source_path, trial_path, start, length, width, height):
+    """
+    Mide el SSIM de una codificación de prueba frente a la misma ventana del origen.
+
+    El origen se escala a la resolución de la prueba y ambos se igualan a 30fps
+    (la tasa de salida de los dos modos).
+
+    Returns:
+        float: SSIM global (0-1) o None si ffmpeg no pudo medirlo
+    """
+    command = [
+        ffmpeg_path, '-hide_banner', '-nostats',
+        '-i', trial_path,
+        '-ss', f'{start:.3f}', '-t', f'{length:.3f}', '-i', source_path,
+        '-lavfi', f'[0:v]fps=30[main];[1:v]fps=30,scale={width}:{height}:flags=bicubic[ref];'
+                  f'[main][ref]ssim',
+        '-f', 'null', '-'
+    ]
+    output = subprocess.run(command, capture_output=True, text=True, errors='ignore').stderr
+    match = SSIM_REGEX.search(output)
+    return float(match.group(1)) if match else None
+
+
+def evaluate_candidate(source_path, info, mode, handbrake_path, ffmpeg_path, work_dir, windows,
+                       threads, candidate):
+    """
+    Codifica las ventanas de prueba con un candidato y mide calidad, tamaño y tiempo.
+
+    Args:
+        ffmpeg_path (str): Ruta de ffmpeg para medir SSIM (None = solo medir tamaño)
+
+    Returns:
+        dict: Candidato con ssim (media de las ventanas, None sin ffmpeg), ratio (tamaño
+              de salida frente al origen, aproximado con su bitrate), bytes de video
+              producidos, sample_seconds codificados y seconds empleados; None si alguna
+              prueba falló
+    """
+    encoder = active_encoder(handbrake_path)
+    ssims = []
+    output_bytes = 0
+    start_time = time.monotonic()
+    for i, (start, length) in enumerate(windows):
+        trial_path = os.path.join(work_dir, f"trial_{i}.mp4")
+        command = encoder.build_command(source_path, trial_path, mode, threads=threads,
+                                        source_width=info.get('width', 0), audio=False,
+                                        start=start if start > 0 else None, length=length,
+                                        tuning=candidate)
+        try:
+            returncode = run_encoder(command, progress=encoder.progress(length))
+        except EncoderStalled:
+            return None
+        if returncode != 0 or not os.path.isfile(trial_path):
+            return None
+        if ffmpeg_path:
+            try:
+                trial = parse_mp4(trial_path)
+                width, height = trial['width'], trial['height']
+            except (MP4ParseError, OSError, ValueError, struct.error):
+                width, height = output_geometry(info, mode)[:2]
+            ssim = measure_ssim(ffmpeg_path, source_path, trial_path, start, length, width, height)
+            if ssim is None:
+                return None
+            ssims.append(ssim)
+        output_bytes += os.path.getsize(trial_path)
+        os.remove(trial_path)
+
+    sample_seconds = sum(length for _, length in windows)
+    source_bytes = (info.get('bitrate') or 0) / 8 * sample_seconds
+    result = dict(candidate or {})
+    result['ssim'] = round(sum(ssims) / len(ssims), 5) if ssims else None
+    result['ratio'] = round(output_bytes / source_bytes, 4) if source_bytes else None
+    result['bytes'] = output_bytes
+    result['sample_seconds'] = sample_seconds
+    result['seconds'] = round(time.monotonic() - start_time, 2)
+    return result
+
+
+def choose_tuning(source_path, info, mode, handbrake_path, tune, threads=0, console=None):
+    """
+    Elige el preset y la calidad de un video con codificaciones cortas de prueba.
+
+    Con el preset más rápido se busca la calidad que produce el archivo más pequeño
+    con SSIM >= target_ssim. Si además hay target_ratio y ese tamaño no lo cumple,
+    se prueban presets más lentos (que a igual calidad comprimen más) hasta cumplirlo.
+    Si ningún candidato cumple, se usan los ajustes fijos del modo.
+
+    Args:
+        source_path (str): Ruta del video
+        info (dict): Metadatos de probe_video
+        mode (str): 'cpu' o 'gpu'
+        handbrake_path (str): Ruta del ejecutable HandBrakeCLI
+        tune (dict): Objetivos: target_ssim y target_ratio (tamaño máximo salida/origen)
+        threads (int): Hilos de x264 para las pruebas
+        console (JobConsole): Salida de consola del trabajo
+
+    Returns:
+        dict: Ajustes elegidos (preset, quality, ssim, ratio) o None para los fijos
+    """
+    console = console or JobConsole()
+    if not info or not info.get('duration'):
+        return None
+    encoder = active_encoder(handbrake_path)
+    key = tuning_content_key(info, mode, tune)
+    if encoder.name != 'handbrake':
+        key = f"{encoder.label}|{key}"
+    cached = tuning_cache.get(key)
+    if cached is not None:
+        if cached.get('quality') is None:
+            return None
+        console.log(f"🎛️  Ajustes reutilizados de contenido similar: "
+                    f"preset {cached.get('preset') or 'por defecto'}, calidad {cached['quality']}")
+        return cached
+
+    ffmpeg_path = find_ffmpeg()
+    windows = tune_windows(info['duration'])
+    if not ffmpeg_path or not windows:
+        return None
+    target_ssim = tune.get('target_ssim', DEFAULT_TARGET_SSIM)
+    target_ratio = tune.get('target_ratio')
+
+    def meets_size(result):
+        return target_ratio is None or result['ratio'] is None or result['ratio'] <= target_ratio
+
+    console.log(f"🎛️  Buscando ajustes ({len(windows)} ventanas de {TUNE_WINDOW_SECONDS:g}s, "
+                f"SSIM ≥ {target_ssim})")
+    work_dir = tempfile.mkdtemp(prefix=WORK_DIR_PREFIX + 'tune_', dir=os.path.dirname(os.path.abspath(source_path)))
+    chosen = None
+    measured = False   # Algún candidato se llegó a medir (no todos fallaron)
+    try:
+        presets, qualities, monotonic = encoder.tune_space(mode)
+        passing = []
+        for quality in qualities:
+            result = evaluate_candidate(source_path, info, mode, handbrake_path, ffmpeg_path,
+                                        work_dir, windows, threads,
+                                        {'preset': presets[0] if presets else None, 'quality': quality})
+            if result is None:
+                continue
+            measured = True
+            console.log(f"   preset {result['preset'] or 'por defecto'}, calidad {quality}: "
+                        f"SSIM {result['ssim']:.4f}, tamaño {result['ratio']}")
+            if result['ssim'] >= target_ssim:
+                passing.append(result)
+                if monotonic:
+                    break
+        if passing:
+            best = min(passing, key=lambda r: r['ratio'] if r['ratio'] is not None else 0)
+            if meets_size(best):
+                chosen = best
+            else:
+                # Presets más lentos a la misma calidad hasta cumplir el tamaño
+                for preset in presets[1:]:
+                    result = evaluate_candidate(source_path, info, mode, handbrake_path, ffmpeg_path,
+                                                work_dir, windows, threads,
+                                                {'preset': preset, 'quality': best['quality']})
+                    if result is None:
+                        continue
+                    console.log(f"   preset {preset}, calidad {best['quality']}: "
+                                f"SSIM {result['ssim']:.4f}, tamaño {result['ratio']}")
+                    if result['ssim'] >= target_ssim and meets_size(result):
+                        chosen = result
+                        break
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if chosen:
+        console.log(f"🎛️  Ajustes elegidos: preset {chosen['preset'] or 'por defecto'}, "
+                    f"calidad {chosen['quality']} (SSIM {chosen['ssim']:.4f})")
+    elif measured:
+        console.log("🎛️  Ningún candidato cumple los objetivos; se usan los ajustes fijos del modo")
+    else:
+        # Todas las pruebas fallaron (scratch lleno, filtro ausente...): no se guarda en la
+        # caché para volver a buscar la próxima vez
+        console.log("🎛️  No se pudo medir ningún candidato; se usan los ajustes fijos del modo")
+        return None
+    tuning_cache.put(key, chosen or {'preset': None, 'quality': None})
+    return chosen
+
+
+# --- Objetivo de Tamaño del Lote ---
+
+# Desviación tolerada sobre el tamaño asignado antes de repetir con dos pasadas
+SIZE_TOLERANCE = 0.05
+# Bitrate de audio de los comandos (kbps) y margen del contenedor MP4
+AUDIO_BITRATE_KBPS = 96
+CONTAINER_OVERHEAD = 0.02
+# Bitrate de video mínimo al que se recurre para cumplir un tamaño (kbps)
+MIN_VIDEO_BITRATE_KBPS = 150
+
+
+class SizeBudget:
+    """
+    Controlador del tamaño de salida de un lote.
+
+    Admite dos objetivos:
+    - Ahorro mínimo (ratio): la salida acumulada no debe superar ratio × entrada
+    - Tamaño total (total_bytes): la salida de los total_input bytes de entrada debe
+      caber en total_bytes
+    Cada video recibe una asignación proporcional a su tamaño sobre lo que queda del
+    presupuesto. Al conocerse el tamaño real de cada salida (settle) el presupuesto
+    restante se corrige: lo que un video ahorra de más lo pueden usar los siguientes y
+    lo que se excede se descuenta de ellos.
+    """
+
+    def __init__(self, ratio=None, total_bytes=None, total_input=0):
+        self.ratio = ratio
+        self.total_bytes = total_bytes
+        self.total_input = total_input
+        self.input_done = 0
+        self.output_done = 0
+        self._input_reserved = 0
+        self._output_reserved = 0
+        self._lock = threading.Lock()
+
+    def reserve(self, original_size):
+        """
+        Asigna un tamaño de salida a un video que empieza a procesarse.
+
+        Returns:
+            dict: Reserva con 'input' y 'bytes' (tamaño objetivo) para settle()
+        """
+        with self._lock:
+            if self.total_bytes is not None:
+                remaining_budget = self.total_bytes - self.output_done - self._output_reserved
+                remaining_input = max(original_size,
+                                      self.total_input - self.input_done - self._input_reserved)
+                allocation = remaining_budget * original_size / remaining_input
+            else:
+                allowed = self.ratio * (self.input_done + self._input_reserved + original_size)
+                allocation = allowed - self.output_done - self._output_reserved
+            allocation = int(min(original_size, max(allocation, original_size * 0.02)))
+            self._input_reserved += original_size
+            self._output_reserved += allocation
+            return {'input': original_size, 'bytes': allocation}
+
+    def settle(self, reservation, output_size):
+        """Registra el tamaño real que ocupa un video al terminar (el original si no se comprimió)."""
+        with self._lock:
+            self._input_reserved -= reservation['input']
+            self._output_reserved -= reservation['bytes']
+            self.input_done += reservation['input']
+            self.output_done += output_size
+
+    @property
+    def target(self):
+        """Tamaño objetivo para la entrada procesada hasta ahora."""
+        if self.total_bytes is not None:
+            return self.total_bytes
+        return self.ratio * self.input_done
+
+
+# --- Objetivo de Tamaño Global (se configura en el flujo principal) ---
+size_budget = None
+
+
+def parse_size(text):
+    """
+    Convierte un tamaño legible ('50G', '700M', '1.5T', '123456') en bytes.
+    Retorna: int con los bytes o None si el formato no es válido.
+    """
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([KMGT]?)i?B?\s*", text, re.IGNORECASE)
+    if not match:
+        return None
+    factor = 1024 ** ' KMGT'.index(match.group(2).upper() or ' ')
+    return int(float(match.group(1)) * factor)
+
+
+def budget_for_batch(video_paths, total_bytes):
+    """
+    Prepara el objetivo de tamaño total de un lote finito.
+    El reparto necesita el tamaño de toda la entrada, así que la lista se materializa.
+
+    Returns:
+        tuple: (lista de rutas, SizeBudget)
+    """
+    video_paths = list(video_paths)
+    total_input = sum(os.path.getsize(path) for path in video_paths if os.path.isfile(path))
+    return video_paths, SizeBudget(total_bytes=total_bytes, total_input=total_input)
+
+
+def predict_output_size(source_path, info, mode, handbrake_path, threads=0, tuning=None):
+    """
+    Predice el tamaño de salida de un video con una codificación corta de muestra.
+
+    Returns:
+        int: Bytes estimados (video de la muestra extrapolado a toda la duración más
+             el audio), o None si no hay duración o la muestra falló
+    """
+    duration = (info or {}).get('duration') or 0
+    windows = tune_windows(duration)
+    if not windows:
+        return None
+    work_dir = tempfile.mkdtemp(prefix=WORK_DIR_PREFIX + 'sample_', dir=os.path.dirname(os.path.abspath(source_path)))
+    try:
+        sample = evaluate_candidate(source_path, info, mode, handbrake_path, None, work_dir,
+                                    windows, threads, tuning)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    if not sample or not sample['sample_seconds']:
+        return None
+    video_bytes = sample['bytes'] / sample['sample_seconds'] * duration
+    return int((video_bytes + AUDIO_BITRATE_KBPS * 1000 / 8 * duration) * (1 + CONTAINER_OVERHEAD))
+
+
+def bitrate_for_size(target_bytes, duration):
+    """
+    Bitrate de video (kbps) con el que un video de 'duration' segundos ocupa target_bytes.
+    Descuenta el audio y el margen del contenedor.
+    """
+    total_kbps = target_bytes / (1 + CONTAINER_OVERHEAD) * 8 / duration / 1000
+    return max(MIN_VIDEO_BITRATE_KBPS, int(total_kbps - AUDIO_BITRATE_KBPS))
+
+
+def build_stream_copy_command(ffmpeg_path, source_path, dest_path, action, info):
+    """
+    Comando de ffmpeg para una copia de flujos: el video se copia sin recodificar y el
+    audio se copia ('remux') o se recodifica a AAC ('copy'); la salida lleva faststart.
+    """
+    command = [ffmpeg_path, '-hide_banner', '-nostdin', '-loglevel', 'error', '-stats', '-y',
+               '-i', source_path, '-map', '0:v:0', '-map', '0:a:0?', '-c:v', 'copy']
+    if info.get('codec') == 'hevc':
+        command += ['-tag:v', 'hvc1']   # Etiqueta que exigen QuickTime y los dispositivos Apple
+    if action == 'copy':
+        command += ['-c:a', 'aac', '-b:a', f'{AUDIO_BITRATE_KBPS}k']
+    else:
+        command += ['-c:a', 'copy']
+    return command + ['-movflags', '+faststart', '-f', 'mp4', dest_path]
+
+
+def stream_copy_video(source_path, dest_path, mode, info, action, reason, original_size,
+                      console, journal=None, cancel=None, dispose=True):
+    """
+    Resuelve un video sin recodificar su flujo de video (ver decide_stream_copy).
+    Lee directamente del origen (sin scratch): la copia va a la velocidad del disco.
+
+    Returns:
+        dict: Resultado como el de compress_video, con 'stream_copy' igual a la acción,
+              o None si la copia falló
+    """
+    ffmpeg_path = find_ffmpeg()
+    label = "Remux" if action == 'remux' else "Copia de video con audio recodificado"
+    console.log(f"\n⏩ {label}: {os.path.basename(source_path)} — {reason}")
+    if journal:
+        journal.record(source_path, 'encoding', dest=dest_path, original_size=original_size)
+    emit_progress('start', source_path, dest=dest_path, mode=mode, original_size=original_size,
+                  stream_copy=action)
+    ledger = results_ledger
+    ledger_token = ledger.begin() if ledger else None
+    start_time = time.time()
+
+    def report(event):
+        console.progress(event)
+        emit_progress('progress', source_path, **event.as_dict())
+
+    command = build_stream_copy_command(ffmpeg_path, source_path, dest_path, action, info)
+    timeout = (max(JOB_TIMEOUT_MIN, job_timeout_factor * original_size / STREAM_COPY_BYTES_PER_SECOND)
+               if job_timeout_factor else None)
+    try:
+        returncode = run_encoder(command, on_progress=report, output_path=dest_path,
+                                 progress=FfmpegProgress(info.get('duration')), timeout=timeout,
+                                 cancel=cancel)
+        if cancel is not None and cancel.is_set():
+            raise EncoderCancelled("trabajo cancelado")
+    except EncoderCancelled as e:
+        # La salida queda a medias: se borra sin verificarla
+        console.log(f"\n🚫 Trabajo cancelado: {os.path.basename(source_path)} ({e})")
+        if os.path.exists(dest_path):
+            os.remove(dest_path)
+        if ledger:
+            ledger.finish(ledger_token, source_path, info, mode, FfmpegBackend(ffmpeg_path), 'failed',
+                          original_size, elapsed=time.time() - start_time)
+        if journal:
+            journal.record(source_path, 'failed', error=str(e))
+        emit_progress('failed', source_path, error=str(e))
+        return None
+    except (OSError, EncoderStalled) as e:
+        console.log(f"\nError al copiar los flujos de {os.path.basename(source_path)}: {e}")
+        returncode = None
+    elapsed = time.time() - start_time
+    if returncode != 0 or not os.path.isfile(dest_path):
+        console.log(f"\nError al copiar los flujos de {os.path.basename(source_path)}.")
+        if os.path.exists(dest_path):
+            os.remove(dest_path)
+        if ledger:
+            ledger.finish(ledger_token, source_path, info, mode, FfmpegBackend(ffmpeg_path), 'failed',
+                          original_size, elapsed=elapsed)
+        if journal:
+            journal.record(source_path, 'failed', returncode=returncode)
+        emit_progress('failed', source_path, returncode=returncode)
+        return None
+    console.progress_done()
+
+    compressed_size = os.path.getsize(dest_path)
+    if journal:
+        journal.record(source_path, 'encoded', compressed_size=compressed_size, elapsed=elapsed,
+                       stream_copy=action)
+    # Un remux solo corrige el contenedor: se acepta aunque no reduzca el tamaño
+    growth = REMUX_SIZE_TOLERANCE if action == 'remux' else 0.0
+    problem = verify_output(dest_path, info.get('duration'), original_size, growth)
+    if ledger:
+        ledger.finish(ledger_token, source_path, info, mode, FfmpegBackend(ffmpeg_path),
+                      'rejected' if problem else action, original_size,
+                      compressed_size=compressed_size, elapsed=elapsed)
+    if problem:
+        reject_output(source_path, dest_path, problem, console, journal)
+        return None
+    if journal:
+        journal.record(source_path, 'verified', sync=True)
+    emit_progress('done', source_path, dest=dest_path, original_size=original_size,
+                  compressed_size=compressed_size, elapsed=round(elapsed, 3), stream_copy=action)
+
+    if dispose:
+        source_disposer.submit(source_path, journal)
+    return {
+        'source': source_path,
+        'dest': dest_path,
+        'original_size': original_size,
+        'compressed_size': compressed_size,
+        'elapsed': elapsed,
+        'stream_copy': action,
+    }
+
+
+def compress_video(source_path, dest_path, mode, handbrake_path, threads=0, console=None,
+                   skip_thresholds=None, journal=None, split_segments=0,
+                   split_min_duration=SPLIT_MIN_DURATION, tune=None, target_bytes=None,
+                   stream_copy=True, cancel=None, dispose=True):
+    """
+    Comprime un video usando HandBrakeCLI con configuraciones optimizadas.
+    - CPU: x264 con CRF 26 (configuración original probada)
+    - GPU: VideoToolbox H.265 con CRF 19 + optimizaciones Apple Silicon
+      * Hardware decoders habilitados para pipeline GPU completo
+      * max-frame-delay=1 para optimización de latencia
+      * Mantiene exactamente la misma calidad visual
+      * 15-30% más rápido en chips Apple Silicon
+    - NUEVO: Monitoreo energético real con datos de CPU y GPU
+    
+    Args:
+        source_path (str): Ruta del archivo de video origen
+        dest_path (str): Ruta de destino del archivo comprimido  
+        mode (str): 'cpu' o 'gpu' para seleccionar método de compresión
+        handbrake_path (str): Ruta del ejecutable HandBrakeCLI
+        threads (int): Hilos del encoder x264 por trabajo (0 = automático)
+        console (JobConsole): Salida de consola del trabajo (por defecto, en vivo)
+        skip_thresholds (dict): Umbrales bpp para omitir videos ya eficientes
+                                (None = SKIP_BPP_THRESHOLDS, {} = nunca omitir)
+        journal (JobJournal): Diario donde registrar las transiciones de estado (opcional)
+        split_segments (int): Segmentos en que dividir videos largos para codificarlos en
+                              paralelo (0 o 1 = sin división)
+        split_min_duration (float): Duración mínima (s) a partir de la cual se divide
+        tune (dict): Objetivos de la búsqueda automática de ajustes (target_ssim,
+                     target_ratio); None usa los ajustes fijos del modo
+        target_bytes (int): Tamaño de salida asignado por el objetivo del lote (opcional);
+                            si la muestra predice que se supera, se codifica a bitrate
+                            medio y solo se repite en dos pasadas si el resultado se desvía
+        stream_copy (bool): Permite remux o copia del video con audio recodificado para los
+                            videos ya eficientes (requiere ffmpeg; ver decide_stream_copy)
+        cancel (threading.Event): Al activarse se termina el encoder y no se verifica la
+                                  salida ni se toca el original (opcional)
+        dispose (bool): Envía el original a la papelera tras verificar la salida; con False
+                        lo hace quien llama (un trabajador de la granja, tras /complete)
+
+    Returns:
+        dict: Resultado de la compresión (tamaños, tiempo y energía) o None si falló.
+              Si el video se omitió, el resultado incluye 'skipped': True; si se copiaron
+              sus flujos, 'stream_copy' con la acción ('remux' o 'copy').
+    """
+    console = console or JobConsole()
+
+    # Verificar permisos de escritura en directorio destino
+    dest_dir = os.path.dirname(dest_path)
+    if not os.access(dest_dir, os.W_OK):
+        console.log(f"\nError: No hay permisos de escritura en el directorio: '{dest_dir}'")
+        return None
+
+    # Obtener tamaño original del archivo
+    try:
+        original_size = os.path.getsize(source_path)
+    except FileNotFoundError:
+        console.log(f"\nError: No se encontró el archivo de origen: {source_path}")
+        return None
+
+    # Decidir si el video merece recodificarse antes de lanzar HandBrakeCLI
+    info = probe_video(source_path, handbrake_path)
+    action, reason, _ = decide_encoding(info, mode, skip_thresholds,
+                                        stream_copy=stream_copy and find_ffmpeg() is not None)
+    if action in ('remux', 'copy'):
+        return stream_copy_video(source_path, dest_path, mode, info, action, reason, original_size,
+                                 console, journal, cancel, dispose)
+    if action == 'skip':
+        console.log(f"\n⏭️  Omitido: {os.path.basename(source_path)} — {reason}")
+        emit_progress('skipped', source_path, reason=reason)
+        if journal:
+            journal.record(source_path, 'skipped', original_size=original_size)
+        return {
+            'source': source_path,
+            'skipped': True,
+            'reason': reason,
+            'original_size': original_size,
+            'work': encode_work(info, mode),
+        }
+
+    # Copia local del origen (precarga en scratch): la salida también se codifica allí
+    stager = scratch_stager
+    input_path, output_path = source_path, dest_path
+    io_wait = io_hidden = 0.0
+    if stager:
+        input_path, io_wait, copy_seconds = stager.acquire(source_path)
+        if input_path != source_path:
+            output_path = stager.scratch_output(dest_path)
+            io_hidden = max(0.0, copy_seconds - io_wait)
+            console.log(f"📦 Copia local lista: E/S de {copy_seconds:.1f}s, espera de {io_wait:.1f}s "
+                        f"({io_hidden:.1f}s ocultos por la precarga)")
+
+    start_time = time.time()
+    
+    # Atribuir a este trabajo la energía medida mientras dure
+    sampler = energy_sampler
+    energy_token = sampler.begin_job() if sampler else None
+
+    # Mensaje según el modo de compresión y el backend
+    encoder = active_encoder(handbrake_path)
+    console.log(f"\nComprimiendo con {encoder.describe(mode)}: {os.path.basename(source_path)}")
+
+    tuning = choose_tuning(input_path, info, mode, handbrake_path, tune, threads, console) if tune else None
+
+    # Objetivo de tamaño: muestra corta para decidir entre calidad constante y bitrate
+    duration = (info or {}).get('duration') or 0
+    if target_bytes and duration > 0:
+        predicted = predict_output_size(input_path, info, mode, handbrake_path, threads, tuning)
+        if predicted is not None and predicted <= target_bytes:
+            console.log(f"🎯 Predicción {predicted / 1024 ** 2:.1f} MB ≤ objetivo "
+                        f"{target_bytes / 1024 ** 2:.1f} MB: calidad constante")
+        else:
+            tuning = dict(tuning or {}, bitrate=bitrate_for_size(target_bytes, duration))
+            console.log(f"🎯 Objetivo {target_bytes / 1024 ** 2:.1f} MB: bitrate medio de "
+                        f"{tuning['bitrate']} kbps")
+
+    source_width = info['width'] if info else 0
+    command = encoder.build_command(input_path, output_path, mode, threads=threads,
+                                    source_width=source_width, tuning=tuning)
+
+    if journal:
+        journal.record(source_path, 'encoding', dest=dest_path, original_size=original_size)
+    emit_progress('start', source_path, dest=dest_path, mode=mode, original_size=original_size)
+
+    # Historial de resultados: cada trabajo iniciado deja una fila, correcto o fallido
+    ledger = results_ledger
+    ledger_token = ledger.begin() if ledger else None
+
+    def record_result(status, **fields):
+        if ledger:
+            ledger.finish(ledger_token, source_path, info, mode, encoder, status, original_size,
+                          tuning=tuning, threads=threads, **fields)
+
+    def report(event):
+        console.progress(event)
+        emit_progress('progress', source_path, **event.as_dict())
+
+    # Ejecutar proceso de compresión con monitoreo de progreso (y vigilancia de estancamiento)
+    timeout = job_timeout(info, mode, original_size)
+    try:
+        segments = plan_split(input_path, info, split_segments, split_min_duration)
+        if segments:
+            console.log(f"✂️  Dividido en {len(segments)} segmentos por fotogramas clave")
+            returncode = encode_segmented(input_path, output_path, mode, handbrake_path, info,
+                                          segments, threads=threads, on_progress=report,
+                                          tuning=tuning, timeout=timeout, cancel=cancel)
+        else:
+            # Mostrar progreso en tiempo real
+            returncode = run_encoder(command, on_progress=report, output_path=output_path,
+                                     progress=encoder.progress(duration), timeout=timeout,
+                                     cancel=cancel)
+
+        # Verificar si la compresión fue exitosa
+        if returncode != 0 or not os.path.isfile(output_path):
+            console.log(f"\nError al comprimir: {os.path.basename(source_path)}. "
+                        f"Verifique que el archivo no esté corrupto.")
+            if output_path != dest_path and os.path.exists(output_path):
+                os.remove(output_path)
+            if sampler:
+                sampler.end_job(energy_token)
+            if journal:
+                journal.record(source_path, 'failed', returncode=returncode)
+            record_result('failed', elapsed=time.time() - start_time)
+            emit_progress('failed', source_path, returncode=returncode)
+            return None
+
+        # Mostrar finalización exitosa
+        console.progress_done()
+
+        # Segunda pasada solo para los videos que se desvían del tamaño asignado
+        if target_bytes and duration > 0 and \
+                os.path.getsize(output_path) > target_bytes * (1 + SIZE_TOLERANCE):
+            actual = os.path.getsize(output_path)
+            if tuning and tuning.get('bitrate'):
+                bitrate = max(MIN_VIDEO_BITRATE_KBPS, int(tuning['bitrate'] * target_bytes / actual))
+            else:
+                bitrate = bitrate_for_size(target_bytes, duration)
+            tuning = dict(tuning or {}, bitrate=bitrate, multi_pass=True)
+            console.log(f"📏 Salida de {actual / 1024 ** 2:.1f} MB fuera del objetivo: "
+                        f"repitiendo a {bitrate} kbps en dos pasadas")
+            retry_path = f"{output_path}.retry"  # Sin extensión de video: la vigilancia lo ignora
+            command = encoder.build_command(input_path, retry_path, mode, threads=threads,
+                                            source_width=source_width, tuning=tuning)
+            try:
+                retry_code = run_encoder(command, on_progress=report, output_path=retry_path,
+                                         progress=encoder.progress(duration), timeout=timeout,
+                                         cancel=cancel)
+            except EncoderStalled as e:
+                # La primera salida sigue siendo válida
+                console.log(f"⏱️  Segunda pasada detenida ({e}): se conserva la primera salida")
+                retry_code = None
+            if retry_code == 0 and os.path.isfile(retry_path) and os.path.getsize(retry_path) < actual:
+                os.replace(retry_path, output_path)
+            elif os.path.exists(retry_path):
+                os.remove(retry_path)
+            console.progress_done()
+
+        # Un trabajo cancelado durante la segunda pasada no llega a verificarse
+        if cancel is not None and cancel.is_set():
+            raise EncoderCancelled("trabajo cancelado")
+
+        # Devolver la salida del scratch a su destino (renombrado atómico)
+        if output_path != dest_path:
+            stager.commit(output_path, dest_path)
+
+        # Resultado de la compresión
+        compressed_size = os.path.getsize(dest_path)
+        elapsed = time.time() - start_time
+        
+        # Energía atribuida a este trabajo
+        energy_consumed = sampler.end_job(energy_token) if sampler else 0.0
+        
+        if energy_consumed > 0:
+            console.log(f"⚡ Energía consumida: {energy_consumed * 1000:.2f} Wh")
+
+        result = {
+            'source': source_path,
+            'dest': dest_path,
+            'original_size': original_size,
+            'compressed_size': compressed_size,
+            'elapsed': elapsed,
+            'energy': energy_consumed,
+            'work': encode_work(info, mode),
+        }
+        if input_path != source_path:
+            result['io_wait'] = io_wait
+            result['io_hidden'] = io_hidden
+        if tuning:
+            result['tuning'] = {key: tuning[key] for key in ('preset', 'quality', 'bitrate', 'multi_pass')
+                                if tuning.get(key) is not None}
+        if journal:
+            journal.record(source_path, 'encoded', compressed_size=compressed_size, elapsed=elapsed,
+                           energy=energy_consumed, work=result['work'])
+
+        # Verificación rápida: contenedor legible, duración del origen y tamaño menor
+        problem = verify_output(dest_path, duration, original_size)
+        if problem:
+            record_result('rejected', compressed_size=compressed_size, elapsed=elapsed, energy=energy_consumed)
+            reject_output(source_path, dest_path, problem, console, journal)
+            return None
+
+        if journal:
+            # La salida debe quedar registrada en disco antes de tocar el original
+            journal.record(source_path, 'verified', sync=True)
+        record_result('done', compressed_size=compressed_size, elapsed=elapsed, energy=energy_consumed)
+        emit_progress('done', source_path, dest=dest_path, original_size=original_size,
+                      compressed_size=compressed_size, elapsed=round(elapsed, 3),
+                      energy=energy_consumed)
+
+        # El original va a la papelera en segundo plano (más seguro que eliminación permanente)
+        if dispose:
+            source_disposer.submit(source_path, journal)
+        return result
+        
+    except Exception as e:
+        if isinstance(e, EncoderCancelled):
+            console.log(f"\n🚫 Trabajo cancelado: {os.path.basename(source_path)} ({e})")
+        elif isinstance(e, EncoderStalled):
+            console.log(f"\n⏱️  Trabajo detenido por el vigilante: {os.path.basename(source_path)} {e}")
+        else:
+            console.log(f"\nOcurrió un error inesperado durante la compresión: {e}")
+        # La salida de un encoder terminado por el vigilante (o cancelado) siempre queda a
+        # medias; la granja codifica en un directorio propio de cada trabajador
+        partial = output_path != dest_path or isinstance(e, EncoderStalled)
+        if partial and os.path.exists(output_path):
+            os.remove(output_path)
+        # Cerrar la atribución de energía en caso de error
+        if sampler:
+            sampler.end_job(energy_token)
+        if journal:
+            journal.record(source_path, 'failed', error=str(e))
+        record_result('failed', elapsed=time.time() - start_time)
+        emit_progress('failed', source_path, error=str(e))
+        return None
+
+def get_user_input(prompt, valid_options):
+    """
+    Solicita entrada del usuario hasta obtener una opción válida.
+    
+    Args:
+        prompt (str): Mensaje a mostrar al usuario
+        valid_options (list): Lista de opciones válidas
+        
+    Returns:
+        str: Opción válida seleccionada por el usuario
+    """
+    while True:
+        choice = input(prompt).strip()
+        if choice in valid_options:
+            return choice
+        print("⚠️  Opción no válida. Por favor, intente nuevamente.")
+
+def shutdown_option():
+    """
+    Configura las opciones de apagado automático y método de compresión.
+    
+    Returns:
+        tuple: (shutdown_option, compression_option)
+    """
+    print("¡Gracias por usar Compress MP4! Los archivos se guardarán en el mismo "
+          "directorio que los archivos de origen.")
+    
+    # Opción de apagado automático
+    shutdown = get_user_input(
+        "¿Desea que el Mac se apague cuando finalice la compresión?\n"
+        " [1] SÍ - Apagar automáticamente\n"
+        " [2] NO - Mantener encendido\n"
+        " : ",
+        ['1', '2']
+    )
+
+    # Verificar permisos de administrador para apagado
+    if shutdown == '1' and os.geteuid() != 0:
+        print("⚠️  Para apagar el Mac automáticamente necesitas ejecutar este script "
+              "como superusuario.\n💡 Intenta ejecutar: sudo python3 compress.py")
+        sys.exit(1)
+
+    # Método de selección de archivos
+    compression_option = get_user_input(
+        "¿Cómo desea seleccionar los videos a comprimir?\n"
+        " [1] Ingresar rutas de videos individuales\n"
+        " [2] Procesar todos los videos de un directorio\n"
+        " : ",
+        ['1', '2']
+    )
+            
+    return shutdown, compression_option
+
+def display_statistics():
+    """
+    Muestra estadísticas finales del proceso de compresión en consola.
+    Incluye métricas de rendimiento, ahorro de espacio y consumo energético real.
+    Reproduce sonido de notificación y calcula métricas de rendimiento.
+    """
+    def print_rejected():
+        if stats.rejected:
+            print(f"🛑 Salidas rechazadas por la verificación (originales conservados): {len(stats.rejected)}")
+            for source_path, reason in stats.rejected:
+                print(f"   {os.path.basename(source_path)}: {reason}")
+
+    if stats.total_videos == 0:
+        print("ℹ️  No se comprimió ningún video.")
+        if stats.skipped_videos:
+            print(f"⏭️  Videos omitidos (ya eficientes): {stats.skipped_videos}")
+        if stats.failed_videos:
+            print(f"❌ Videos con error: {stats.failed_videos}")
+        print_rejected()
+        return
+
+    # Calcular tiempo total en formato legible (tiempo real si hubo lotes en paralelo)
+    elapsed_time = stats.wall_time or stats.total_compression_time + stats.stream_copy_time
+    hours, remainder = divmod(elapsed_time, 3600)
+    minutes, _ = divmod(remainder, 60)
+
+    # Calcular estadísticas de compresión
+    if stats.total_original_size > 0:
+        space_saved = stats.total_original_size - stats.total_compressed_size
+        percent_space_saved = (space_saved / stats.total_original_size) * 100
+        space_saved_gb = space_saved / (1024 ** 3)
+    else:
+        percent_space_saved = space_saved_gb = 0
+
+    # Reproducir sonido de notificación
+    try:
+        os.system('afplay ok-notification-alert.wav')
+    except:
+        pass
+    
+    # Mostrar estadísticas en consola
+    print("\n" + "="*50)
+    print("🎬 COMPRESIÓN COMPLETADA EXITOSAMENTE")
+    print("="*50)
+    print(f"📊 Videos procesados: {stats.total_videos}")
+    if stats.failed_videos:
+        print(f"❌ Videos con error: {stats.failed_videos}")
+    print_rejected()
+    print(f"⏱️  Tiempo total: {int(hours)}h {int(minutes)}m")
+    if stats.wall_time and stats.total_compression_time > stats.wall_time * 1.05:
+        enc_hours, enc_remainder = divmod(stats.total_compression_time, 3600)
+        print(f"🧵 Tiempo de codificación acumulado: {int(enc_hours)}h {int(enc_remainder // 60)}m")
+    print(f"📉 Reducción de tamaño: {percent_space_saved:.1f}%")
+    print(f"💾 Espacio ahorrado: {space_saved_gb:.2f} GB")
+    if stats.skipped_videos:
+        avoided_hours, avoided_remainder = divmod(stats.avoided_encode_time(), 3600)
+        print(f"⏭️  Videos omitidos (ya eficientes): {stats.skipped_videos} "
+              f"({stats.skipped_size / (1024 ** 3):.2f} GB)")
+        print(f"⏳ Tiempo de codificación evitado: ~{int(avoided_hours)}h {int(avoided_remainder // 60)}m")
+    
+    if stats.deduplicated_videos:
+        print(f"♻️  Copias idénticas reutilizadas: {stats.deduplicated_videos}")
+    if stats.remuxed_videos or stats.audio_copied_videos:
+        print(f"⏩ Sin recodificar el video: {stats.remuxed_videos} remux, "
+              f"{stats.audio_copied_videos} con audio recodificado "
+              f"({stats.stream_copy_time / 60:.1f} min)")
+    if stats.io_hidden_time or stats.io_wait_time:
+        print(f"📦 E/S ocultada por la precarga: {stats.io_hidden_time / 60:.1f} min "
+              f"(espera restante: {stats.io_wait_time / 60:.1f} min)")
+    
+    # Nueva estadística: Consumo energético
+    if stats.total_energy_consumed > 0:
+        energy_wh = stats.total_energy_consumed * 1000  # Convertir kWh a Wh
+        print(f"⚡ Energía consumida: {stats.total_energy_consumed:.4f} kWh ({energy_wh:.2f} Wh)")
+        
+        # Eficiencia energética por video
+        avg_energy_per_video = energy_wh / stats.total_videos
+        print(f"🔋 Promedio por video: {avg_energy_per_video:.2f} Wh")
+    else:
+        print("⚠️  Consumo energético no monitoreado (requiere RAPL legible o powermetrics con sudo)")
+
+    # Cumplimiento del objetivo de tamaño
+    if size_budget is not None and size_budget.input_done:
+        met = size_budget.output_done <= size_budget.target * (1 + SIZE_TOLERANCE)
+        print(f"🎯 Objetivo de tamaño: {size_budget.output_done / (1024 ** 3):.2f} GB de "
+              f"{size_budget.target / (1024 ** 3):.2f} GB {'✅' if met else '❌'}")
+
+    # Efectividad de la caché de análisis
+    if probe_cache.hits or probe_cache.misses:
+        print(f"🔎 Caché de análisis: {probe_cache.hits} aciertos / {probe_cache.misses} fallos")
+    if source_disposer.trashed:
+        print(f"🗑️  Originales enviados a la papelera: {source_disposer.trashed} "
+              f"(en {source_disposer.batches} lotes)")
+    if results_ledger is not None and results_ledger.recorded:
+        print(f"📚 Historial: {results_ledger.recorded} trabajos registrados en {results_ledger.path}")
+    
+    print("="*50)
+
+# Extensiones de video a procesar (comparación sin distinguir mayúsculas)
+VIDEO_EXTENSIONS = ('.mp4',)
+
+# Sufijo de las salidas generadas por este script
+COMPRESSED_SUFFIX = '_compressed'
+
+# Prefijo de los directorios de trabajo temporales (segmentos, pruebas de ajuste,
+# muestras) que el script crea junto a los videos; los escaneos no entran en ellos
+WORK_DIR_PREFIX = '.compress_'
+
+
+def is_video_name(name, extensions=VIDEO_EXTENSIONS):
+    """
+    Indica si un nombre de archivo es un video a procesar: extensión aceptada
+    (sin distinguir mayúsculas) y no es una salida '_compressed' de este script.
+    """
+    base_name, extension = os.path.splitext(name)
+    return extension.lower() in extensions and not base_name.lower().endswith(COMPRESSED_SUFFIX)
+
+
+def is_work_dir(name):
+    """Indica si un nombre de directorio es uno de los directorios de trabajo de este script."""
+    return name.startswith(WORK_DIR_PREFIX)
+
+
+def iter_videos(directory, extensions=VIDEO_EXTENSIONS):
+    """
+    Recorre un directorio de forma incremental y produce las rutas de video a medida
+    que las encuentra, para que la compresión empiece con el primer hallazgo.
+
+    - Usa os.scandir (sin stat extra por entrada en la mayoría de sistemas)
+    - Compara extensiones sin distinguir mayúsculas ('.MP4' también cuenta)
+    - Omite las salidas '_compressed' y los directorios de trabajo de este script
+    - Sigue enlaces simbólicos a directorios, pero nunca visita dos veces el mismo
+      directorio (dispositivo, inodo), por lo que los bucles de enlaces se ignoran
+
+    Args:
+        directory (str): Ruta del directorio a escanear
+        extensions (tuple): Extensiones aceptadas, en minúsculas
+
+    Yields:
+        str: Ruta de cada video encontrado
+    """
+    try:
+        root_stat = os.stat(directory)
+    except OSError:
+        return
+    visited = {(root_stat.st_dev, root_stat.st_ino)}
+    pending = [directory]
+
+    while pending:
+        current = pending.pop()
+        subdirs = []
+        try:
+            with os.scandir(current) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir():
+                            if is_work_dir(entry.name):
+                                continue  # Segmentos o muestras de un trabajo en curso
+                            st = entry.stat()
+                            key = (st.st_dev, st.st_ino)
+                            if key not in visited:
+                                visited.add(key)
+                                subdirs.append(entry.path)
+                        elif entry.is_file() and is_video_name(entry.name, extensions):
+                            yield entry.path
+                    except OSError:
+                        continue  # Enlace roto o entrada inaccesible
+        except OSError:
+            continue  # Directorio sin permisos de lectura
+        # Visitar los subdirectorios en el orden en que aparecieron
+        pending.extend(reversed(subdirs))
+
+
+def get_all_videos(directory):
+    """
+    Busca recursivamente todos los videos en un directorio.
+    Omite las salidas '_compressed' de ejecuciones anteriores (p. ej. a medio escribir).
+    
+    Args:
+        directory (str): Ruta del directorio a escanear
+        
+    Returns:
+        list: Lista de rutas de archivos de video encontrados
+    """
+    return list(iter_videos(directory))
+
+# --- Vigilancia de Carpetas de Ingesta ---
+
+class FolderWatcher:
+    """
+    Vigila una carpeta de ingesta y produce los videos nuevos cuando terminan de copiarse.
+
+    - En Linux usa inotify (vía ctypes, sin dependencias); en otros sistemas, o si
+      inotify no está disponible, recorre la carpeta cada poll_interval segundos.
+    - Un archivo se considera estable cuando su tamaño y mtime no cambian durante
+      stable_seconds.
+    - Cada ruta se entrega una sola vez mientras exista; al borrarse o moverse a la
+      papelera se olvida, así la memoria no crece con el tiempo.
+    - En reposo (sin archivos pendientes) el hilo queda bloqueado en select() sin
+      timeout, por lo que no consume CPU.
+    """
+
+    # Constantes de <sys/inotify.h>
+    IN_MODIFY = 0x00000002
+    IN_ATTRIB = 0x00000004
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    IN_ISDIR = 0x40000000
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+    WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO
+                  | IN_CREATE | IN_DELETE)
+
+    def __init__(self, directory, stable_seconds=10.0, poll_interval=5.0, use_inotify=True):
+        self.directory = os.path.abspath(directory)
+        self.stable_seconds = stable_seconds
+        self.poll_interval = poll_interval
+        self.use_inotify = use_inotify
+        self.backend = None
+        self._candidates = {}   # ruta -> [tamaño, mtime_ns, instante del último cambio]
+        self._queued = set()    # rutas ya entregadas que siguen existiendo
+        self._watches = {}      # descriptor de inotify -> directorio
+        self._fd = None
+        self._libc = None
+        self._stop = threading.Event()
+        self._wake_r, self._wake_w = os.pipe()
+
+    def stop(self):
+        """Detiene la vigilancia de inmediato (seguro desde otro hilo)."""
+        self._stop.set()
+        try:
+            os.write(self._wake_w, b'x')
+        except OSError:
+            pass
+
+    # --- Seguimiento de estabilidad ---
+
+    def _track(self, path):
+        """Registra un archivo como candidato (o reinicia su ventana de estabilidad)."""
+        if path in self._queued:
+            return
+        candidate = self._candidates.get(path)
+        if candidate is not None:
+            candidate[2] = time.monotonic()
+            return
+        try:
+            st = os.stat(path)
+        except OSError:
+            return
+        self._candidates[path] = [st.st_size, st.st_mtime_ns, time.monotonic()]
+
+    def _forget(self, path):
+        """Olvida una ruta borrada o movida fuera de la carpeta."""
+        self._candidates.pop(path, None)
+        self._queued.discard(path)
+
+    def _collect_stable(self):
+        """Retorna los candidatos cuyo tamaño y mtime no cambiaron durante stable_seconds."""
+        now = time.monotonic()
+        ready = []
+        for path, candidate in list(self._candidates.items()):
+            if now - candidate[2] < self.stable_seconds:
+                continue
+            try:
+                st = os.stat(path)
+            except OSError:
+                del self._candidates[path]
+                continue
+            if (st.st_size, st.st_mtime_ns) != (candidate[0], candidate[1]) or st.st_size == 0:
+                self._candidates[path] = [st.st_size, st.st_mtime_ns, now]
+                continue
+            del self._candidates[path]
+            self._queued.add(path)
+            ready.append(path)
+        return ready
+
+    def _next_timeout(self):
+        """Segundos hasta la próxima comprobación de estabilidad (None = esperar eventos)."""
+        if not self._candidates:
+            return None
+        oldest_change = min(candidate[2] for candidate in self._candidates.values())
+        return max(0.05, oldest_change + self.stable_seconds - time.monotonic())
+
+    # --- Backend inotify ---
+
+    def _init_inotify(self):
+        """Inicializa inotify; retorna False si no está disponible en el sistema."""
+        if not self.use_inotify or not sys.platform.startswith('linux'):
+            return False
+        try:
+            self._libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+            fd = self._libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        except (OSError, AttributeError):
+            return False
+        if fd < 0:
+            return False
+        self._fd = fd
+        self._add_tree(self.directory)
+        return bool(self._watches)
+
+    def _add_tree(self, directory):
+        """Agrega vigilancia a un directorio y sus subdirectorios, y registra sus videos."""
+        if is_work_dir(os.path.basename(directory)):
+            return
+        for root, dirs, files in os.walk(directory):
+            dirs[:] = [name for name in dirs if not is_work_dir(name)]
+            wd = self._libc.inotify_add_watch(self._fd, os.fsencode(root), self.WATCH_MASK)
+            if wd >= 0:
+                self._watches[wd] = root
+            for name in files:
+                if is_video_name(name):
+                    self._track(os.path.join(root, name))
+
+    def _read_events(self):
+        """Procesa los eventos pendientes de inotify."""
+        while True:
+            try:
+                data = os.read(self._fd, 65536)
+            except BlockingIOError:
+                return
+            if not data:
+                return
+            offset = 0
+            while offset + 16 <= len(data):
+                wd, mask, _, length = struct.unpack_from('iIII', data, offset)
+                name = data[offset + 16:offset + 16 + length].split(b'\0', 1)[0]
+                offset += 16 + length
+
+                if mask & self.IN_Q_OVERFLOW:
+                    # Se perdieron eventos: recorrer de nuevo la carpeta
+                    for path in iter_videos(self.directory):
+                        self._track(path)
+                    continue
+                if mask & self.IN_IGNORED:
+                    self._watches.pop(wd, None)
+                    continue
+                base = self._watches.get(wd)
+                if base is None or not name:
+                    continue
+                path = os.path.join(base, os.fsdecode(name))
+
+                if mask & self.IN_ISDIR:
+                    if mask & (self.IN_CREATE | self.IN_MOVED_TO):
+                        self._add_tree(path)
+                elif mask & (self.IN_DELETE | self.IN_MOVED_FROM):
+                    self._forget(path)
+                elif is_video_name(os.fsdecode(name)):
+                    self._track(path)
+
+    def _watch_inotify(self):
+        try:
+            while not self._stop.is_set():
+                for path in self._collect_stable():
+                    yield path
+                readable, _, _ = select.select([self._fd, self._wake_r], [], [], self._next_timeout())
+                if self._fd in readable:
+                    self._read_events()
+        finally:
+            os.close(self._fd)
+            self._fd = None
+
+    # --- Backend por sondeo ---
+
+    def _watch_polling(self):
+        while not self._stop.is_set():
+            present = set(iter_videos(self.directory))
+            self._queued &= present
+            for path in list(self._candidates):
+                if path not in present:
+                    del self._candidates[path]
+            for path in present:
+                if path not in self._candidates:
+                    self._track(path)
+            for path in self._collect_stable():
+                yield path
+            self._stop.wait(self.poll_interval)
+
+    def watch(self):
+        """
+        Inicia la vigilancia y retorna un generador sin fin de videos estables,
+        que termina solo al llamar a stop(). Los videos que ya estaban en la
+        carpeta también se entregan cuando se comprueba que están estables.
+
+        Returns:
+            generator: Rutas de los videos nuevos listos para comprimir
+        """
+        if self._init_inotify():
+            self.backend = 'inotify'
+            return self._watch_inotify()
+        self.backend = 'polling'
+        return self._watch_polling()
+
+
+def prepare_paths(source_path):
+    """
+    Limpia y verifica la ruta de un video y genera la ruta de su archivo comprimido.
+
+    Args:
+        source_path (str): Ruta del video tal como la ingresó el usuario o el escaneo
+
+    Returns:
+        tuple: (ruta absoluta de origen, ruta de destino), o (None, None) si no existe
+    """
+    # Limpiar y verificar ruta del archivo
+    source_path = source_path.replace('\\', '')
+    if not os.path.isfile(source_path):
+        print(f"⚠️  Archivo no encontrado: {source_path}. Omitiendo...")
+        return None, None
+
+    # Generar ruta de destino para archivo comprimido
+    source_path = os.path.abspath(source_path)
+    dir_path = os.path.dirname(source_path)
+    base_name, extension = os.path.splitext(os.path.basename(source_path))
+    return source_path, os.path.join(dir_path, f"{base_name}{COMPRESSED_SUFFIX}{extension}")
+
+
+# --- Control de Admisión por Espacio en Disco ---
+
+# Bits por píxel esperados en la salida de cada modo (x264 CRF 26 ≈ 0.05 bpp a 1080p)
+OUTPUT_BPP_ESTIMATE = {'cpu': 0.06, 'gpu': 0.08}
+# Margen de seguridad sobre el tamaño estimado
+SPACE_SAFETY_MARGIN = 1.25
+# Salidas observadas necesarias para estimar con la proporción real del lote
+SPACE_MIN_OBSERVATIONS = 3
+
+
+def estimate_output_size(info, mode, original_size, observed_ratio=None):
+    """
+    Estima cuánto ocupará la salida de un video, con margen de seguridad.
+
+    Con suficientes salidas ya medidas usa la proporción salida/origen observada; si no,
+    el bitrate esperado del modo a la resolución y duración de salida. Nunca supera el
+    tamaño del origen por más que el margen.
+
+    Returns:
+        int: Bytes estimados
+    """
+    if observed_ratio is not None:
+        estimate = original_size * observed_ratio
+    elif info and info.get('duration') and info.get('width'):
+        width, height, fps = output_geometry(info, mode)
+        video_bits = OUTPUT_BPP_ESTIMATE.get(mode, 0.06) * width * height * fps * info['duration']
+        estimate = min(original_size, video_bits / 8 + AUDIO_BITRATE_KBPS * 1000 / 8 * info['duration'])
+    else:
+        estimate = original_size
+    return int(estimate * SPACE_SAFETY_MARGIN)
+
+
+class SpaceGate:
+    """
+    Admisión de trabajos según el espacio libre del sistema de archivos de destino.
+
+    Antes de codificar, cada trabajo reserva el tamaño estimado de su salida en el
+    sistema de archivos del destino. Un trabajo espera mientras el espacio libre, menos
+    lo que aún falta por escribir de las salidas en curso, quedaría por debajo de
+    min_free. Las reservas se liberan cuando el original del trabajo sale de la cola de
+    la papelera (SourceDisposer.when_disposed), o al terminar si no se descarta, y las
+    salidas reales afinan las estimaciones siguientes.
+    Si un trabajo no cabe ni siquiera sin otros en curso, se rechaza en lugar de esperar.
+    """
+
+    def __init__(self, min_free, poll_interval=30.0):
+        self.min_free = min_free
+        self.poll_interval = poll_interval
+        self._reservations = []
+        self._ratios = {}     # modo -> [proporciones salida/origen observadas]
+        self._cond = threading.Condition()
+
+    def estimate(self, source_path, mode, target_bytes=None):
+        """Tamaño a reservar para la salida de un video."""
+        original_size = os.path.getsize(source_path)
+        if target_bytes:
+            return int(target_bytes * (1 + SIZE_TOLERANCE))
+        with self._cond:
+            ratios = self._ratios.get(mode, [])
+            observed = sum(ratios) / len(ratios) if len(ratios) >= SPACE_MIN_OBSERVATIONS else None
+        return estimate_output_size(probe_video(source_path), mode, original_size, observed)
+
+    def _outstanding(self, device):
+        """Bytes reservados que las salidas en curso de un dispositivo aún no escribieron; requiere el lock."""
+        total = 0
+        for reservation in self._reservations:
+            if reservation['device'] != device:
+                continue
+            try:
+                written = os.path.getsize(reservation['dest'])
+            except OSError:
+                written = 0
+            total += max(0, reservation['bytes'] - written)
+        return total
+
+    def admit(self, dest_path, size, console=None):
+        """
+        Reserva espacio para una salida, esperando si no hay suficiente.
+
+        Returns:
+            dict: Reserva para release(), o None si la salida no cabe en el volumen
+        """
+        console = console or JobConsole()
+        dest_dir = os.path.dirname(dest_path)
+        device = os.stat(dest_dir).st_dev
+        reported = False
+        with self._cond:
+            while True:
+                free = shutil.disk_usage(dest_dir).free
+                available = free - self._outstanding(device) - self.min_free
+                if size <= available:
+                    reservation = {'device': device, 'dest': dest_path, 'bytes': size}
+                    self._reservations.append(reservation)
+                    return reservation
+                if not any(r['device'] == device for r in self._reservations):
+                    console.log(f"\n❌ Espacio insuficiente en {dest_dir}: la salida necesita "
+                                f"~{size / 1024 ** 3:.2f} GB y hay {free / 1024 ** 3:.2f} GB libres "
+                                f"(mínimo {self.min_free / 1024 ** 3:.2f} GB)")
+                    return None
+                if not reported:
+                    with JobConsole._print_lock:
+                        print(f"⏸️  Esperando espacio en {dest_dir} para {os.path.basename(dest_path)}: "
+                              f"necesita ~{size / 1024 ** 3:.2f} GB, disponibles {max(0, available) / 1024 ** 3:.2f} GB")
+                    reported = True
+                self._cond.wait(self.poll_interval)
+
+    def release(self, reservation, mode=None, result=None):
+        """Libera una reserva y registra la proporción real de la salida, si la hubo."""
+        with self._cond:
+            if reservation in self._reservations:
+                self._reservations.remove(reservation)
+            if mode and result and not result.get('skipped') and not result.get('deduplicated') \
+                    and result.get('original_size'):
+                self._ratios.setdefault(mode, []).append(result['compressed_size'] / result['original_size'])
+            self._cond.notify_all()
+
+
+# --- Control de Espacio Global (se configura en el flujo principal) ---
+space_gate = None
+
+
+# --- Deduplicación de Copias Idénticas ---
+
+# Huella rápida: tamaño + hash de FINGERPRINT_SAMPLES bloques repartidos por el archivo
+FINGERPRINT_BLOCK = 64 * 1024
+FINGERPRINT_SAMPLES = 16
+
+
+def file_fingerprint(path):
+    """
+    Calcula la huella rápida de un archivo (tamaño y hash de bloques muestreados).
+    La huella se guarda en la caché de análisis y solo se recalcula si el archivo cambia.
+    Retorna: str 'tamaño:hash'.
+    """
+    cached = probe_cache.get_extra(path, 'fingerprint')
+    if cached:
+        return cached
+    size = os.path.getsize(path)
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        if size <= FINGERPRINT_BLOCK * FINGERPRINT_SAMPLES:
+            digest.update(f.read())
+        else:
+            step = (size - FINGERPRINT_BLOCK) / (FINGERPRINT_SAMPLES - 1)
+            for i in range(FINGERPRINT_SAMPLES):
+                f.seek(int(i * step))
+                digest.update(f.read(FINGERPRINT_BLOCK))
+    fingerprint = f"{size}:{digest.hexdigest()}"
+    probe_cache.put_extra(path, 'fingerprint', fingerprint)
+    return fingerprint
+
+
+def file_hash(path):
+    """
+    Calcula el hash completo (BLAKE2b) de un archivo para confirmar duplicados.
+    También se guarda en la caché de análisis.
+    Retorna: str con el hash hexadecimal.
+    """
+    cached = probe_cache.get_extra(path, 'content_hash')
+    if cached:
+        return cached
+    digest = hashlib.blake2b()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    content_hash = digest.hexdigest()
+    probe_cache.put_extra(path, 'content_hash', content_hash)
+    return content_hash
+
+
+def clone_file(source_path, dest_path):
+    """
+    Crea dest_path con el contenido de source_path usando el método más barato:
+    reflink (copia compartida copy-on-write, en APFS, Btrfs o XFS), enlace duro
+    (mismo sistema de archivos) o copia completa.
+
+    Returns:
+        str: Método usado ('reflink', 'hardlink' o 'copy')
+    """
+    try:
+        if sys.platform == 'darwin':
+            libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+            if libc.clonefile(os.fsencode(source_path), os.fsencode(dest_path), 0) == 0:
+                return 'reflink'
+        elif sys.platform.startswith('linux'):
+            import fcntl
+            FICLONE = 0x40049409
+            with open(source_path, 'rb') as src, open(dest_path, 'wb') as dst:
+                fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+            return 'reflink'
+    except (OSError, AttributeError):
+        pass
+    if os.path.exists(dest_path):
+        os.remove(dest_path)
+    try:
+        os.link(source_path, dest_path)
+        return 'hardlink'
+    except OSError:
+        shutil.copy2(source_path, dest_path)
+        return 'copy'
+
+
+class DuplicateIndex:
+    """
+    Agrupa las copias idénticas de un lote para codificar cada contenido una sola vez.
+
+    El primer video de cada huella es el principal y se codifica normalmente; las
+    copias que llegan después esperan su resultado y reutilizan la salida. Si el
+    principal falla, la siguiente copia pasa a ser el principal y se codifica. Con verify
+    se confirma además el hash completo antes de tratar un archivo como copia (si el
+    original principal ya no existe para compararlo, la copia se codifica aparte); los
+    hashes se calculan fuera del lock, así resolve no espera a la lectura de un archivo.
+    """
+
+    def __init__(self, verify=False):
+        self.verify = verify
+        self._groups = {}    # huella -> [grupos]
+        self._lock = threading.Lock()
+
+    def claim(self, source_path, dest_path):
+        """
+        Clasifica un video del lote.
+
+        Returns:
+            tuple: (rol, grupo) con rol 'primary' (codificarlo y luego llamar a
+                   resolve), 'pending' (copia registrada; la resuelve el principal) o
+                   'ready' (el principal ya terminó; el grupo trae su resultado)
+        """
+        fingerprint = file_fingerprint(source_path)
+        content_hash = None
+        while True:
+            unhashed = None  # Grupo cuyo hash hay que calcular antes de seguir comparando
+            with self._lock:
+                for group in self._groups.get(fingerprint, []):
+                    if group['done'] and group['result'] is None:
+                        continue  # Principal fallido sin copias: este video se codifica aparte
+                    if self.verify:
+                        if group['hash'] is None and os.path.isfile(group['source']):
+                            unhashed = group
+                            break
+                        if group['hash'] is None:
+                            continue
+                        if content_hash is None:
+                            break
+                        if content_hash != group['hash']:
+                            continue
+                    if group['done']:
+                        return 'ready', group
+                    group['copies'].append((source_path, dest_path))
+                    return 'pending', group
+                else:
+                    group = {'source': source_path, 'hash': content_hash, 'done': False,
+                             'result': None, 'copies': []}
+                    self._groups.setdefault(fingerprint, []).append(group)
+                    return 'primary', group
+
+            # Leer archivos completos sin el lock y volver a comparar con los grupos actuales
+            if unhashed is not None:
+                group_hash = file_hash(unhashed['source'])
+                with self._lock:
+                    if unhashed['hash'] is None:
+                        unhashed['hash'] = group_hash
+            else:
+                content_hash = file_hash(source_path)
+
+    def resolve(self, group, result):
+        """
+        Registra el resultado del video principal de un grupo. Si falló y hay copias
+        esperando, la primera pasa a ser el principal en lugar de fallar con él.
+
+        Returns:
+            tuple: (copias (origen, destino) que reutilizan la salida, copia promovida a
+                   principal (origen, destino) que hay que codificar, o None)
+        """
+        with self._lock:
+            if result is None and group['copies']:
+                promoted = group['copies'].pop(0)
+                group['source'] = promoted[0]
+                return [], promoted
+            group['done'] = True
+            group['result'] = result
+            copies, group['copies'] = group['copies'], []
+            return copies, None
+
+
+def reuse_output(group, source_path, dest_path, journal=None, console=None):
+    """
+    Resuelve una copia idéntica con el resultado de su video principal sin codificarla.
+
+    Returns:
+        dict: Resultado equivalente al de compress_video (con 'deduplicated': True) o
+              None si el principal falló o no se pudo crear la salida
+    """
+    console = console or JobConsole()
+    primary = group['result']
+    original_size = os.path.getsize(source_path)
+    name = os.path.basename(source_path)
+    if primary is None:
+        console.log(f"\n❌ {name}: copia idéntica de {os.path.basename(group['source'])}, que falló")
+        if journal:
+            journal.record(source_path, 'failed', error='duplicado de un video fallido')
+        return None
+    if primary.get('skipped'):
+        reason = f"copia idéntica de {os.path.basename(group['source'])} ({primary['reason']})"
+        console.log(f"\n⏭️  Omitido: {name} — {reason}")
+        if journal:
+            journal.record(source_path, 'skipped', original_size=original_size)
+        return {'source': source_path, 'skipped': True, 'reason': reason,
+                'original_size': original_size, 'work': primary.get('work', 0.0)}
+
+    try:
+        method = clone_file(primary['dest'], dest_path)
+    except OSError as e:
+        console.log(f"\n❌ {name}: no se pudo reutilizar la salida de {os.path.basename(group['source'])}: {e}")
+        if journal:
+            journal.record(source_path, 'failed', error=str(e))
+        return None
+    compressed_size = os.path.getsize(dest_path)
+    console.log(f"\n♻️  {name}: copia idéntica de {group['source']}, "
+                f"salida reutilizada ({method})")
+    if journal:
+        journal.record(source_path, 'verified', sync=True, dest=dest_path,
+                       original_size=original_size, compressed_size=compressed_size,
+                       elapsed=0.0, energy=0.0, work=0.0, deduplicated_from=group['source'])
+    emit_progress('deduplicated', source_path, dest=dest_path, original_size=original_size,
+                  compressed_size=compressed_size, primary=group['source'], method=method)
+    source_disposer.submit(source_path, journal)
+    return {
+        'source': source_path,
+        'dest': dest_path,
+        'original_size': original_size,
+        'compressed_size': compressed_size,
+        'elapsed': 0.0,
+        'energy': 0.0,
+        'work': 0.0,
+        'deduplicated': True,
+    }
+
+
+# --- Historial de Resultados y Predicción ---
+
+# Trabajos recientes del historial que alimentan el predictor (por modo y backend)
+LEDGER_HISTORY = 500
+# Mediciones mínimas de un grupo para confiar en su mediana
+LEDGER_MIN_SAMPLES = 3
+
+
+def height_bucket(height):
+    """Clase de resolución de salida (480, 720, 1080 o 2160) para agrupar mediciones."""
+    for bucket in (480, 720, 1080):
+        if height <= bucket:
+            return bucket
+    return 2160
+
+
+class ResultsLedger:
+    """
+    Historial persistente (SQLite) de todos los trabajos codificados.
+
+    Cada fila guarda los metadatos del origen, los ajustes, el tiempo de codificación,
+    los fps, la proporción de salida, la energía y cuántos trabajos corrían a la vez;
+    sirve para consultar ejecuciones pasadas y para predecir las futuras (EncodePredictor).
+    Se escribe una fila al terminar cada trabajo, así que varios procesos pueden
+    compartir el archivo.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY,
+            finished REAL, host TEXT, source TEXT, status TEXT,
+            mode TEXT, encoder TEXT, preset TEXT, quality REAL, bitrate INTEGER, threads INTEGER,
+            parallel INTEGER,
+            codec TEXT, width INTEGER, height INTEGER, fps REAL, duration REAL, source_bitrate INTEGER,
+            original_size INTEGER, compressed_size INTEGER, ratio REAL,
+            work REAL, elapsed REAL, encode_fps REAL, energy REAL
+        )"""
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(CACHE_DIR, 'results.sqlite')
+        self.host = socket.gethostname()
+        self.recorded = 0
+        self._db = None
+        self._lock = threading.Lock()
+        self._running = []        # Marcas de los trabajos en curso (ver begin)
+        self._predictors = {}
+        self._warned = False
+
+    def _connect(self):
+        """Abre la base la primera vez que se usa; requiere el lock."""
+        if self._db is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._db = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            self._db.execute(self.SCHEMA)
+        return self._db
+
+    def begin(self):
+        """
+        Marca el inicio de un trabajo. La marca registra el máximo de trabajos simultáneos
+        durante su vida, porque el tiempo de un trabajo depende de con cuántos comparte la máquina.
+        """
+        with self._lock:
+            token = {'parallel': 0}
+            self._running.append(token)
+            for running in self._running:
+                running['parallel'] = max(running['parallel'], len(self._running))
+            return token
+
+    def finish(self, token, source_path, info, mode, encoder, status, original_size,
+               compressed_size=None, elapsed=None, energy=None, tuning=None, threads=0):
+        """
+        Registra el resultado de un trabajo iniciado con begin ('done', 'failed', 'rejected'
+        si la salida no pasó la verificación, 'remux' / 'copy' para las copias de flujos o
+        'skipped' si un remux no redujo el tamaño; el predictor solo usa 'done').
+        Un error de la base se avisa una vez y no interrumpe la codificación.
+        """
+        info = info or {}
+        tuning = tuning or {}
+        work = encode_work(info, mode) if info else 0.0
+        _, _, out_fps = output_geometry(info, mode) if info else (0, 0, 0)
+        frames = (info.get('duration') or 0) * out_fps
+        row = {
+            'finished': time.time(), 'host': self.host, 'source': os.path.abspath(source_path),
+            'status': status, 'mode': mode, 'encoder': encoder.label,
+            'preset': tuning.get('preset') or encoder.preset, 'quality': tuning.get('quality'),
+            'bitrate': tuning.get('bitrate'), 'threads': threads, 'parallel': token['parallel'],
+            'codec': info.get('codec'), 'width': info.get('width'), 'height': info.get('height'),
+            'fps': info.get('fps'), 'duration': info.get('duration'),
+            'source_bitrate': info.get('bitrate'), 'original_size': original_size,
+            'compressed_size': compressed_size,
+            'ratio': compressed_size / original_size if compressed_size and original_size else None,
+            'work': work, 'elapsed': elapsed,
+            'encode_fps': frames / elapsed if frames and elapsed else None,
+            'energy': energy,
+        }
+        with self._lock:
+            if token in self._running:
+                self._running.remove(token)
+            try:
+                db = self._connect()
+                db.execute(f"INSERT INTO jobs ({', '.join(row)}) VALUES ({', '.join('?' * len(row))})",
+                           list(row.values()))
+                db.commit()
+                self.recorded += 1
+                self._predictors.clear()
+            except (sqlite3.Error, OSError) as e:
+                if not self._warned:
+                    self._warned = True
+                    print(f"⚠️  No se pudo escribir el historial de resultados: {e}")
+
+    def rows(self, mode, encoder_label, limit=LEDGER_HISTORY):
+        """Trabajos correctos más recientes de esta máquina para un modo y backend."""
+        with self._lock:
+            try:
+                db = self._connect()
+                cursor = db.execute(
+                    "SELECT codec, height, width, fps, duration, parallel, work, elapsed, "
+                    "original_size, compressed_size FROM jobs WHERE status = 'done' AND host = ? "
+                    "AND mode = ? AND encoder = ? AND work > 0 AND elapsed > 0 "
+                    "ORDER BY finished DESC LIMIT ?",
+                    (self.host, mode, encoder_label, limit))
+                names = [column[0] for column in cursor.description]
+                return [dict(zip(names, values)) for values in cursor.fetchall()]
+            except (sqlite3.Error, OSError):
+                return []
+
+    def predictor(self, mode, encoder_label):
+        """Predictor del modo y backend (se reconstruye al registrar trabajos nuevos)."""
+        key = (mode, encoder_label)
+        predictor = self._predictors.get(key)
+        if predictor is None:
+            predictor = self._predictors[key] = EncodePredictor(self.rows(mode, encoder_label), mode)
+        return predictor
+
+
+class EncodePredictor:
+    """
+    Predice el tiempo de codificación y el tamaño de salida de un video a partir del historial.
+
+    Agrupa las mediciones por códec de origen, clase de resolución de salida y trabajos
+    simultáneos, y usa la mediana del grupo más específico con al menos LEDGER_MIN_SAMPLES
+    mediciones:
+      - tiempo: segundos por unidad de trabajo (encode_work); si no hay mediciones con el
+        mismo paralelismo, el costo por trabajo simultáneo escalado al paralelismo pedido
+      - tamaño: bits por píxel de salida (incluye audio y contenedor), limitado al origen
+    Sin historial suficiente usa DEFAULT_ENCODE_COST y OUTPUT_BPP_ESTIMATE.
+    """
+
+    def __init__(self, rows, mode):
+        self.mode = mode
+        self.samples = len(rows)
+        self._cost = {}        # clave → segundos por unidad de trabajo (mismo paralelismo)
+        self._slot_cost = {}   # clave → segundos por unidad de trabajo y trabajo simultáneo
+        self._bpp = {}         # clave → bits por píxel de salida
+        for row in rows:
+            width, height, fps = output_geometry(row, mode)
+            codec, bucket, parallel = row['codec'], height_bucket(height), max(1, row['parallel'] or 1)
+            cost = row['elapsed'] / row['work']
+            for key in ((codec, bucket), (codec,), ()):
+                self._cost.setdefault(key + (parallel,), []).append(cost)
+                self._slot_cost.setdefault(key, []).append(cost / parallel)
+                pixels = width * height * fps * (row['duration'] or 0)
+                if pixels and row['compressed_size']:
+                    self._bpp.setdefault(key, []).append(row['compressed_size'] * 8 / pixels)
+
+    @staticmethod
+    def _median(groups, keys):
+        """Mediana del primer grupo con mediciones suficientes, o None."""
+        for key in keys:
+            values = groups.get(key)
+            if values and len(values) >= LEDGER_MIN_SAMPLES:
+                return statistics.median(values)
+        return None
+
+    def predict(self, info, original_size, parallel=1):
+        """
+        Predice un video con metadatos info (probe_video).
+
+        Returns:
+            dict: seconds (tiempo de codificación con 'parallel' trabajos simultáneos),
+                  output_size (bytes) y measured (True si ambas cifras salen del historial)
+        """
+        width, height, fps = output_geometry(info, self.mode)
+        codec, bucket = info.get('codec'), height_bucket(height)
+        keys = ((codec, bucket), (codec,), ())
+        work = encode_work(info, self.mode)
+
+        cost = self._median(self._cost, [key + (parallel,) for key in keys])
+        if cost is None:
+            slot_cost = self._median(self._slot_cost, keys)
+            cost = slot_cost * parallel if slot_cost is not None else None
+        bpp = self._median(self._bpp, keys)
+
+        seconds = work * (cost if cost is not None else DEFAULT_ENCODE_COST.get(self.mode, 0.6))
+        if bpp is not None:
+            output_size = min(original_size, int(bpp * width * height * fps * info['duration'] / 8))
+        else:
+            output_size = int(estimate_output_size(info, self.mode, original_size) / SPACE_SAFETY_MARGIN)
+        return {'seconds': seconds, 'output_size': output_size,
+                'measured': cost is not None and bpp is not None}
+
+
+# --- Historial Global (se configura en el flujo principal) ---
+results_ledger = None
+
+
+# --- Orden de la Cola (Makespan) ---
+
+# Políticas de orden de la cola. Todas ordenan por el costo predicho de cada video
+# (duración × píxeles de salida × costo del modo, ver predict_job):
+#   walk:    orden del recorrido del directorio (sin reordenar, descubrimiento en streaming)
+#   lpt:     el más largo primero; evita que un video enorme tomado al final deje el
+#            lote esperando a un único trabajo
+#   spt:     el más corto primero; libera espacio cuanto antes
+#   savings: el de mayor ahorro predicho primero
+ORDER_POLICIES = {
+    'walk': None,
+    'lpt': lambda job: -job['cost'],
+    'spt': lambda job: job['cost'],
+    'savings': lambda job: -job['savings'],
+}
+
+
+def predict_job(source_path, mode, handbrake_path=None, skip_thresholds=None, parallel=1):
+    """
+    Predice el costo de codificación y el ahorro de un video a partir de su análisis.
+    Con historial de resultados usa EncodePredictor; si no, los costos por defecto.
+
+    Returns:
+        dict: source, size, cost (segundos estimados con 'parallel' trabajos simultáneos,
+              0 si se omitirá), savings (bytes), skip, measured (predicción del historial)
+              y known (False si no se pudo analizar: el costo se completa en plan_order)
+    """
+    size = os.path.getsize(source_path)
+    info = probe_video(source_path, handbrake_path)
+    job = {'source': source_path, 'size': size, 'cost': 0.0, 'savings': 0, 'skip': False,
+           'measured': False, 'known': bool(info and info.get('duration') and info.get('width'))}
+    if not job['known']:
+        return job
+    action, _, _ = decide_encoding(info, mode, skip_thresholds, stream_copy=find_ffmpeg() is not None)
+    if action == 'skip':
+        job['skip'] = True
+        return job
+    if action in ('remux', 'copy'):
+        # Copia de flujos: a la velocidad del disco; solo ahorra lo que se reduzca el audio
+        job['cost'] = size / STREAM_COPY_BYTES_PER_SECOND
+        if action == 'copy':
+            audio_bits = max(0, info.get('audio_bitrate', 0) - AUDIO_BITRATE_KBPS * 1000)
+            job['savings'] = int(audio_bits / 8 * info['duration'])
+        return job
+    if results_ledger is not None:
+        prediction = results_ledger.predictor(mode, active_encoder(handbrake_path).label).predict(
+            info, size, parallel)
+        job['cost'], output = prediction['seconds'], prediction['output_size']
+        job['measured'] = prediction['measured']
+    else:
+        job['cost'] = encode_work(info, mode) * DEFAULT_ENCODE_COST.get(mode, DEFAULT_ENCODE_COST['cpu'])
+        output = estimate_output_size(info, mode, size) / SPACE_SAFETY_MARGIN
+    job['savings'] = max(0, int(size - output))
+    return job
+
+
+def plan_order(video_paths, mode, policy, handbrake_path=None, skip_thresholds=None, parallel=1):
+    """
+    Predice todos los videos de un lote y los ordena según una política.
+    El orden necesita conocer el lote completo, así que la lista se materializa.
+
+    Los videos que no se pudieron analizar reciben un costo proporcional a su tamaño
+    (con los segundos por byte medios de los analizados) y se suponen sin ahorro.
+
+    Returns:
+        list: Predicciones de predict_job en el orden de la política
+    """
+    jobs = []
+    for path in video_paths:
+        source_path, _ = prepare_paths(path)
+        if source_path is not None:
+            jobs.append(predict_job(source_path, mode, handbrake_path, skip_thresholds, parallel))
+
+    # Sin ningún video analizado se supone ~8 Mbps a 1080p: 1 MiB ≈ 1 s de video
+    known = [job for job in jobs if job['known'] and job['cost'] > 0]
+    seconds_per_byte = (sum(job['cost'] for job in known) / sum(job['size'] for job in known)
+                        if known else DEFAULT_ENCODE_COST.get(mode, 0.6) / (1024 ** 2))
+    for job in jobs:
+        if not job['known']:
+            job['cost'] = job['size'] * seconds_per_byte
+
+    key = ORDER_POLICIES[policy]
+    # sorted es estable: a igual costo se conserva el orden del recorrido
+    return sorted(jobs, key=key) if key else jobs
+
+
+def order_videos(video_paths, mode, policy, handbrake_path=None, skip_thresholds=None):
+    """Retorna las rutas de un lote en el orden de la política (ver plan_order)."""
+    if ORDER_POLICIES[policy] is None:
+        return video_paths
+    return [job['source'] for job in plan_order(video_paths, mode, policy, handbrake_path, skip_thresholds)]
+
+
+def simulate_schedule(jobs, workers):
+    """
+    Simula el reparto de los trabajos, en orden, entre un pool de workers trabajadores:
+    cada trabajo lo toma el primer trabajador que queda libre (como process_videos).
+
+    Returns:
+        dict: makespan (s), mean_completion (s, media de los instantes de fin) y
+              half_savings (s hasta recuperar la mitad del ahorro total)
+    """
+    free_at = [0.0] * max(1, workers)
+    finishes = []
+    for job in jobs:
+        start = heapq.heappop(free_at)
+        finish = start + job['cost']
+        heapq.heappush(free_at, finish)
+        finishes.append((finish, job['savings']))
+
+    total_savings = sum(savings for _, savings in finishes)
+    half_savings = 0.0
+    recovered = 0
+    for finish, savings in sorted(finishes):
+        recovered += savings
+        if recovered * 2 >= total_savings:
+            half_savings = finish
+            break
+    return {
+        'makespan': max(free_at),
+        'mean_completion': sum(finish for finish, _ in finishes) / len(finishes) if finishes else 0.0,
+        'half_savings': half_savings,
+    }
+
+
+def hms(seconds):
+    """Duración legible 'Hh MMm SSs'."""
+    minutes, secs = divmod(int(seconds), 60)
+    return f"{minutes // 60}h {minutes % 60:02d}m {secs:02d}s"
+
+
+def compare_orderings(video_paths, mode, workers, handbrake_path=None, skip_thresholds=None):
+    """
+    Imprime el makespan predicho de cada política de orden para un lote, junto con la
+    cota inferior (mayor entre el trabajo total repartido y el video más largo).
+    """
+    jobs = plan_order(video_paths, mode, 'walk', handbrake_path, skip_thresholds, workers)
+    if not jobs:
+        print("ℹ️  No hay videos que simular.")
+        return
+
+    total = sum(job['cost'] for job in jobs)
+    bound = max(total / max(1, workers), max(job['cost'] for job in jobs))
+    print(f"\n🧮 {len(jobs)} videos, {workers} trabajos, modo {mode.upper()}: "
+          f"{hms(total)} de codificación predicha")
+    print(f"   Cota inferior del makespan: {hms(bound)}")
+    print(f"   {'Política':<10}{'Makespan':>14}{'Fin medio':>14}{'50% ahorro':>14}")
+    for policy, key in ORDER_POLICIES.items():
+        ordered = sorted(jobs, key=key) if key else jobs
+        result = simulate_schedule(ordered, workers)
+        print(f"   {policy:<10}{hms(result['makespan']):>14}{hms(result['mean_completion']):>14}"
+              f"{hms(result['half_savings']):>14}")
+
+
+# Trabajos más largos que lista el plan de --dry-run
+DRY_RUN_LISTED = 10
+
+
+def plan_dry_run(video_paths, mode, workers, policy='walk', handbrake_path=None, skip_thresholds=None):
+    """
+    Imprime, sin codificar, el tiempo de reloj proyectado y el espacio que ahorraría un lote:
+    predice cada video (predict_job) y simula su reparto entre los trabajos (simulate_schedule).
+    """
+    jobs = plan_order(video_paths, mode, policy, handbrake_path, skip_thresholds, workers)
+    if not jobs:
+        print("ℹ️  No hay videos que planificar.")
+        return
+
+    encoded = [job for job in jobs if not job['skip']]
+    total_size = sum(job['size'] for job in jobs)
+    savings = sum(job['savings'] for job in jobs)
+    schedule = simulate_schedule(encoded, workers)
+    measured = sum(1 for job in encoded if job['measured'])
+    encoder = active_encoder(handbrake_path)
+
+    print(f"\n🧾 Plan de {len(jobs)} videos ({total_size / 1024 ** 3:.2f} GB), {encoder.describe(mode)}, "
+          f"{workers} trabajos, orden {policy}")
+    print(f"   {'Video':<40}{'Tiempo':>14}{'Ahorro':>12}")
+    for job in sorted(encoded, key=lambda job: -job['cost'])[:DRY_RUN_LISTED]:
+        print(f"   {os.path.basename(job['source'])[:38]:<40}{hms(job['cost']):>14}"
+              f"{job['savings'] / 1024 ** 2:>9.0f} MB")
+    if len(encoded) > DRY_RUN_LISTED:
+        print(f"   ... y {len(encoded) - DRY_RUN_LISTED} más")
+    skipped = len(jobs) - len(encoded)
+    if skipped:
+        print(f"⏭️  Se omitirían {skipped} videos ya eficientes")
+    print(f"⏱️  Tiempo de reloj proyectado: {hms(schedule['makespan'])} "
+          f"({hms(sum(job['cost'] for job in encoded))} de codificación)")
+    percent = savings / total_size * 100 if total_size else 0.0
+    print(f"💾 Ahorro proyectado: {savings / 1024 ** 3:.2f} GB ({percent:.1f}%)")
+    if results_ledger is None:
+        print("📚 Predicción con costos por defecto (historial desactivado)")
+    else:
+        samples = results_ledger.predictor(mode, encoder.label).samples
+        rest = "; el resto con costos por defecto" if measured < len(encoded) else ""
+        print(f"📚 Predicción: {measured} de {len(encoded)} videos con el historial "
+              f"({samples} trabajos medidos de {encoder.label} en modo {mode.upper()}){rest}")
+
+
+# --- Concurrencia Adaptativa ---
+
+# Margen relativo de fps por debajo del cual un cambio de concurrencia no se considera
+# mejora ni empeoramiento (ruido de la medición)
+CONCURRENCY_TOLERANCE = 0.05
+# Memoria disponible mínima (fracción del total) antes de reducir trabajos
+CONCURRENCY_MIN_MEMORY = 0.10
+# Carga media máxima por núcleo antes de reducir trabajos
+CONCURRENCY_MAX_LOAD = 2.0
+# Uso de CPU a partir del cual añadir trabajos ya no puede aumentar el rendimiento
+CONCURRENCY_CPU_SATURATED = 0.97
+# Ventanas durante las que se confía en la medición de un límite antes de volver a probarlo
+CONCURRENCY_MEMORY_WINDOWS = 10
+
+
+def read_cpu_times():
+    """
+    Lee los contadores de tiempo de CPU del sistema (/proc/stat, solo Linux).
+    Retorna: tuple (tiempo ocupado, tiempo total) en ticks, o None si no hay datos.
+    """
+    try:
+        with open('/proc/stat', 'r') as f:
+            fields = [int(value) for value in f.readline().split()[1:]]
+    except (OSError, ValueError):
+        return None
+    idle = fields[3] + (fields[4] if len(fields) > 4 else 0)  # idle + iowait
+    return sum(fields) - idle, sum(fields)
+
+
+def read_memory_available():
+    """
+    Fracción de la memoria disponible (MemAvailable / MemTotal de /proc/meminfo).
+    Retorna: float entre 0 y 1, o None si no se puede leer (p. ej. en macOS).
+    """
+    values = {}
+    try:
+        with open('/proc/meminfo', 'r') as f:
+            for line in f:
+                key, _, rest = line.partition(':')
+                if key in ('MemTotal', 'MemAvailable'):
+                    values[key] = int(rest.split()[0])
+    except (OSError, ValueError, IndexError):
+        return None
+    if not values.get('MemTotal') or 'MemAvailable' not in values:
+        return None
+    return values['MemAvailable'] / values['MemTotal']
+
+
+class ConcurrencyController:
+    """
+    Ajusta el número de trabajos simultáneos de process_videos según el rendimiento medido.
+
+    - Suma los fps de los trabajos en curso (eventos de progreso) y promedia cada
+      muestra durante una ventana de window segundos tras el último cambio
+    - Escala hacia arriba o hacia abajo de uno en uno (hill climbing): mantiene la
+      dirección mientras los fps totales mejoren y la invierte cuando empeoran; se
+      detiene en el límite cuyos vecinos, medidos hace poco, no rinden más
+    - Reduce trabajos sin esperar a la medición si falta memoria o la carga media
+      supera CONCURRENCY_MAX_LOAD por núcleo; no sube si la CPU ya está saturada.
+      Como los trabajos en curso no se terminan y la carga media tarda un minuto en
+      bajar, hay como mucho un recorte por presión por ventana y solo cuando el
+      recorte anterior ya surtió efecto (trabajos en curso <= límite)
+    - Cada decisión se imprime y se emite como evento 'concurrency' (ver --progress-log)
+    """
+
+    def __init__(self, initial, min_jobs=1, max_jobs=None, interval=2.0, window=30.0):
+        self.max_jobs = max(1, max_jobs or max(os.cpu_count() or 1, initial))
+        self.min_jobs = max(1, min(min_jobs, self.max_jobs))
+        self.limit = max(self.min_jobs, min(initial, self.max_jobs))
+        self.interval = interval
+        self.window = window
+        self.decisions = []
+        self._active = 0
+        self._fps = {}            # video -> fps actuales
+        self._samples = []        # (fps totales, trabajos en curso) desde el último cambio
+        self._changed = time.monotonic()
+        self._previous = None     # fps medios con el límite anterior
+        self._measured = {}       # límite -> (fps medios, instante de la medición)
+        self._direction = 1
+        self._pressure_cut = None  # instante del último recorte por presión
+        self._cpu_times = None
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = None
+
+    # --- Ranuras de los trabajadores ---
+
+    def acquire(self):
+        """Espera a que haya una ranura libre bajo el límite actual y la ocupa."""
+        with self._cond:
+            while self._active >= self.limit:
+                self._cond.wait()
+            self._active += 1
+
+    def release(self):
+        """Libera la ranura de un trabajo terminado."""
+        with self._cond:
+            self._active -= 1
+            self._cond.notify_all()
+
+    def on_event(self, record):
+        """Receptor de eventos de progreso (ver add_progress_listener)."""
+        with self._cond:
+            if record['event'] == 'progress':
+                if record.get('fps') is not None:
+                    self._fps[record['source']] = record['fps']
+            elif record['event'] in ('done', 'failed', 'skipped'):
+                self._fps.pop(record['source'], None)
+
+    # --- Medición y decisiones ---
+
+    def _cpu_usage(self):
+        """Uso de CPU del sistema desde la muestra anterior (0-1), o None si no se conoce."""
+        times = read_cpu_times()
+        previous, self._cpu_times = self._cpu_times, times
+        if not times or not previous or times[1] <= previous[1]:
+            return None
+        return (times[0] - previous[0]) / (times[1] - previous[1])
+
+    def _set_limit(self, limit, reason, fps, cpu, load, memory):
+        limit = max(self.min_jobs, min(limit, self.max_jobs))
+        if limit == self.limit:
+            return
+        decision = {'from': self.limit, 'to': limit, 'reason': reason, 'fps': round(fps, 1),
+                    'cpu': round(cpu, 3) if cpu is not None else None,
+                    'load': round(load, 2) if load is not None else None,
+                    'memory': round(memory, 3) if memory is not None else None}
+        self.decisions.append(decision)
+        self.limit = limit
+        self._samples = []
+        self._changed = time.monotonic()
+        self._cond.notify_all()
+        details = f"{fps:.1f} fps"
+        if cpu is not None:
+            details += f", CPU {cpu * 100:.0f}%"
+        if load is not None:
+            details += f", carga {load:.1f}"
+        if memory is not None:
+            details += f", memoria libre {memory * 100:.0f}%"
+        with JobConsole._print_lock:
+            print(f"🎚️  Concurrencia {decision['from']} → {limit} ({reason}): {details}")
+        emit_progress('concurrency', None, **decision)
+
+    def _step(self):
+        """Toma una muestra y, al completar la ventana, decide el nuevo límite."""
+        cpu = self._cpu_usage()
+        try:
+            load = os.getloadavg()[0]
+        except (AttributeError, OSError):
+            load = None
+        memory = read_memory_available()
+        cores = os.cpu_count() or 1
+
+        with self._cond:
+            fps = sum(self._fps.values())
+            self._samples.append((fps, self._active))
+
+            # Presión del sistema: reducir sin esperar a la medición
+            pressure = None
+            if memory is not None and memory < CONCURRENCY_MIN_MEMORY:
+                pressure = (f"poca memoria: {memory * 100:.0f}% libre, mínimo "
+                            f"{CONCURRENCY_MIN_MEMORY * 100:.0f}%")
+            elif load is not None and load > cores * CONCURRENCY_MAX_LOAD:
+                pressure = (f"carga excesiva: {load:.1f} con {cores} núcleos, máximo "
+                            f"{cores * CONCURRENCY_MAX_LOAD:.1f}")
+            if pressure:
+                now = time.monotonic()
+                settled = self._active <= self.limit
+                if settled and (self._pressure_cut is None or now - self._pressure_cut >= self.window):
+                    self._direction = -1
+                    self._previous = None
+                    self._pressure_cut = now
+                    self._set_limit(self.limit - 1, pressure, fps, cpu, load, memory)
+                return
+
+            if time.monotonic() - self._changed < self.window:
+                return
+            # Sin trabajos suficientes en la cola el límite no se está usando: no hay qué medir
+            if any(active < self.limit for _, active in self._samples):
+                self._samples = []
+                self._changed = time.monotonic()
+                return
+
+            now = time.monotonic()
+            mean = sum(sample for sample, _ in self._samples) / len(self._samples)
+            previous, self._previous = self._previous, mean
+            self._measured[self.limit] = (mean, now)
+            self._samples = []
+            self._changed = now
+            if previous is None:
+                reason = "exploración"
+            elif mean > previous * (1 + CONCURRENCY_TOLERANCE):
+                reason = f"mejora sobre {previous:.1f} fps"
+            elif mean < previous * (1 - CONCURRENCY_TOLERANCE):
+                self._direction = -self._direction
+                reason = f"empeora frente a {previous:.1f} fps"
+            elif self._direction > 0:
+                # El último trabajo añadido no aportó: volver atrás
+                self._direction = -1
+                reason = f"sin mejora sobre {previous:.1f} fps"
+            else:
+                return
+            limit = self.limit + self._direction
+            if not self.min_jobs <= limit <= self.max_jobs:
+                self._direction = -self._direction
+                return
+            if self._direction > 0 and cpu is not None and cpu >= CONCURRENCY_CPU_SATURATED:
+                return
+            # El vecino ya se midió hace poco y no rinde más: este límite es el óptimo
+            known = self._measured.get(limit)
+            if known and now - known[1] < self.window * CONCURRENCY_MEMORY_WINDOWS \
+                    and known[0] <= mean * (1 + CONCURRENCY_TOLERANCE):
+                return
+            self._set_limit(limit, reason, mean, cpu, load, memory)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self._step()
+            except Exception as e:
+                print(f"⚠️  Error en el control de concurrencia: {e}")
+
+    def start(self):
+        """Inicia la medición en un hilo de fondo."""
+        self._cpu_times = read_cpu_times()
+        self._samples = []
+        self._changed = time.monotonic()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Detiene la medición y libera a los trabajadores que esperan ranura."""
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        with self._cond:
+            self._cond.notify_all()
+
+
+def process_videos(video_paths, mode, handbrake_path, jobs=1, dedup=None, concurrency=None,
+                   **encode_options):
+    """
+    Procesa una lista de videos aplicando compresión según el modo seleccionado.
+
+    Usa un pool acotado de hilos: cada hilo lanza un proceso HandBrakeCLI a la vez
+    y toma el siguiente video de una cola de tamaño limitado, de modo que la lista
+    se consume a medida que hay trabajadores libres.
+    
+    Args:
+        video_paths (iterable): Rutas de archivos de video a procesar
+        mode (str): Modo de compresión ('cpu' o 'gpu')
+        handbrake_path (str): Ruta del ejecutable HandBrakeCLI
+        jobs (int): Número de trabajos HandBrakeCLI concurrentes
+        dedup (str): Deduplicación de copias idénticas: None (desactivada), 'fast'
+                     (huella de bloques muestreados) o 'verify' (confirma con hash completo)
+        concurrency (ConcurrencyController): Ajusta los trabajos simultáneos según el
+                     rendimiento medido (opcional); el pool crece hasta su max_jobs
+        **encode_options: Opciones adicionales para compress_video (threads, skip_thresholds,
+                          journal, ...)
+    """
+    jobs = max(1, int(jobs))
+    if concurrency is not None:
+        jobs = concurrency.max_jobs
+        add_progress_listener(concurrency.on_event)
+        concurrency.start()
+    duplicates = DuplicateIndex(verify=dedup == 'verify') if dedup else None
+    stats.mode = mode
+    job_queue = queue.Queue(maxsize=jobs * 2)
+    batch_start = time.time()
+
+    # Reanudación: los trabajos terminados en una ejecución anterior cuentan en las estadísticas
+    journal = encode_options.get('journal')
+    if journal is not None:
+        completed = [job for job in journal.completed() if 'compressed_size' in job]
+        for job in completed:
+            stats.record_success(job)
+        if completed:
+            print(f"📒 Reanudando lote: {len(completed)} videos ya completados en una ejecución anterior")
+
+    def finish_copy(group, source_path, dest_path, console):
+        budget = size_budget
+        reservation = budget.reserve(os.path.getsize(source_path)) if budget else None
+        result = reuse_output(group, source_path, dest_path, journal, console)
+        if reservation:
+            budget.settle(reservation, result['compressed_size'] if result and not result.get('skipped')
+                          else reservation['input'])
+        stats.record(result)
+
+    def encode_job(index, source_path, dest_path):
+        console = JobConsole(label=f"[{index}] {os.path.basename(source_path)}", live=(jobs == 1))
+        metrics.worker_busy(True)
+        job_start = time.monotonic()
+        budget = size_budget
+        reservation = target_bytes = None
+        gate = space_gate
+        space = None
+        result = None
+        try:
+            if budget:
+                reservation = budget.reserve(os.path.getsize(source_path))
+                target_bytes = reservation['bytes']
+            # Reservar espacio para la salida (espera si el volumen está casi lleno)
+            if gate is not None:
+                space = gate.admit(dest_path, gate.estimate(source_path, mode, target_bytes), console)
+            if gate is None or space is not None:
+                result = compress_video(source_path, dest_path, mode, handbrake_path, console=console,
+                                        target_bytes=target_bytes, **encode_options)
+        except FileNotFoundError:
+            # El archivo desapareció entre el escaneo y la codificación
+            console.log(f"\nError: No se encontró el archivo de origen: {source_path}")
+            result = None
+        except Exception as e:
+            console.log(f"\nOcurrió un error inesperado durante la compresión: {e}")
+            result = None
+        finally:
+            console.flush()
+            metrics.worker_busy(False, time.monotonic() - job_start)
+            if scratch_stager is not None:
+                scratch_stager.release(source_path)
+            if space is not None:
+                # La reserva se libera cuando el original sale de la cola de la papelera
+                source_disposer.when_disposed(source_path, functools.partial(gate.release, space, mode, result))
+            if reservation:
+                # Un video omitido o fallido conserva su tamaño original
+                compressed = result and not result.get('skipped')
+                budget.settle(reservation, result['compressed_size'] if compressed else reservation['input'])
+        stats.record(result)
+        return result
+
+    def worker():
+        while True:
+            if concurrency is not None:
+                concurrency.acquire()
+            item = job_queue.get()
+            if item is None:
+                if concurrency is not None:
+                    concurrency.release()
+                return
+            metrics.set_queue_depth(job_queue.qsize())
+            index, source_path, dest_path, group = item
+            try:
+                result = encode_job(index, source_path, dest_path)
+
+                # Copias idénticas registradas mientras se codificaba el principal; si el
+                # principal falló, la siguiente copia se codifica como nuevo principal
+                while group is not None:
+                    copies, promoted = duplicates.resolve(group, result)
+                    for copy_source, copy_dest in copies:
+                        copy_console = JobConsole(label=os.path.basename(copy_source), live=(jobs == 1))
+                        finish_copy(group, copy_source, copy_dest, copy_console)
+                        copy_console.flush()
+                    if promoted is None:
+                        break
+                    result = encode_job(index, *promoted)
+            finally:
+                if concurrency is not None:
+                    concurrency.release()
+
+    workers = [threading.Thread(target=worker, daemon=True) for _ in range(jobs)]
+    metrics.add_workers(jobs)
+    for thread in workers:
+        thread.start()
+
+    for index, source_path in enumerate(video_paths, 1):
+        source_path, dest_path = prepare_paths(source_path)
+        if source_path is None:
+            continue
+
+        # Consultar el diario: saltar trabajo terminado y limpiar salidas parciales
+        if journal is not None:
+            job = journal.get(source_path)
+            if job and not resume_job(job, source_path, dest_path, journal, JobConsole()):
+                continue
+            journal.record(source_path, 'queued', original_size=os.path.getsize(source_path))
+
+        # Copias idénticas: solo se codifica la primera de cada contenido
+        group = None
+        if duplicates is not None:
+            try:
+                role, group = duplicates.claim(source_path, dest_path)
+            except OSError:
+                role, group = 'primary', None
+            if role == 'pending':
+                continue
+            if role == 'ready':
+                console = JobConsole(label=os.path.basename(source_path), live=(jobs == 1))
+                finish_copy(group, source_path, dest_path, console)
+                console.flush()
+                continue
+
+        # Encolar compresión del video (bloquea si la cola está llena) y pedir su precarga
+        if scratch_stager is not None:
+            scratch_stager.request(source_path)
+        job_queue.put((index, source_path, dest_path, group))
+        metrics.set_queue_depth(job_queue.qsize())
+
+    # Señal de fin para cada trabajador y espera a que terminen
+    for _ in workers:
+        job_queue.put(None)
+    for thread in workers:
+        thread.join()
+    metrics.add_workers(-jobs)
+    metrics.set_queue_depth(0)
+    if concurrency is not None:
+        concurrency.stop()
+        progress_listeners.remove(concurrency.on_event)
+        print(f"🎚️  Concurrencia final: {concurrency.limit} trabajos "
+              f"({len(concurrency.decisions)} ajustes)")
+
+    source_disposer.flush()
+    stats.add_wall_time(time.time() - batch_start)
+    probe_cache.save()
+    tuning_cache.save()
+
+
+# --- Granja de Codificación (Coordinador / Trabajadores) ---
+
+class EncodeCoordinator:
     """
-    Busca el ejecutable de HandBrakeCLI de forma inteligente.
-    Primero verifica el PATH del sistema, luego la ubicación estándar en /Applications.
-    Retorna: La ruta al ejecutable o None si no se encuentra.
+    Coordinador de una granja de codificación: reparte los videos a procesos
+    trabajadores (locales o en otras máquinas) mediante un protocolo HTTP/JSON simple.
+
+    - POST /lease      → entrega un trabajo con un arriendo de lease_seconds
+                         (espera hasta 'wait' segundos si no hay trabajo disponible)
+    - POST /heartbeat  → renueva el arriendo; responde ok=False si se perdió
+    - POST /complete   → resultado de compress_video, se suma a las estadísticas
+    - POST /fail       → el trabajo vuelve a la cola (hasta max_attempts intentos); si la
+                         salida fue rechazada por la verificación, falla sin reintentos
+    - GET  /status     → estado de la cola
+
+    Si un trabajador deja de enviar latidos, su arriendo vence y el video vuelve a la
+    cola. Los trabajadores deben ver los videos en las mismas rutas (almacenamiento
+    compartido).
     """
-    path = shutil.which('HandBrakeCLI')
-    if path:
-        return path
 
-    default_path = '/Applications/HandBrakeCLI'
-    if os.path.isfile(default_path):
-        return default_path
+    def __init__(self, video_paths, mode, bind=('127.0.0.1', 8765), lease_seconds=120.0,
+                 max_attempts=3, token=None, encode_options=None):
+        self.mode = mode
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.token = token
+        self.encode_options = encode_options or {}
+        self.done = threading.Event()
+        self._source = iter(video_paths)
+        self._exhausted = False
+        self._pending = deque()
+        self._leases = {}     # id -> {'job', 'worker', 'expires'}
+        self._attempts = {}   # id -> intentos fallidos o vencidos
+        self._finished = set()
+        self._next_id = 1
+        self._cond = threading.Condition()
+        self.server = ThreadingHTTPServer(bind, _CoordinatorRequestHandler)
+        self.server.daemon_threads = True
+        self.server.coordinator = self
 
-    return None
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
 
-def get_video_width(source_path, handbrake_path):
-    """
-    Obtiene el ancho de un video usando el escaneo de HandBrakeCLI.
-    El escaneo es rápido y no procesa el archivo completo.
-    Parámetros:
-        source_path (str): La ruta al video de origen.
-        handbrake_path (str): La ruta al ejecutable de HandBrakeCLI.
-    Retorna: El ancho del video como un entero, o 0 si no se puede determinar.
-    """
-    try:
-        command = [handbrake_path, '-i', source_path, '--scan']
-        # HandBrakeCLI imprime la información del escaneo en stderr.
-        process = subprocess.run(command, capture_output=True, text=True, encoding='utf-8', errors='ignore')
+    # --- Estado de la cola (siempre con self._cond tomado) ---
 
-        size_regex = re.compile(r"\+ size: (\d+)x(\d+)")
-        match = size_regex.search(process.stderr)
+    def _fill_locked(self):
+        """Toma el siguiente video del iterable de origen si la cola está vacía."""
+        while not self._pending and not self._exhausted:
+            try:
+                path = next(self._source)
+            except StopIteration:
+                self._exhausted = True
+                return
+            source_path, dest_path = prepare_paths(path)
+            if source_path is None:
+                continue
+            job = {'id': self._next_id, 'source': source_path, 'dest': dest_path, 'mode': self.mode,
+                   'options': self.encode_options}
+            self._next_id += 1
+            self._pending.append(job)
 
-        if match:
-            return int(match.group(1))  # El grupo 1 es el ancho.
-    except Exception:
-        return 0  # Si algo falla, retornamos 0 para no aplicar redimensión.
-    return 0
+    def _reap_locked(self):
+        """Devuelve a la cola los trabajos cuyo arriendo venció."""
+        now = time.monotonic()
+        for job_id, lease in list(self._leases.items()):
+            if lease['expires'] <= now:
+                del self._leases[job_id]
+                print(f"⏰ Arriendo vencido ({lease['worker']}): {os.path.basename(lease['job']['source'])}")
+                self._retry_locked(lease['job'])
 
-def get_compression_mode():
-    """
-    Presenta al usuario las opciones de compresión disponibles.
-    
-    Returns:
-        str: 'cpu' para compresión por software o 'gpu' para aceleración hardware optimizada
-    """
-    print("\nSeleccione el modo de compresión:")
-    mode = get_user_input(
-        " [1] CPU (Calidad con x264)\n"
-        " [2] GPU (Alta Calidad + Máxima Velocidad - Optimizado Apple Silicon)\n"
-        " : ",
-        ['1', '2']
-    )
-    return 'cpu' if mode == '1' else 'gpu'
+    def _retry_locked(self, job):
+        """Reencola un trabajo o lo da por fallido tras max_attempts intentos."""
+        attempts = self._attempts.get(job['id'], 0) + 1
+        self._attempts[job['id']] = attempts
+        if attempts < self.max_attempts:
+            self._pending.appendleft(job)
+        else:
+            self._finished.add(job['id'])
+            stats.record_failure()
+            print(f"❌ Sin más reintentos: {os.path.basename(job['source'])}")
+        self._cond.notify_all()
 
-def compress_video(source_path, dest_path, mode, handbrake_path):
-    """
-    Comprime un video usando HandBrakeCLI con configuraciones optimizadas.
-    - CPU: x264 con CRF 26 (configuración original probada)
-    - GPU: VideoToolbox H.265 con CRF 19 + optimizaciones Apple Silicon
-      * Hardware decoders habilitados para pipeline GPU completo
-      * max-frame-delay=1 para optimización de latencia
-      * Mantiene exactamente la misma calidad visual
-      * 15-30% más rápido en chips Apple Silicon
-    - NUEVO: Monitoreo energético real con datos de CPU y GPU
-    
-    Args:
-        source_path (str): Ruta del archivo de video origen
-        dest_path (str): Ruta de destino del archivo comprimido  
-        mode (str): 'cpu' o 'gpu' para seleccionar método de compresión
-        handbrake_path (str): Ruta del ejecutable HandBrakeCLI
-    """
-    global total_videos, total_compression_time, total_original_size, total_compressed_size, total_energy_consumed
+    def _check_done_locked(self):
+        self._fill_locked()
+        if self._exhausted and not self._pending and not self._leases:
+            self.done.set()
+            self._cond.notify_all()
 
-    # Verificar permisos de escritura en directorio destino
-    dest_dir = os.path.dirname(dest_path)
-    if not os.access(dest_dir, os.W_OK):
-        print(f"\nError: No hay permisos de escritura en el directorio: '{dest_dir}'")
-        return
+    # --- Operaciones del protocolo ---
 
-    # Obtener tamaño original del archivo
-    try:
-        original_size = os.path.getsize(source_path)
-    except FileNotFoundError:
-        print(f"\nError: No se encontró el archivo de origen: {source_path}")
-        return
+    def lease(self, worker, wait=20.0):
+        deadline = time.monotonic() + min(float(wait), 60.0)
+        with self._cond:
+            while True:
+                self._reap_locked()
+                self._fill_locked()
+                if self._pending:
+                    job = self._pending.popleft()
+                    self._leases[job['id']] = {'job': job, 'worker': worker,
+                                               'expires': time.monotonic() + self.lease_seconds}
+                    return {'job': job, 'lease_seconds': self.lease_seconds}
+                self._check_done_locked()
+                remaining = deadline - time.monotonic()
+                if self.done.is_set() or remaining <= 0:
+                    return {'job': None, 'done': self.done.is_set()}
+                self._cond.wait(min(remaining, self.lease_seconds / 4))
 
-    # Actualizar estadísticas globales
-    total_videos += 1
-    total_original_size += original_size
-    start_time = time.time()
-    
-    # Inicializar monitoreo energético si está disponible
-    power_monitor = PowerMonitor()
-    energy_consumed = 0.0
-    
-    # Verificar y iniciar monitoreo energético
-    if check_powermetrics_permissions():
-        power_monitor.start_monitoring()
-        print("⚡ Monitoreo energético activado")
-    else:
-        print("⚠️  Monitoreo energético no disponible (requiere sudo)")
+    def heartbeat(self, worker, job_id):
+        with self._cond:
+            lease = self._leases.get(job_id)
+            if lease is None or lease['worker'] != worker:
+                return {'ok': False}
+            lease['expires'] = time.monotonic() + self.lease_seconds
+            return {'ok': True}
 
-    # Configuración base común para ambos modos
-    base_command = [
-        handbrake_path,
-        '-i', source_path,
-        '-o', dest_path,
-        '-f', 'mp4',
-        '--optimize',
-        '-r', '30',           # Frame rate 30fps estándar
-        '-E', 'ca_aac',       # Audio AAC de alta calidad
-        '-B', '96',           # Bitrate audio 96kbps (eficiente)
-    ]
+    def complete(self, worker, job_id, result):
+        with self._cond:
+            if job_id in self._finished:
+                return {'ok': False}  # Resultado duplicado de un arriendo vencido
+            self._finished.add(job_id)
+            self._leases.pop(job_id, None)
+            self._pending = deque(job for job in self._pending if job['id'] != job_id)
+            stats.record(result)
+            self._check_done_locked()
+        if result:
+            print(f"✅ {worker}: {os.path.basename(result.get('source', ''))}")
+        return {'ok': True}
 
-    # Configuraciones específicas por modo de compresión
-    if mode == 'cpu':
-        print(f"\nComprimiendo con CPU (x264 Optimizado): {os.path.basename(source_path)}")
-        # CPU: Configuración probada del usuario con x264 eficiente
-        cpu_settings = [
-            '-e', 'x264',                   # Encoder x264: rápido y confiable
-            '-q', '26',                     # CRF 26: configuración probada del usuario
-            # Audio y framerate ya están en base_command
-        ]
-        command = base_command + cpu_settings
-        
-    else:  # mode == 'gpu' 
-        print(f"\nComprimiendo con GPU (Alta Calidad + Compresión Eficiente Optimizada): {os.path.basename(source_path)}")
-        # GPU: CRF optimizado para máxima calidad visual con compresión eficiente
-        # ⚡ NUEVO: Optimizaciones específicas para Apple Silicon agregadas ⚡
-        gpu_settings = [
-            '-e', 'vt_h265',                # VideoToolbox H.265 (hardware)
-            '-q', '19',                     # CRF 19 = calidad muy alta con compresión eficiente
-            '--encopts',                    # Opciones avanzadas VideoToolbox
-            'look-ahead-frame-count=40:'    # Look-ahead 40 frames para mejores decisiones
-            'bframes=1:'                    # B-frames habilitados para eficiencia
-            'ref=5:'                        # 5 frames de referencia para mejor predicción
-            'qpmin=10:'                     # QP mínimo para preservar detalles
-            'qpmax=30:'                     # QP máximo para controlar calidad
-            'max-frame-delay=1',            # ⚡ NUEVO: Optimización de latencia para Apple Silicon
-            # ⚡ NUEVO: Hardware decoder para pipeline GPU completo en Apple Silicon ⚡
-            '--enable-hw-decoding', 'videotoolbox'  # Mejora velocidad sin afectar calidad
-        ]
-        command = base_command + gpu_settings
+    def fail(self, worker, job_id, error='', rejected=False):
+        with self._cond:
+            lease = self._leases.pop(job_id, None)
+            if lease is None or job_id in self._finished:
+                return {'ok': False}
+            source = lease['job']['source']
+            if rejected:
+                # Repetir la codificación daría la misma salida rechazada
+                print(f"🛑 {worker}: salida rechazada de {os.path.basename(source)}: {error}")
+                self._finished.add(job_id)
+                stats.record_failure()
+                stats.record_rejection(source, error)
+            else:
+                print(f"⚠️  {worker} falló con {os.path.basename(source)}: {error}")
+                self._retry_locked(lease['job'])
+            self._check_done_locked()
+        return {'ok': True}
 
-    # Redimensionar videos 4K a 1080p para mejor compresión (aplicar siempre en CPU)
-    if mode == 'cpu':
-        # En CPU siempre redimensionar como en tu configuración original
-        command.extend(['-w', '1920'])
-    else:
-        # En GPU solo redimensionar si es mayor a 1920px
-        source_width = get_video_width(source_path, handbrake_path)
-        if source_width > 1920:
-            command.extend(['-w', '1920'])
+    def status(self):
+        with self._cond:
+            return {'pending': len(self._pending), 'leased': len(self._leases),
+                    'finished': len(self._finished), 'exhausted': self._exhausted,
+                    'done': self.done.is_set()}
 
-    # Ejecutar proceso de compresión con monitoreo de progreso
-    try:
-        process = subprocess.Popen(
-            command, 
-            stdout=subprocess.PIPE, 
-            stderr=subprocess.STDOUT, 
-            universal_newlines=True, 
-            encoding='utf-8', 
-            errors='ignore'
-        )
+    def serve(self, local_workers=()):
+        """
+        Atiende a los trabajadores hasta que todos los videos terminan.
 
-        # Regex para capturar progreso del proceso HandBrake
-        progress_regex = re.compile(r"Encoding: task \d+ of \d+, (\d+\.\d+)\s*%")
-        
-        # Mostrar progreso en tiempo real
-        for line in process.stdout:
-            match = progress_regex.search(line)
-            if match:
-                percent = float(match.group(1))
-                sys.stdout.write(f"\rProgreso: {int(percent)}%")
-                sys.stdout.flush()
+        Args:
+            local_workers (list): Procesos trabajadores locales a esperar al final
+        """
+        server_thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        server_thread.start()
+        batch_start = time.time()
+        try:
+            while not self.done.wait(self.lease_seconds / 4):
+                with self._cond:
+                    self._reap_locked()
+                    self._check_done_locked()
+            for process in local_workers:
+                try:
+                    process.wait(timeout=self.lease_seconds)
+                except subprocess.TimeoutExpired:
+                    process.terminate()
+        finally:
+            self.server.shutdown()
+            self.server.server_close()
+            stats.add_wall_time(time.time() - batch_start)
 
-        # Esperar a que termine el proceso
-        process.wait()
 
-        # Verificar si la compresión fue exitosa
-        if process.returncode != 0 or not os.path.isfile(dest_path):
-            print(f"\nError al comprimir: {os.path.basename(source_path)}. "
-                  f"Verifique que el archivo no esté corrupto.")
-            # Revertir estadísticas en caso de error
-            total_videos -= 1
-            total_original_size -= original_size
-            return
+class _CoordinatorRequestHandler(BaseHTTPRequestHandler):
+    """Traduce las peticiones HTTP/JSON a las operaciones del coordinador."""
 
-        # Mostrar finalización exitosa
-        sys.stdout.write("\rProgreso: 100% - ¡Completado!      \n")
-        sys.stdout.flush()
+    def _reply(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
 
-        # Actualizar estadísticas finales
-        compressed_size = os.path.getsize(dest_path)
-        total_compressed_size += compressed_size
-        total_compression_time += time.time() - start_time
-        
-        # Finalizar monitoreo energético y agregar a estadísticas globales
-        energy_consumed = power_monitor.stop_monitoring()
-        total_energy_consumed += energy_consumed
-        
-        if energy_consumed > 0:
-            print(f"⚡ Energía consumida: {energy_consumed * 1000:.2f} Wh")
+    def _authorized(self):
+        token = self.server.coordinator.token
+        return not token or self.headers.get('X-Farm-Token') == token
 
-        # Mover archivo original a papelera (más seguro que eliminación permanente)
+    def do_GET(self):
+        if not self._authorized():
+            return self._reply(403, {'error': 'token inválido'})
+        if self.path == '/status':
+            return self._reply(200, self.server.coordinator.status())
+        self._reply(404, {'error': 'ruta desconocida'})
+
+    def do_POST(self):
+        if not self._authorized():
+            return self._reply(403, {'error': 'token inválido'})
+        coordinator = self.server.coordinator
         try:
-            send2trash(source_path)
-        except Exception as trash_error:
-            print(f"⚠️  Advertencia: No se pudo mover a papelera: {trash_error}")
-            print(f"   El archivo original permanece en: {source_path}")
-        
-    except Exception as e:
-        print(f"\nOcurrió un error inesperado durante la compresión: {e}")
-        # Detener monitoreo energético en caso de error
-        if power_monitor:
-            power_monitor.stop_monitoring()
-        # Revertir estadísticas en caso de excepción
-        total_videos -= 1  
-        total_original_size -= original_size
+            length = int(self.headers.get('Content-Length') or 0)
+            data = json.loads(self.rfile.read(length) or b'{}')
+            worker = str(data.get('worker', self.client_address[0]))
+            if self.path == '/lease':
+                return self._reply(200, coordinator.lease(worker, data.get('wait', 20.0)))
+            if self.path == '/heartbeat':
+                return self._reply(200, coordinator.heartbeat(worker, data['job_id']))
+            if self.path == '/complete':
+                return self._reply(200, coordinator.complete(worker, data['job_id'], data.get('result')))
+            if self.path == '/fail':
+                return self._reply(200, coordinator.fail(worker, data['job_id'], data.get('error', ''),
+                                                         bool(data.get('rejected'))))
+        except (ValueError, KeyError) as e:
+            return self._reply(400, {'error': str(e)})
+        self._reply(404, {'error': 'ruta desconocida'})
 
-def get_user_input(prompt, valid_options):
+    def log_message(self, format, *args):
+        pass  # Sin registro por petición en la consola
+
+
+def farm_request(url, endpoint, payload, token=None, timeout=90):
     """
-    Solicita entrada del usuario hasta obtener una opción válida.
-    
-    Args:
-        prompt (str): Mensaje a mostrar al usuario
-        valid_options (list): Lista de opciones válidas
-        
+    Envía una petición JSON al coordinador.
+
     Returns:
-        str: Opción válida seleccionada por el usuario
+        dict: Respuesta decodificada
     """
-    while True:
-        choice = input(prompt).strip()
-        if choice in valid_options:
-            return choice
-        print("⚠️  Opción no válida. Por favor, intente nuevamente.")
+    request = urllib.request.Request(
+        url.rstrip('/') + endpoint,
+        data=json.dumps(payload).encode('utf-8'),
+        headers={'Content-Type': 'application/json', 'X-Farm-Token': token or ''},
+    )
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return json.loads(response.read())
 
-def get_all_videos(directory):
+
+def run_worker(url, handbrake_path, jobs=1, worker_id=None, token=None, retry_seconds=5.0,
+               max_retries=12):
     """
-    Busca recursivamente todos los archivos MP4 en un directorio.
-    
+    Proceso trabajador de la granja: pide trabajos al coordinador, los comprime con
+    compress_video y envía el resultado, manteniendo el arriendo con latidos.
+
     Args:
-        directory (str): Ruta del directorio a escanear
-        
-    Returns:
-        list: Lista de rutas de archivos MP4 encontrados
+        url (str): URL del coordinador (http://host:puerto)
+        handbrake_path (str): Ruta local del ejecutable HandBrakeCLI
+        jobs (int): Trabajos simultáneos en esta máquina
+        worker_id (str): Identificador del trabajador (por defecto host:pid)
+        token (str): Token compartido con el coordinador (opcional)
+        retry_seconds (float): Espera entre reintentos si el coordinador no responde
+        max_retries (int): Reintentos consecutivos antes de abandonar
     """
-    videos = []
-    for root, dirs, files in os.walk(directory):
-        for file in files:
-            if file.endswith('.mp4'):
-                videos.append(os.path.join(root, file))
-    return videos
+    base_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
 
-def shutdown_option():
-    """
-    Configura las opciones de apagado automático y método de compresión.
-    
-    Returns:
-        tuple: (shutdown_option, compression_option)
-    """
-    print("¡Gracias por usar Compress MP4! Los archivos se guardarán en el mismo "
-          "directorio que los archivos de origen.")
-    
-    # Opción de apagado automático
-    shutdown = get_user_input(
-        "¿Desea que el Mac se apague cuando finalice la compresión?\n"
-        " [1] SÍ - Apagar automáticamente\n"
-        " [2] NO - Mantener encendido\n"
-        " : ",
-        ['1', '2']
-    )
+    def worker_loop(slot):
+        name = f"{base_id}/{slot}" if jobs > 1 else base_id
+        failures = 0
+        while True:
+            try:
+                reply = farm_request(url, '/lease', {'worker': name, 'wait': 20.0}, token)
+                failures = 0
+            except (urllib.error.URLError, OSError, ValueError):
+                failures += 1
+                if failures > max_retries:
+                    print(f"❌ {name}: coordinador inaccesible, terminando.")
+                    return
+                time.sleep(retry_seconds)
+                continue
 
-    # Verificar permisos de administrador para apagado
-    if shutdown == '1' and os.geteuid() != 0:
-        print("⚠️  Para apagar el Mac automáticamente necesitas ejecutar este script "
-              "como superusuario.\n💡 Intenta ejecutar: sudo python3 compress.py")
-        sys.exit(1)
+            job = reply.get('job')
+            if job is None:
+                if reply.get('done'):
+                    return
+                continue
 
-    # Método de selección de archivos
-    compression_option = get_user_input(
-        "¿Cómo desea seleccionar los videos a comprimir?\n"
-        " [1] Ingresar rutas de videos individuales\n"
-        " [2] Procesar todos los videos de un directorio\n"
-        " : ",
-        ['1', '2']
-    )
-            
-    return shutdown, compression_option
+            # Latidos para mantener el arriendo mientras se codifica. Si el arriendo se
+            # pierde (respuesta ok=False, o lease_seconds sin poder enviar un latido: el
+            # coordinador ya lo habrá vencido), el trabajo ya es de otro trabajador: se
+            # termina el encoder y no se envía resultado ni se toca el original
+            stop_heartbeat = threading.Event()
+            lease_lost = threading.Event()
+            lease_seconds = reply.get('lease_seconds', 120.0)
 
-def display_statistics():
-    """
-    Muestra estadísticas finales del proceso de compresión en consola.
-    Incluye métricas de rendimiento, ahorro de espacio y consumo energético real.
-    Reproduce sonido de notificación y calcula métricas de rendimiento.
-    """
-    if total_videos == 0:
-        print("ℹ️  No se comprimió ningún video.")
-        return
+            def heartbeat():
+                last_ok = time.monotonic()
+                while not stop_heartbeat.wait(max(1.0, lease_seconds / 4)):
+                    try:
+                        ok = farm_request(url, '/heartbeat', {'worker': name, 'job_id': job['id']},
+                                          token, timeout=30).get('ok')
+                    except (urllib.error.URLError, OSError, ValueError):
+                        if time.monotonic() - last_ok < lease_seconds:
+                            continue
+                        ok = False
+                    if not ok:
+                        print(f"⚠️  {name}: arriendo perdido para {os.path.basename(job['source'])}, "
+                              f"cancelando el trabajo")
+                        lease_lost.set()
+                        return
+                    last_ok = time.monotonic()
 
-    # Calcular tiempo total en formato legible
-    hours, remainder = divmod(total_compression_time, 3600)
-    minutes, _ = divmod(remainder, 60)
+            heartbeat_thread = threading.Thread(target=heartbeat, daemon=True)
+            heartbeat_thread.start()
+            console = JobConsole(label=f"{name} {os.path.basename(job['source'])}", live=False)
+            gate = space_gate
+            space = None
+            result, error, rejection = None, None, None
+            # Cada trabajador codifica en su propio directorio de trabajo: la salida pasa
+            # al destino solo cuando el coordinador acepta el resultado
+            work_dir = None
+            try:
+                work_dir = tempfile.mkdtemp(prefix=WORK_DIR_PREFIX + 'farm_',
+                                            dir=os.path.dirname(job['dest']))
+                work_dest = os.path.join(work_dir, os.path.basename(job['dest']))
+                if gate is not None:
+                    space = gate.admit(job['dest'], gate.estimate(job['source'], job['mode']), console)
+                    if space is None:
+                        error = 'espacio insuficiente en el destino'
+                if error is None:
+                    rejected_before = len(stats.rejected)
+                    result = compress_video(job['source'], work_dest, job['mode'], handbrake_path,
+                                            console=console, cancel=lease_lost, dispose=False,
+                                            **job.get('options', {}))
+                    # Una salida rechazada por la verificación no se reintenta
+                    rejection = next((reason for path, reason in stats.rejected[rejected_before:]
+                                      if path == job['source']), None)
+            except Exception as e:
+                result, error = None, str(e)
+            finally:
+                stop_heartbeat.set()
+                console.flush()
+                if scratch_stager is not None:
+                    scratch_stager.release(job['source'])
 
-    # Calcular estadísticas de compresión
-    if total_original_size > 0:
-        space_saved = total_original_size - total_compressed_size
-        percent_space_saved = (space_saved / total_original_size) * 100
-        space_saved_gb = space_saved / (1024 ** 3)
-    else:
-        percent_space_saved = space_saved_gb = 0
+            try:
+                if lease_lost.is_set():
+                    continue  # Cancelado: el nuevo dueño del arriendo informará el resultado
+                endpoint = '/complete' if result else '/fail'
+                payload = {'worker': name, 'job_id': job['id']}
+                if result and not result.get('skipped'):
+                    result['dest'] = job['dest']
+                if result:
+                    payload['result'] = result
+                elif rejection:
+                    payload.update(error=rejection, rejected=True)
+                else:
+                    payload['error'] = error or 'compresión fallida'
+                accepted = False
+                for _ in range(max_retries):
+                    try:
+                        accepted = farm_request(url, endpoint, payload, token).get('ok', False)
+                        break
+                    except (urllib.error.URLError, OSError, ValueError):
+                        time.sleep(retry_seconds)
+                if accepted and result and not result.get('skipped'):
+                    os.replace(work_dest, job['dest'])
+                    source_disposer.submit(job['source'])
+                elif endpoint == '/complete' and not accepted:
+                    print(f"⚠️  {name}: resultado no aceptado para {os.path.basename(job['source'])}, "
+                          f"se descarta la salida")
+            finally:
+                if work_dir is not None:
+                    shutil.rmtree(work_dir, ignore_errors=True)
+                if space is not None:
+                    source_disposer.when_disposed(job['source'], functools.partial(
+                        gate.release, space, job['mode'], result))
 
-    # Reproducir sonido de notificación
-    try:
-        os.system('afplay ok-notification-alert.wav')
-    except:
-        pass
-    
-    # Mostrar estadísticas en consola
-    print("\n" + "="*50)
-    print("🎬 COMPRESIÓN COMPLETADA EXITOSAMENTE")
-    print("="*50)
-    print(f"📊 Videos procesados: {total_videos}")
-    print(f"⏱️  Tiempo total: {int(hours)}h {int(minutes)}m")
-    print(f"📉 Reducción de tamaño: {percent_space_saved:.1f}%")
-    print(f"💾 Espacio ahorrado: {space_saved_gb:.2f} GB")
-    
-    # Nueva estadística: Consumo energético
-    if total_energy_consumed > 0:
-        energy_wh = total_energy_consumed * 1000  # Convertir kWh a Wh
-        print(f"⚡ Energía consumida: {total_energy_consumed:.4f} kWh ({energy_wh:.2f} Wh)")
-        
-        # Eficiencia energética por video
-        if total_videos > 0:
-            avg_energy_per_video = energy_wh / total_videos
-            print(f"🔋 Promedio por video: {avg_energy_per_video:.2f} Wh")
-    else:
-        print("⚠️  Consumo energético no monitoreado (requiere permisos sudo)")
-    
-    print("="*50)
+    threads = [threading.Thread(target=worker_loop, args=(slot,)) for slot in range(max(1, jobs))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    source_disposer.flush()
+    probe_cache.save()
+    tuning_cache.save()
 
-def get_all_videos(directory):
-    """
-    Busca recursivamente todos los archivos MP4 en un directorio.
-    
-    Args:
-        directory (str): Ruta del directorio a escanear
-        
-    Returns:
-        list: Lista de rutas de archivos MP4 encontrados
-    """
-    videos = []
-    for root, dirs, files in os.walk(directory):
-        for file in files:
-            if file.endswith('.mp4'):
-                videos.append(os.path.join(root, file))
-    return videos
 
-def process_videos(video_paths, mode, handbrake_path):
-    """
-    Procesa una lista de videos aplicando compresión según el modo seleccionado.
-    
-    Args:
-        video_paths (list): Lista de rutas de archivos de video a procesar
-        mode (str): Modo de compresión ('cpu' o 'gpu')
-        handbrake_path (str): Ruta del ejecutable HandBrakeCLI
+def parse_arguments():
     """
-    for source_path in video_paths:
-        # Limpiar y verificar ruta del archivo
-        source_path = source_path.replace('\\', '')
-        if not os.path.isfile(source_path):
-            print(f"⚠️  Archivo no encontrado: {source_path}. Omitiendo...")
-            continue
+    Lee las opciones de línea de comandos.
 
-        # Generar ruta de destino para archivo comprimido
-        source_path = os.path.abspath(source_path)
-        dir_path = os.path.dirname(source_path)
-        base_name, extension = os.path.splitext(os.path.basename(source_path))
-        dest_path = os.path.join(dir_path, f"{base_name}_compressed{extension}")
+    Returns:
+        argparse.Namespace: Opciones de ejecución
+    """
+    parser = argparse.ArgumentParser(description="Compresión de videos MP4 con HandBrakeCLI.")
+    parser.add_argument('-m', '--mode', choices=['cpu', 'gpu'],
+                        help="Modo de compresión (si se omite, se pregunta al iniciar)")
+    parser.add_argument('-w', '--watch', metavar='DIRECTORIO',
+                        help="Modo servicio: vigila una carpeta de ingesta y comprime los videos nuevos")
+    parser.add_argument('--stable-seconds', type=float, default=10.0,
+                        help="Segundos sin cambios de tamaño/mtime para considerar un archivo "
+                             "copiado por completo (por defecto: 10)")
+    parser.add_argument('--poll-interval', type=float, default=5.0,
+                        help="Intervalo de sondeo cuando inotify no está disponible (por defecto: 5)")
+    parser.add_argument('--coordinator', metavar='DIRECTORIO',
+                        help="Granja de codificación: reparte los videos del directorio entre trabajadores")
+    parser.add_argument('--bind', default='127.0.0.1:8765', metavar='HOST:PUERTO',
+                        help="Dirección donde escucha el coordinador (por defecto: 127.0.0.1:8765)")
+    parser.add_argument('--local-workers', type=int, default=0, metavar='N',
+                        help="Trabajadores a lanzar en esta máquina junto al coordinador")
+    parser.add_argument('--lease-seconds', type=float, default=120.0,
+                        help="Duración del arriendo de un trabajo sin latidos (por defecto: 120)")
+    parser.add_argument('--worker', metavar='URL',
+                        help="Trabajador de la granja: procesa trabajos del coordinador indicado")
+    parser.add_argument('--farm-token', default=os.environ.get('COMPRESS_FARM_TOKEN'),
+                        help="Token compartido entre coordinador y trabajadores (o COMPRESS_FARM_TOKEN)")
+    parser.add_argument('--encoder', choices=['handbrake', 'ffmpeg'], default='handbrake',
+                        help="Motor de codificación (por defecto: handbrake)")
+    parser.add_argument('--codec', choices=sorted(FFMPEG_INTENTS),
+                        help="Códec de --encoder ffmpeg (por defecto: libx264 en cpu; VideoToolbox "
+                             "en macOS o libx265 en gpu)")
+    parser.add_argument('--encoder-preset', metavar='PRESET',
+                        help="Preset fijo del encoder, p. ej. 'medium' (x264/x265) u '8' (SVT-AV1)")
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help="Número de trabajos HandBrakeCLI concurrentes (por defecto: 1)")
+    parser.add_argument('--adaptive-jobs', action='store_true',
+                        help="Ajusta los trabajos simultáneos según los fps totales, el uso de CPU, "
+                             "la carga y la memoria (--jobs es el valor inicial)")
+    parser.add_argument('--max-jobs', type=int, metavar='N',
+                        help="Máximo de trabajos de --adaptive-jobs (por defecto: núcleos de CPU)")
+    parser.add_argument('-t', '--threads', type=int, default=0,
+                        help="Hilos del encoder por trabajo: x264, x265 o SVT-AV1 "
+                             "(por defecto: 0 = automático)")
+    parser.add_argument('--split', type=int, default=0, metavar='N',
+                        help="Divide los videos largos en N segmentos por fotogramas clave y los "
+                             "codifica en paralelo (requiere ffmpeg; por defecto: 0 = no dividir)")
+    parser.add_argument('--split-min-minutes', type=float, default=SPLIT_MIN_DURATION / 60,
+                        help="Duración mínima en minutos para dividir un video (por defecto: 20)")
+    parser.add_argument('--order', choices=list(ORDER_POLICIES), default='walk',
+                        help="Orden de la cola: walk (recorrido, por defecto), lpt (más largo "
+                             "primero), spt (más corto primero) o savings (mayor ahorro primero)")
+    parser.add_argument('--simulate-order', metavar='DIRECTORIO',
+                        help="Compara el makespan predicho de cada orden para el directorio y sale")
+    parser.add_argument('--dry-run', metavar='DIRECTORIO',
+                        help="Proyecta el tiempo de reloj y el ahorro del directorio con el "
+                             "historial de resultados y sale sin codificar")
+    parser.add_argument('--ledger', metavar='RUTA',
+                        help="Base SQLite del historial de resultados "
+                             "(por defecto: ~/.cache/compress_mp4/results.sqlite)")
+    parser.add_argument('--no-ledger', action='store_true',
+                        help="No registra los resultados ni los usa para predecir")
+    parser.add_argument('--stall-seconds', type=float, default=STALL_MIN_SECONDS, metavar='S',
+                        help="Segundos mínimos sin avances para detener un encoder estancado; la "
+                             f"ventana crece con el ritmo del trabajo (por defecto: {STALL_MIN_SECONDS}, "
+                             "0 = sin vigilancia)")
+    parser.add_argument('--timeout-factor', type=float, default=JOB_TIMEOUT_FACTOR, metavar='F',
+                        help="Tiempo máximo de un trabajo en múltiplos del tiempo predicho "
+                             f"(mínimo {JOB_TIMEOUT_MIN // 60} min; por defecto: {JOB_TIMEOUT_FACTOR}, "
+                             "0 = sin límite)")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="Desactiva la caché persistente de análisis de videos")
+    parser.add_argument('--auto-tune', action='store_true',
+                        help="Elige preset y calidad por video con codificaciones cortas de prueba "
+                             "(requiere ffmpeg para medir SSIM)")
+    parser.add_argument('--target-ssim', type=float, default=DEFAULT_TARGET_SSIM,
+                        help=f"SSIM mínimo de --auto-tune (por defecto: {DEFAULT_TARGET_SSIM})")
+    parser.add_argument('--target-ratio', type=float, metavar='PROPORCIÓN',
+                        help="Tamaño máximo salida/origen para --auto-tune, p. ej. 0.4")
+    parser.add_argument('--target-size', metavar='TAMAÑO',
+                        help="Tamaño total máximo de las salidas del lote, p. ej. 50G o 700M")
+    parser.add_argument('--target-savings', type=float, metavar='PORCENTAJE',
+                        help="Ahorro mínimo del lote en porcentaje, p. ej. 60")
+    parser.add_argument('--dedup', action='store_true',
+                        help="Codifica una sola vez las copias idénticas y reutiliza la salida "
+                             "(huella por tamaño y bloques muestreados)")
+    parser.add_argument('--dedup-verify', action='store_true',
+                        help="Con --dedup, confirma cada copia con el hash completo del archivo")
+    parser.add_argument('--scratch', metavar='DIRECTORIO',
+                        help="Disco local donde precargar los videos y codificar las salidas "
+                             "(para bibliotecas en SMB/NFS)")
+    parser.add_argument('--prefetch', type=int, default=2, metavar='K',
+                        help="Videos a precargar por adelantado en --scratch (por defecto: 2)")
+    parser.add_argument('--scratch-size', metavar='TAMAÑO',
+                        help="Espacio máximo a usar en --scratch, p. ej. 100G (por defecto: 80%% del libre)")
+    parser.add_argument('--scratch-bwlimit', type=float, metavar='MB/S',
+                        help="Límite de ancho de banda de las copias de --scratch en MB/s")
+    parser.add_argument('--min-free', default='1G', metavar='TAMAÑO',
+                        help="Espacio libre mínimo a conservar en el destino; los trabajos esperan "
+                             "si su salida lo invadiría (por defecto: 1G, 0 = sin control)")
+    parser.add_argument('--progress-log', metavar='RUTA',
+                        help="Escribe los eventos de progreso (fps, ETA, bytes) como líneas JSON")
+    parser.add_argument('--metrics', metavar='HOST:PUERTO',
+                        help="Sirve métricas de Prometheus en http://HOST:PUERTO/metrics")
+    parser.add_argument('--metrics-file', metavar='RUTA',
+                        help="Reescribe periódicamente las métricas de Prometheus en un archivo")
+    parser.add_argument('--metrics-interval', type=float, default=15.0,
+                        help="Segundos entre escrituras de --metrics-file (por defecto: 15)")
+    parser.add_argument('--journal', metavar='RUTA',
+                        help="Diario de trabajos para reanudar lotes interrumpidos "
+                             "(por defecto se usa uno por directorio en ~/.cache/compress_mp4)")
+    parser.add_argument('--no-journal', action='store_true',
+                        help="No registra ni reanuda el progreso del lote")
+    parser.add_argument('--no-stream-copy', action='store_true',
+                        help="No copia los flujos de los videos ya eficientes (remux o solo audio); "
+                             "se omiten como antes")
+    parser.add_argument('--no-skip', action='store_true',
+                        help="Recodifica todos los videos, incluso los ya codificados eficientemente")
+    parser.add_argument('--skip-bpp', metavar='MODO:CODEC=BPP', action='append', default=[],
+                        help="Ajusta un umbral de omisión, p. ej. gpu:hevc=0.05 (repetible)")
+    args = parser.parse_args()
+    if args.jobs < 1:
+        parser.error("--jobs debe ser mayor o igual a 1")
+    if args.max_jobs is not None and args.max_jobs < args.jobs:
+        parser.error("--max-jobs no puede ser menor que --jobs")
+    if args.codec and args.encoder != 'ffmpeg':
+        parser.error("--codec requiere --encoder ffmpeg")
+    if args.codec == 'hevc_videotoolbox' and sys.platform != 'darwin':
+        parser.error("--codec hevc_videotoolbox solo está disponible en macOS")
+    if args.threads < 0:
+        parser.error("--threads no puede ser negativo")
+    if args.stall_seconds < 0 or args.timeout_factor < 0:
+        parser.error("--stall-seconds y --timeout-factor no pueden ser negativos")
+    if args.coordinator and not os.path.isdir(args.coordinator):
+        parser.error(f"--coordinator: el directorio no existe: {args.coordinator}")
+    if not re.fullmatch(r"[\w.\-]+:\d+", args.bind):
+        parser.error(f"--bind inválido: '{args.bind}' (formato esperado HOST:PUERTO)")
+    if not 0 < args.target_ssim <= 1:
+        parser.error("--target-ssim debe estar entre 0 y 1")
+    if args.target_ratio is not None and args.target_ratio <= 0:
+        parser.error("--target-ratio debe ser mayor que 0")
+    if args.target_size is not None:
+        args.target_size = parse_size(args.target_size)
+        if not args.target_size:
+            parser.error("--target-size inválido (formato esperado p. ej. 50G, 700M o bytes)")
+        if args.target_savings is not None:
+            parser.error("--target-size y --target-savings no se pueden combinar")
+        if args.watch:
+            parser.error("--target-size necesita un lote finito; en modo servicio use --target-savings")
+    min_free = parse_size(args.min_free)
+    if min_free is None:
+        parser.error("--min-free inválido (formato esperado p. ej. 1G o 500M)")
+    args.min_free = min_free
+    if args.scratch_size is not None:
+        args.scratch_size = parse_size(args.scratch_size)
+        if not args.scratch_size:
+            parser.error("--scratch-size inválido (formato esperado p. ej. 100G)")
+    if args.prefetch < 1:
+        parser.error("--prefetch debe ser mayor o igual a 1")
+    if args.target_savings is not None and not 0 < args.target_savings < 100:
+        parser.error("--target-savings debe estar entre 0 y 100")
+    if args.metrics and not re.fullmatch(r"[\w.\-]+:\d+", args.metrics):
+        parser.error(f"--metrics inválido: '{args.metrics}' (formato esperado HOST:PUERTO)")
+    if args.simulate_order and not os.path.isdir(args.simulate_order):
+        parser.error(f"--simulate-order: el directorio no existe: {args.simulate_order}")
+    if args.dry_run and not os.path.isdir(args.dry_run):
+        parser.error(f"--dry-run: el directorio no existe: {args.dry_run}")
+    if args.watch and not os.path.isdir(args.watch):
+        parser.error(f"--watch: el directorio no existe: {args.watch}")
 
-        # Ejecutar compresión del video
-        compress_video(source_path, dest_path, mode, handbrake_path)
+    # Umbrales de omisión: copia de los valores por defecto con los ajustes del usuario
+    args.skip_thresholds = {m: dict(codecs) for m, codecs in SKIP_BPP_THRESHOLDS.items()}
+    for item in args.skip_bpp:
+        match = re.fullmatch(r"(cpu|gpu):(\w+)=([\d.]+)", item.strip())
+        if not match:
+            parser.error(f"--skip-bpp inválido: '{item}' (formato esperado MODO:CODEC=BPP)")
+        args.skip_thresholds[match.group(1)][match.group(2).lower()] = float(match.group(3))
+    if args.no_skip:
+        args.skip_thresholds = {}
+    return args
 
 # --- Flujo Principal de Ejecución ---
 if __name__ == "__main__":
@@ -590,26 +5881,168 @@ if __name__ == "__main__":
     Configura HandBrake, verifica permisos para monitoreo energético, 
     obtiene opciones del usuario y ejecuta compresión con tracking de energía.
     """
-    # Buscar instalación de HandBrakeCLI
+    args = parse_arguments()
+    probe_cache.enabled = not args.no_cache
+    tuning_cache.enabled = not args.no_cache
+    if not args.no_ledger:
+        results_ledger = ResultsLedger(args.ledger)
+    stall_seconds = args.stall_seconds
+    job_timeout_factor = args.timeout_factor
+    if args.progress_log:
+        add_progress_listener(ProgressLog(args.progress_log))
+
+    # Métricas del lote para Prometheus (servidor HTTP y/o archivo)
+    if args.metrics or args.metrics_file:
+        metrics.enabled = True
+        add_progress_listener(metrics.on_event)
+        if args.metrics:
+            host, port = args.metrics.rsplit(':', 1)
+            try:
+                start_metrics_server((host, int(port)))
+                print(f"📊 Métricas disponibles en http://{args.metrics}/metrics")
+            except OSError as e:
+                print(f"❌ Error: No se pudo abrir el puerto de métricas {args.metrics}: {e}")
+                sys.exit(1)
+        if args.metrics_file:
+            start_metrics_file(args.metrics_file, args.metrics_interval)
+
+    # Simulación de las políticas de orden y plan del lote (no necesitan codificar)
+    if args.simulate_order or args.dry_run:
+        if args.encoder == 'ffmpeg':
+            encoder_backend = FfmpegBackend(find_ffmpeg(), codec=args.codec, preset=args.encoder_preset)
+        if args.simulate_order:
+            compare_orderings(iter_videos(args.simulate_order), args.mode or 'cpu', args.jobs,
+                              find_handbrake_cli(), args.skip_thresholds)
+        else:
+            plan_dry_run(iter_videos(args.dry_run), args.mode or 'cpu', args.jobs, args.order,
+                         find_handbrake_cli(), args.skip_thresholds)
+        probe_cache.save()
+        sys.exit(0)
+
+    # Buscar el motor de codificación (HandBrakeCLI, o ffmpeg con --encoder ffmpeg)
     handbrake_cli_path = find_handbrake_cli()
-    if not handbrake_cli_path:
-        print("❌ Error: No se pudo encontrar 'HandBrakeCLI'.")
-        print("💡 Asegúrese de que esté instalado y en su PATH o en /Applications.")
-        sys.exit(1)
-    
-    print(f"✅ HandBrakeCLI encontrado en: {handbrake_cli_path}")
+    if args.encoder == 'ffmpeg':
+        ffmpeg_cli_path = find_ffmpeg()
+        if not ffmpeg_cli_path:
+            print("❌ Error: No se pudo encontrar 'ffmpeg'.")
+            print("💡 Instálelo (p. ej. brew install ffmpeg o apt install ffmpeg) o use --encoder handbrake.")
+            sys.exit(1)
+        encoder_backend = FfmpegBackend(ffmpeg_cli_path, codec=args.codec, preset=args.encoder_preset)
+        if args.encoder_preset and args.codec in FFMPEG_NO_PRESET:
+            print(f"⚠️  {args.codec} no tiene presets: se ignora --encoder-preset.")
+        print(f"✅ ffmpeg encontrado en: {ffmpeg_cli_path} ({encoder_backend.describe(args.mode or 'cpu')})")
+    else:
+        if not handbrake_cli_path:
+            print("❌ Error: No se pudo encontrar 'HandBrakeCLI'.")
+            print("💡 Asegúrese de que esté instalado y en su PATH o en /Applications.")
+            sys.exit(1)
+        if args.encoder_preset:
+            encoder_backend = HandBrakeBackend(handbrake_cli_path, preset=args.encoder_preset)
+        print(f"✅ HandBrakeCLI encontrado en: {handbrake_cli_path}")
     
-    # Verificar disponibilidad de monitoreo energético
-    if check_powermetrics_permissions():
-        print("⚡ Monitoreo energético disponible")
+    # Iniciar monitoreo energético (RAPL en Linux, powermetrics en macOS)
+    if start_energy_sampler():
+        print(f"⚡ Monitoreo energético activado ({energy_sampler.backend.name})")
     else:
         print("⚠️  Monitoreo energético requiere permisos sudo")
         print("💡 Para habilitar monitoreo energético, ejecute: sudo python3 compress.py")
         print("   (El script funcionará normalmente sin monitoreo energético)")
 
+    if args.auto_tune and not find_ffmpeg():
+        print("⚠️  --auto-tune requiere ffmpeg para medir la calidad; se usarán los ajustes fijos")
+
+    # Opciones comunes de procesamiento
+    encode_options = {
+        'jobs': args.jobs,
+        'threads': args.threads,
+        'skip_thresholds': args.skip_thresholds,
+        'stream_copy': not args.no_stream_copy,
+        'split_segments': args.split,
+        'split_min_duration': args.split_min_minutes * 60,
+        'tune': {'target_ssim': args.target_ssim, 'target_ratio': args.target_ratio} if args.auto_tune else None,
+        'dedup': ('verify' if args.dedup_verify else 'fast') if args.dedup or args.dedup_verify else None,
+        'concurrency': (ConcurrencyController(args.jobs, max_jobs=args.max_jobs)
+                        if args.adaptive_jobs else None),
+    }
+
+    # Objetivo de ahorro: se aplica a medida que llegan los videos
+    if args.target_savings is not None:
+        size_budget = SizeBudget(ratio=1 - args.target_savings / 100)
+    # Control de admisión por espacio libre en el destino
+    if args.min_free > 0:
+        space_gate = SpaceGate(args.min_free)
+
+    # Precarga a disco local para bibliotecas en red
+    if args.scratch:
+        try:
+            scratch_stager = ScratchStager(args.scratch, prefetch=args.prefetch, max_bytes=args.scratch_size,
+                                           bandwidth=args.scratch_bwlimit * 1024 ** 2 if args.scratch_bwlimit else None)
+            print(f"📦 Scratch local: {scratch_stager.scratch_dir} (precarga de {args.prefetch} videos, "
+                  f"hasta {scratch_stager.max_bytes / 1024 ** 3:.1f} GB)")
+        except OSError as e:
+            print(f"❌ Error: No se puede usar el directorio scratch {args.scratch}: {e}")
+            sys.exit(1)
+    if (args.target_size or args.target_savings) and (args.worker or args.coordinator):
+        print("⚠️  Los objetivos de tamaño no se aplican en la granja de codificación")
+
+    # Granja: trabajador que procesa trabajos de un coordinador
+    if args.worker:
+        print(f"🛠️  Trabajador conectado a {args.worker} ({args.jobs} trabajos simultáneos)")
+        run_worker(args.worker, handbrake_cli_path, jobs=args.jobs, token=args.farm_token)
+        sys.exit(0)
+
+    # Granja: coordinador que reparte los videos de un directorio
+    if args.coordinator:
+        compression_mode = args.mode or 'cpu'
+        host, port = args.bind.rsplit(':', 1)
+        farm_options = {key: value for key, value in encode_options.items() if key not in ('jobs', 'dedup', 'concurrency')}
+        farm_videos = order_videos(iter_videos(args.coordinator), compression_mode, args.order,
+                                   handbrake_cli_path, args.skip_thresholds)
+        coordinator = EncodeCoordinator(farm_videos, compression_mode,
+                                        bind=(host, int(port)), lease_seconds=args.lease_seconds,
+                                        token=args.farm_token, encode_options=farm_options)
+        print(f"🧭 Coordinador escuchando en {coordinator.url} (modo {compression_mode.upper()})")
+        local_workers = []
+        for _ in range(args.local_workers):
+            command = [sys.executable, os.path.abspath(__file__), '--worker', coordinator.url,
+                       '--jobs', '1', '--encoder', args.encoder]
+            if args.codec:
+                command += ['--codec', args.codec]
+            if args.encoder_preset:
+                command += ['--encoder-preset', args.encoder_preset]
+            command += ['--stall-seconds', str(args.stall_seconds),
+                        '--timeout-factor', str(args.timeout_factor)]
+            if args.farm_token:
+                command += ['--farm-token', args.farm_token]
+            local_workers.append(subprocess.Popen(command))
+        try:
+            coordinator.serve(local_workers)
+        except KeyboardInterrupt:
+            print("\n🛑 Coordinador detenido.")
+        display_statistics()
+        sys.exit(0)
+
+    # Modo servicio: vigilar una carpeta de ingesta hasta Ctrl+C
+    if args.watch:
+        compression_mode = args.mode or 'cpu'
+        watcher = FolderWatcher(args.watch, stable_seconds=args.stable_seconds,
+                                poll_interval=args.poll_interval)
+        new_videos = watcher.watch()
+        print(f"👀 Vigilando {watcher.directory} ({watcher.backend}, modo {compression_mode.upper()}). "
+              f"Ctrl+C para detener.")
+        try:
+            process_videos(new_videos, compression_mode, handbrake_cli_path, **encode_options)
+        except KeyboardInterrupt:
+            watcher.stop()
+            print("\n🛑 Vigilancia detenida.")
+            source_disposer.flush()
+        display_statistics()
+        sys.exit(0)
+
     # Obtener configuraciones del usuario
     shutdown_option, compression_option = shutdown_option()
-    compression_mode = get_compression_mode()
+    compression_mode = args.mode or get_compression_mode()
+    journal = None
 
     # Procesar según método de selección de archivos
     if compression_option == '1':
@@ -625,7 +6058,14 @@ if __name__ == "__main__":
                 path = input(f"Ruta del video {i+1}: ").strip()
                 video_paths.append(path)
                 
-            process_videos(video_paths, compression_mode, handbrake_cli_path)
+            video_paths = order_videos(video_paths, compression_mode, args.order,
+                                       handbrake_cli_path, args.skip_thresholds)
+            if args.journal and not args.no_journal:
+                journal = JobJournal(args.journal).open()
+                encode_options['journal'] = journal
+            if args.target_size:
+                video_paths, size_budget = budget_for_batch(video_paths, args.target_size)
+            process_videos(video_paths, compression_mode, handbrake_cli_path, **encode_options)
             
         except ValueError:
             print("❌ Entrada no válida. Debe ingresar un número entero.")
@@ -638,13 +6078,36 @@ if __name__ == "__main__":
             print(f"❌ El directorio no existe: {directory}")
             sys.exit(1)
             
-        video_paths = get_all_videos(directory)
-        if not video_paths:
+        # Descubrimiento incremental: la compresión empieza con el primer video encontrado
+        discovered = iter_videos(directory)
+        first_video = next(discovered, None)
+        if first_video is None:
             print("ℹ️  No se encontraron videos MP4 en el directorio especificado.")
             sys.exit(0)
-            
-        print(f"📁 Encontrados {len(video_paths)} videos para procesar.")
-        process_videos(video_paths, compression_mode, handbrake_cli_path)
+        video_paths = itertools.chain([first_video], discovered)
+        if args.order != 'walk':
+            # Ordenar necesita analizar antes todo el directorio
+            video_paths = order_videos(video_paths, compression_mode, args.order,
+                                       handbrake_cli_path, args.skip_thresholds)
+            print(f"🧮 Orden {args.order}: {len(video_paths)} videos")
+        if args.target_size:
+            # El reparto del tamaño total necesita recorrer antes todo el directorio
+            video_paths, size_budget = budget_for_batch(video_paths, args.target_size)
+            print(f"🎯 Objetivo: {len(video_paths)} videos en {args.target_size / (1024 ** 3):.2f} GB")
+        else:
+            print("📁 Procesando videos a medida que se recorre el directorio...")
+
+        # Diario para reanudar el lote si se interrumpe
+        if not args.no_journal:
+            journal = JobJournal(args.journal or JobJournal.default_path(directory)).open()
+            encode_options['journal'] = journal
+            print(f"📒 Diario de trabajos: {journal.path}")
+
+        process_videos(video_paths, compression_mode, handbrake_cli_path, **encode_options)
+
+    # Archivar el diario si el lote terminó sin errores
+    if journal is not None:
+        journal.close(finished=stats.failed_videos == 0)
 
     # Mostrar resumen y enviar notificación
     display_statistics()
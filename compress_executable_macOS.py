@@ -2,14 +2,24 @@ import subprocess
 import os
 import sys
 import time
+import re
 import getpass
 import glob
+import shutil
+from concurrent.futures import ThreadPoolExecutor
 
 # Variables globales para almacenar las estadísticas de compresión
 total_videos = 0
 total_compression_time = 0
 total_original_size = 0
 total_compressed_size = 0
+videos_fallidos = 0
+videos_rechazados = []
+
+# Los originales verificados se mueven a la papelera en lotes, en un hilo aparte
+LOTE_PAPELERA = 16
+papelera_pendiente = []
+papelera_hilo = ThreadPoolExecutor(max_workers=1)
 
 def get_all_videos(directory):
     """
@@ -61,6 +71,76 @@ def shutdown_option():
 # Llama a la función de opción de apagado al inicio del script y guarda la elección del usuario
 shutdown, compression_option = shutdown_option()
 
+# Vigilancia de HandBrakeCLI: segundos entre comprobaciones, segundos mínimos sin que
+# cambie el archivo de salida y tiempo máximo (mínimo fijo más segundos por segundo de
+# video: 10 veces lo que tarda x264 a 1080p, unos 0.6 s por segundo de video). Si no se
+# puede leer la duración se usan segundos por MB de origen
+VIGILANCIA_INTERVALO = 5
+VIGILANCIA_SIN_AVANCE = 300
+TIEMPO_MAXIMO_MINIMO = 30 * 60
+TIEMPO_MAXIMO_POR_SEGUNDO = 6
+TIEMPO_MAXIMO_POR_MB = 2
+
+def duracion_video(handbrakecli_path, ruta_video):
+    """
+    Lee la duración de un video con el escaneo de HandBrakeCLI (sin codificar).
+    Retorna la duración en segundos, o None si no se pudo leer.
+    """
+    try:
+        proceso = subprocess.run([handbrakecli_path, '-i', ruta_video, '--scan'], capture_output=True,
+                                 text=True, encoding='utf-8', errors='ignore', timeout=120)
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    # HandBrakeCLI imprime el escaneo en stderr: "+ duration: 00:10:05"
+    coincidencia = re.search(r"\+ duration: (\d+):(\d+):(\d+)", proceso.stderr + proceso.stdout)
+    if not coincidencia:
+        return None
+    horas, minutos, segundos = (int(grupo) for grupo in coincidencia.groups())
+    return horas * 3600 + minutos * 60 + segundos
+
+
+def ejecutar_con_vigilancia(comando, ruta_destino, tiempo_maximo):
+    """
+    Ejecuta HandBrakeCLI y lo termina si se estanca.
+
+    Se considera estancado si el archivo de salida no cambia (tamaño o fecha de modificación)
+    durante más de VIGILANCIA_SIN_AVANCE segundos, o 20 veces el intervalo medio entre
+    cambios si el trabajo avanza más lento, o si supera tiempo_maximo segundos.
+    Retorna True si HandBrakeCLI terminó correctamente.
+    """
+    proceso = subprocess.Popen(comando)
+    inicio = ultimo_avance = time.monotonic()
+    intervalo_medio = 0
+    estado_salida = None
+    while True:
+        # Espera a que termine el proceso, como mucho VIGILANCIA_INTERVALO segundos
+        try:
+            return proceso.wait(timeout=VIGILANCIA_INTERVALO) == 0
+        except subprocess.TimeoutExpired:
+            pass
+
+        try:
+            estado = os.stat(ruta_destino)
+            estado = (estado.st_size, estado.st_mtime_ns)
+        except OSError:
+            estado = None
+        ahora = time.monotonic()
+        if estado != estado_salida:
+            if estado_salida is not None:
+                intervalo_medio = 0.8 * intervalo_medio + 0.2 * (ahora - ultimo_avance)
+            estado_salida, ultimo_avance = estado, ahora
+
+        if ahora - inicio > tiempo_maximo:
+            motivo = f"superó el tiempo máximo de {tiempo_maximo / 60:.0f} min"
+        elif ahora - ultimo_avance > max(VIGILANCIA_SIN_AVANCE, 20 * intervalo_medio):
+            motivo = f"sin avances durante {ahora - ultimo_avance:.0f} s"
+        else:
+            continue
+        print(f"HandBrakeCLI detenido: {motivo}")
+        proceso.kill()
+        proceso.wait()
+        return False
+
 def comprimir_video(ruta_origen, ruta_destino):
     """
     Esta función comprime Multiples videos usando HandBrakeCLI.
@@ -74,9 +154,7 @@ def comprimir_video(ruta_origen, ruta_destino):
     global total_compression_time
     global total_original_size
     global total_compressed_size
-
-    # Incrementa el total de videos
-    total_videos += 1
+    global videos_fallidos
 
     # Reemplaza las barras invertidas en las rutas de los archivos
     ruta_origen = ruta_origen.replace('\\', '')
@@ -84,7 +162,6 @@ def comprimir_video(ruta_origen, ruta_destino):
     
     # Obtiene el tamaño del video antes de la compresión
     original_size = os.path.getsize(ruta_origen)
-    total_original_size += original_size
 
     # Registra el tiempo de inicio de la compresión
     start_time = time.time()
@@ -93,48 +170,85 @@ def comprimir_video(ruta_origen, ruta_destino):
     handbrakecli_path = os.path.join(os.path.dirname(__file__), 'HandBrakeCLI')
 
     # Comando para comprimir el video
-    comando = [handbrakecli_path, '-i', f'"{ruta_origen}"', '-o', f'"{ruta_destino}"', '-f', 'mp4', '--optimize', '-e', 'x264', '-q', '26', '-r', '30', '-E', 'ca_aac', '-B', '96', '-w', '1920']
+    comando = [handbrakecli_path, '-i', ruta_origen, '-o', ruta_destino, '-f', 'mp4', '--optimize', '-e', 'x264', '-q', '26', '-r', '30', '-E', 'ca_aac', '-B', '96', '-w', '1920']
 
-    # Ejecuta el comando
-    subprocess.run(' '.join(comando), shell=True)
-    
-    # Espera un poco antes de obtener el tamaño del archivo de video comprimido
-    time.sleep(3)
-    
-    # Obtiene el tamaño del video después de la compresión
+    # Ejecuta HandBrakeCLI sin shell (así el vigilante puede terminarlo directamente)
+    duracion = duracion_video(handbrakecli_path, ruta_origen)
+    if duracion:
+        tiempo_maximo = max(TIEMPO_MAXIMO_MINIMO, duracion * TIEMPO_MAXIMO_POR_SEGUNDO)
+    else:
+        tiempo_maximo = max(TIEMPO_MAXIMO_MINIMO, original_size / (1024 ** 2) * TIEMPO_MAXIMO_POR_MB)
+    if not ejecutar_con_vigilancia(comando, ruta_destino, tiempo_maximo) or not os.path.isfile(ruta_destino):
+        # Falló o se estancó: se conserva el original y se descarta la salida a medias
+        print(f"Error al comprimir {ruta_origen}; el archivo original se conserva.")
+        videos_fallidos += 1
+        if os.path.exists(ruta_destino):
+            os.remove(ruta_destino)
+        return
+
+    # Verificación rápida antes de tocar el original: la salida debe existir y ser más pequeña
     compressed_size = os.path.getsize(ruta_destino)
+    if compressed_size == 0 or compressed_size >= original_size:
+        motivo = "salida vacía" if compressed_size == 0 else "la salida no es más pequeña que el original"
+        print(f"Salida rechazada para {ruta_origen} ({motivo}); el archivo original se conserva.")
+        videos_rechazados.append((ruta_origen, motivo))
+        os.remove(ruta_destino)
+        return
+
+    # Cuenta el video comprimido
+    total_videos += 1
+    total_original_size += original_size
     total_compressed_size += compressed_size
 
     # Calcula el tiempo que tomó la compresión en segundos
     compression_time_seconds = time.time() - start_time
     total_compression_time += compression_time_seconds
-    
-    # Mueve el archivo original a la papelera
-    username = getpass.getuser()
+
+    # Encola el original; la papelera se vacía por lotes sin detener la siguiente compresión
+    papelera_pendiente.append(ruta_origen)
+    if len(papelera_pendiente) >= LOTE_PAPELERA:
+        enviar_lote_a_papelera()
+
+def ruta_papelera():
+    """
+    Devuelve la ruta de la papelera del usuario que ejecuta el script.
+    """
     # Verifica si el script se está ejecutando con privilegios de root
     if os.geteuid() == 0:
-        # Si es así, usa la ruta a la papelera del usuario root
-        trash_path = '/var/root/.Trash'
-    else:
-        # Si no, usa la ruta a la papelera del usuario actual
-        trash_path = f'/Users/{username}/.Trash'
-
-    # Verifica si la ruta de origen es un directorio
-    if os.path.isdir(ruta_origen):
-        # Si es un directorio, busca todos los archivos .mp4 en el directorio y sus subdirectorios
-        for ruta_archivo in glob.glob(ruta_origen + '/**/*.mp4', recursive=True):
-            comando = f'mv "{ruta_archivo}" "{trash_path}"'
+        return '/var/root/.Trash'
+    return f'/Users/{getpass.getuser()}/.Trash'
+
+def mover_a_papelera(rutas):
+    """
+    Mueve un lote de archivos a la papelera sin lanzar un proceso por archivo.
+
+    Parámetros:
+    rutas -- Lista de rutas de archivos (o directorios con videos .mp4) a mover.
+    """
+    trash_path = ruta_papelera()
+    for ruta in rutas:
+        # Si es un directorio, mueve todos los archivos .mp4 que contiene
+        archivos = glob.glob(ruta + '/**/*.mp4', recursive=True) if os.path.isdir(ruta) else [ruta]
+        for ruta_archivo in archivos:
+            nombre_base, extension = os.path.splitext(os.path.basename(ruta_archivo))
+            destino = os.path.join(trash_path, nombre_base + extension)
+            # Evita sobrescribir un archivo con el mismo nombre en la papelera
+            contador = 1
+            while os.path.exists(destino):
+                destino = os.path.join(trash_path, f"{nombre_base} {contador}{extension}")
+                contador += 1
             try:
-                subprocess.run(comando, shell=True, check=True)
-            except subprocess.CalledProcessError:
+                shutil.move(ruta_archivo, destino)
+            except OSError:
                 print(f"Error al mover el archivo {ruta_archivo} a la papelera")
-    else:
-        # Si no es un directorio, asume que es un archivo y lo mueve a la papelera
-        comando = f'mv "{ruta_origen}" "{trash_path}"'
-        try:
-            subprocess.run(comando, shell=True, check=True)
-        except subprocess.CalledProcessError:
-            print(f"Error al mover el archivo {ruta_origen} a la papelera")
+
+def enviar_lote_a_papelera():
+    """
+    Entrega los originales pendientes al hilo de la papelera como un solo lote.
+    """
+    if papelera_pendiente:
+        papelera_hilo.submit(mover_a_papelera, list(papelera_pendiente))
+        papelera_pendiente.clear()
 
 def alert_success():
     """
@@ -152,7 +266,7 @@ def alert_success():
 
     # Calcula el porcentaje de espacio ganado y el espacio ganado en GB
     space_saved = total_original_size - total_compressed_size
-    percent_space_saved = (space_saved / total_original_size) * 100
+    percent_space_saved = (space_saved / total_original_size) * 100 if total_original_size else 0
     space_saved_gb = space_saved / (1024 ** 3)
     
     # Genera un sonido de alerta en caso de éxito
@@ -166,6 +280,12 @@ def alert_success():
         f"Porcentaje de compresión: {percent_space_saved:.2f}%\n"
         f"Espacio ganado: {space_saved_gb:.2f} GB"
     )
+    if videos_fallidos:
+        print(f"Videos con error (originales conservados): {videos_fallidos}")
+    if videos_rechazados:
+        print(f"Salidas rechazadas por la verificación (originales conservados): {len(videos_rechazados)}")
+        for ruta_origen, motivo in videos_rechazados:
+            print(f"  {ruta_origen}: {motivo}")
   
 if compression_option == '1':
     # Solicita la cantidad de videos a comprimir
@@ -227,6 +347,10 @@ else:
         comprimir_video(ruta_origen, ruta_destino)
     
 
+# Termina de mover los originales pendientes antes de mostrar las estadísticas
+enviar_lote_a_papelera()
+papelera_hilo.shutdown(wait=True)
+
 # Llama a la función de alerta de éxito al finalizar la compresión de todos los videos
 alert_success()
 
@@ -0,0 +1,70 @@
+import os
+import struct
+import sys
+import tempfile
+
+import pytest
+
+# Las cachés del script (sondeos, historial) no deben tocar las del usuario
+os.environ['XDG_CACHE_HOME'] = tempfile.mkdtemp(prefix='compress_tests_')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def box(box_type, *payload):
+    body = b''.join(payload)
+    return struct.pack('>I4s', 8 + len(body), box_type) + body
+
+
+def full_box(box_type, *payload, version=0):
+    return box(box_type, bytes([version, 0, 0, 0]), *payload)
+
+
+def build_track(handler, fourcc, timescale, deltas, sample_size, width=0, height=0, keyframes=None):
+    """Caja trak mínima: tkhd, mdhd, hdlr y stbl (stsd, stts, stsz y stss opcional)."""
+    sample_count = sum(count for count, _ in deltas)
+    duration = sum(count * delta for count, delta in deltas)
+    tkhd = full_box(b'tkhd', bytes(72), struct.pack('>II', width << 16, height << 16))
+    mdhd = full_box(b'mdhd', struct.pack('>IIII', 0, 0, timescale, duration), bytes(4))
+    hdlr = full_box(b'hdlr', bytes(4), handler, bytes(13))
+    entry = struct.pack('>I4s', 86, fourcc) + bytes(24) + struct.pack('>HH', width, height) + bytes(50)
+    stbl = [full_box(b'stsd', struct.pack('>I', 1), entry),
+            full_box(b'stts', struct.pack('>I', len(deltas)),
+                     *(struct.pack('>II', count, delta) for count, delta in deltas)),
+            full_box(b'stsz', struct.pack('>II', sample_size, sample_count))]
+    if keyframes is not None:
+        stbl.append(full_box(b'stss', struct.pack('>I', len(keyframes)),
+                             *(struct.pack('>I', sample) for sample in keyframes)))
+    return box(b'trak', tkhd, box(b'mdia', mdhd, hdlr, box(b'minf', box(b'stbl', *stbl))))
+
+
+@pytest.fixture
+def make_mp4(tmp_path):
+    """
+    Fábrica de MP4 sintéticos con cajas hechas a mano (sin códec real): las cabeceras
+    describen la pista de video (y opcionalmente de audio) y mdat se rellena con ceros.
+    """
+    def make(name='clip.mp4', width=1920, height=1080, fps=30, duration=10.0, fourcc=b'avc1',
+             video_bitrate=4_000_000, audio=b'mp4a', audio_bitrate=96_000, faststart=True,
+             keyframes=None, deltas=None, mdat_size=None, truncate=None):
+        timescale = 90000
+        deltas = deltas or [(int(duration * fps), timescale // fps)]
+        sample_count = sum(count for count, _ in deltas)
+        seconds = sum(count * delta for count, delta in deltas) / timescale
+        tracks = [build_track(b'vide', fourcc, timescale, deltas,
+                              int(video_bitrate * seconds / 8 / sample_count), width, height, keyframes)]
+        if audio:
+            frames = int(seconds * 48000 / 1024)
+            tracks.append(build_track(b'soun', audio, 48000, [(frames, 1024)],
+                                      int(audio_bitrate * seconds / 8 / frames)))
+        mvhd = full_box(b'mvhd', struct.pack('>IIII', 0, 0, 1000, int(seconds * 1000)), bytes(80))
+        moov = box(b'moov', mvhd, *tracks)
+        mdat = box(b'mdat', bytes(mdat_size if mdat_size is not None else 1024))
+        data = box(b'ftyp', b'isom', bytes(4), b'isommp41')
+        data += moov + mdat if faststart else mdat + moov
+        if truncate:
+            data = data[:truncate]
+        path = tmp_path / name
+        path.write_bytes(data)
+        return str(path)
+
+    return make
@@ -0,0 +1,22 @@
+import compress
+
+
+def test_ffmpeg_videotoolbox_has_no_preset():
+    backend = compress.FfmpegBackend('ffmpeg', codec='hevc_videotoolbox', preset='slow')
+    command = backend.build_command('in.mov', 'out.mp4', 'gpu', tuning={'preset': 'fast', 'quality': 60})
+    assert '-preset' not in command
+    assert '-pix_fmt' not in command
+    assert command[command.index('-q:v') + 1] == '60'
+    presets, qualities, _ = backend.tune_space('gpu')
+    assert presets == []
+    assert qualities
+    assert 'preset' not in backend.describe('gpu')
+
+
+def test_ffmpeg_software_codecs_keep_preset():
+    backend = compress.FfmpegBackend('ffmpeg', codec='libx265', preset='slow')
+    command = backend.build_command('in.mov', 'out.mp4', 'cpu')
+    assert command[command.index('-preset') + 1] == 'slow'
+    tuned = backend.build_command('in.mov', 'out.mp4', 'cpu', tuning={'preset': 'fast', 'quality': 26})
+    assert tuned[tuned.index('-preset') + 1] == 'fast'
+    assert tuned[tuned.index('-crf') + 1] == '26'
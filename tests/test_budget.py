@@ -0,0 +1,58 @@
+import pytest
+
+import compress
+
+
+@pytest.mark.parametrize('text, size', [
+    ('123456', 123456),
+    ('700M', 700 * 1024 ** 2),
+    ('50G', 50 * 1024 ** 3),
+    ('1.5T', int(1.5 * 1024 ** 4)),
+    ('10k', 10 * 1024),
+    (' 2 GiB ', 2 * 1024 ** 3),
+    ('512MB', 512 * 1024 ** 2),
+])
+def test_parse_size(text, size):
+    assert compress.parse_size(text) == size
+
+
+@pytest.mark.parametrize('text', ['', 'G', '-5G', '5X', '1.2.3M', 'cincuenta'])
+def test_parse_size_invalid(text):
+    assert compress.parse_size(text) is None
+
+
+def test_total_budget_is_shared_by_input_size():
+    budget = compress.SizeBudget(total_bytes=1000, total_input=4000)
+    first = budget.reserve(1000)
+    assert first['bytes'] == 250
+    # Una reserva simultánea recibe su parte de lo que queda
+    second = budget.reserve(2000)
+    assert second['bytes'] == 500
+    # El ahorro de más del primero pasa a los siguientes
+    budget.settle(first, 150)
+    budget.settle(second, 500)
+    assert budget.reserve(1000)['bytes'] == 350
+
+
+def test_total_budget_overrun_is_taken_from_the_rest():
+    budget = compress.SizeBudget(total_bytes=1000, total_input=2000)
+    budget.settle(budget.reserve(1000), 700)
+    assert budget.reserve(1000)['bytes'] == 300
+
+
+def test_ratio_budget_tracks_accumulated_output():
+    budget = compress.SizeBudget(ratio=0.5)
+    first = budget.reserve(1000)
+    assert first['bytes'] == 500
+    budget.settle(first, 600)
+    assert budget.reserve(1000)['bytes'] == 400
+    assert budget.target == 500
+
+
+def test_allocation_limits():
+    budget = compress.SizeBudget(ratio=0.5)
+    budget.settle(budget.reserve(1000), 1000)   # Video sin comprimir: conserva su tamaño
+    # Nunca menos del 2 % del original ni más que el original
+    assert budget.reserve(1000)['bytes'] == 20
+    generous = compress.SizeBudget(total_bytes=10_000, total_input=1000)
+    assert generous.reserve(1000)['bytes'] == 1000
@@ -0,0 +1,39 @@
+import pytest
+
+import compress
+
+
+@pytest.fixture
+def overloaded(monkeypatch, capsys):
+    monkeypatch.setattr(compress, 'read_cpu_times', lambda: None)
+    monkeypatch.setattr(compress, 'read_memory_available', lambda: 0.5)
+    monkeypatch.setattr(compress.os, 'cpu_count', lambda: 4)
+    monkeypatch.setattr(compress.os, 'getloadavg', lambda: (9.5, 9.0, 8.0))
+
+
+def test_pressure_cuts_are_rate_limited(overloaded):
+    controller = compress.ConcurrencyController(4, window=60.0)
+    controller._active = 4
+    for _ in range(10):
+        controller._step()
+    assert controller.limit == 3
+    assert len(controller.decisions) == 1
+    assert 'carga excesiva: 9.5' in controller.decisions[0]['reason']
+
+    # Pasó la ventana, pero el recorte anterior aún no surte efecto (4 trabajos en curso)
+    controller._pressure_cut -= 61.0
+    controller._step()
+    assert controller.limit == 3
+
+    controller._active = 3
+    controller._step()
+    assert controller.limit == 2
+
+
+def test_low_memory_reason_includes_reading(overloaded, monkeypatch):
+    monkeypatch.setattr(compress, 'read_memory_available', lambda: 0.04)
+    controller = compress.ConcurrencyController(2, window=60.0)
+    controller._active = 2
+    controller._step()
+    assert controller.limit == 1
+    assert controller.decisions[0]['reason'].startswith('poca memoria: 4% libre')
@@ -0,0 +1,50 @@
+import pytest
+
+import compress
+
+
+def info(codec='h264', width=1920, height=1080, fps=30.0, bitrate=2_000_000, **extra):
+    return dict(codec=codec, width=width, height=height, fps=fps, bitrate=bitrate, duration=60.0, **extra)
+
+
+@pytest.mark.parametrize('video, mode, action', [
+    (info(bitrate=2_000_000), 'cpu', 'skip'),                       # 0.032 bpp
+    (info(bitrate=8_000_000), 'cpu', 'encode'),                     # 0.129 bpp
+    (info(bitrate=3_000_000), 'gpu', 'encode'),                     # 0.048 > 0.040
+    (info(codec='hevc', bitrate=4_000_000), 'cpu', 'skip'),         # 0.064 < 0.090
+    (info(codec='mpeg4', bitrate=500_000), 'cpu', 'encode'),        # sin umbral para el códec
+    # 4K que se reduce a 1080p: el bpp se mide sobre la salida
+    (info(width=3840, height=2160, bitrate=3_000_000), 'cpu', 'skip'),
+    (info(width=3840, height=2160, bitrate=8_000_000), 'cpu', 'encode'),
+    # 60 fps que se reducen a 30
+    (info(fps=60.0, bitrate=3_000_000), 'cpu', 'skip'),
+])
+def test_decide_encoding_bpp(video, mode, action):
+    assert compress.decide_encoding(video, mode)[0] == action
+
+
+@pytest.mark.parametrize('video', [None, {}, info(bitrate=0), info(width=0)])
+def test_decide_encoding_without_metadata(video):
+    assert compress.decide_encoding(video, 'cpu') == ('encode', "sin metadatos suficientes", None)
+
+
+def test_decide_encoding_custom_thresholds():
+    assert compress.decide_encoding(info(), 'cpu', thresholds={})[0] == 'encode'
+    assert compress.decide_encoding(info(bitrate=8_000_000), 'cpu',
+                                    thresholds={'cpu': {'h264': 0.2}})[0] == 'skip'
+
+
+@pytest.mark.parametrize('options, action', [
+    ({'faststart': False}, 'remux'),
+    ({'fourcc': b'hev1', 'video_bitrate': 2_500_000}, 'remux'),
+    ({'audio_bitrate': 320_000}, 'copy'),
+    ({'audio': b'ac-3'}, 'copy'),
+    ({}, 'skip'),
+    ({'width': 3840, 'height': 2160, 'faststart': False}, 'skip'),   # Hay que reducir: no se copia
+])
+def test_decide_encoding_stream_copy(make_mp4, options, action):
+    options.setdefault('video_bitrate', 1_500_000)
+    video = compress.parse_mp4(make_mp4(**options))
+    assert compress.decide_encoding(video, 'cpu', stream_copy=True)[0] == action
+    # Sin ffmpeg los videos eficientes se omiten
+    assert compress.decide_encoding(video, 'cpu', stream_copy=False)[0] == 'skip'
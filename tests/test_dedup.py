@@ -0,0 +1,78 @@
+import os
+
+import pytest
+
+import compress
+
+
+@pytest.fixture
+def copies(tmp_path):
+    paths = []
+    for name in ('a.mp4', 'b.mp4', 'c.mp4'):
+        path = tmp_path / name
+        path.write_bytes(b'mismo contenido' * 1000)
+        paths.append(str(path))
+    return paths
+
+
+def dest(path):
+    return path.replace('.mp4', '_compressed.mp4')
+
+
+def test_verify_hashes_outside_the_lock(copies, monkeypatch):
+    index = compress.DuplicateIndex(verify=True)
+    real_hash = compress.file_hash
+    held = []
+
+    def spy(path):
+        held.append(index._lock.locked())
+        return real_hash(path)
+
+    monkeypatch.setattr(compress, 'file_hash', spy)
+    assert index.claim(copies[0], dest(copies[0]))[0] == 'primary'
+    role, group = index.claim(copies[1], dest(copies[1]))
+    assert role == 'pending'
+    assert held and not any(held)
+    assert group['hash'] == real_hash(copies[0])
+
+
+def test_failed_primary_promotes_next_copy(copies):
+    index = compress.DuplicateIndex()
+    _, group = index.claim(copies[0], dest(copies[0]))
+    index.claim(copies[1], dest(copies[1]))
+    index.claim(copies[2], dest(copies[2]))
+
+    assert index.resolve(group, None) == ([], (copies[1], dest(copies[1])))
+    assert group['source'] == copies[1]
+    result = {'source': copies[1], 'dest': dest(copies[1])}
+    assert index.resolve(group, result) == ([(copies[2], dest(copies[2]))], None)
+
+
+def test_failed_primary_without_copies_does_not_fail_later_copies(copies):
+    index = compress.DuplicateIndex()
+    _, group = index.claim(copies[0], dest(copies[0]))
+    assert index.resolve(group, None) == ([], None)
+    role, other = index.claim(copies[1], dest(copies[1]))
+    assert role == 'primary'
+    assert other is not group
+
+
+def test_process_videos_encodes_copy_when_primary_fails(copies, monkeypatch):
+    encoded = []
+
+    def fake_compress(source_path, dest_path, mode, handbrake_path, **kwargs):
+        encoded.append(source_path)
+        if source_path == copies[0]:
+            return None
+        with open(dest_path, 'wb') as f:
+            f.write(b'x' * 100)
+        return {'source': source_path, 'dest': dest_path, 'original_size': os.path.getsize(source_path),
+                'compressed_size': 100, 'elapsed': 1.0, 'energy': 0.0, 'work': 1.0}
+
+    monkeypatch.setattr(compress, 'compress_video', fake_compress)
+    monkeypatch.setattr(compress, 'send2trash', lambda path: None)
+    monkeypatch.setattr(compress, 'stats', compress.CompressionStats())
+    compress.process_videos(copies, 'cpu', None, jobs=1, dedup='fast')
+    assert encoded == copies[:2]
+    assert os.path.exists(dest(copies[2]))
+    assert compress.stats.deduplicated_videos == 1
@@ -0,0 +1,42 @@
+import compress
+
+
+def test_when_disposed_waits_for_the_batch(tmp_path, monkeypatch):
+    trashed = []
+    monkeypatch.setattr(compress, 'send2trash', lambda paths: trashed.extend(paths))
+    disposer = compress.SourceDisposer(batch_size=2, linger=60.0)
+    sources = [tmp_path / 'a.mp4', tmp_path / 'b.mp4']
+    for path in sources:
+        path.write_bytes(b'x')
+
+    released = []
+    disposer.submit(str(sources[0]))
+    disposer.when_disposed(str(sources[0]), lambda: released.append('a'))
+    assert released == []
+
+    disposer.submit(str(sources[1]))   # Completa el lote
+    disposer.flush()
+    assert released == ['a']
+    assert trashed == [str(path) for path in sources]
+    assert disposer.trashed == 2 and disposer.batches == 1
+
+
+def test_when_disposed_runs_at_once_for_unqueued_sources(tmp_path):
+    released = []
+    compress.SourceDisposer().when_disposed(str(tmp_path / 'a.mp4'), lambda: released.append('a'))
+    assert released == ['a']
+
+
+def test_space_reservation_released_after_disposal(tmp_path, monkeypatch):
+    gate = compress.SpaceGate(min_free=0)
+    dest = tmp_path / 'a_compressed.mp4'
+    reservation = gate.admit(str(dest), 1000)
+    assert gate._reservations == [reservation]
+
+    disposer = compress.SourceDisposer(linger=60.0)
+    monkeypatch.setattr(compress, 'send2trash', lambda paths: None)
+    disposer.submit(str(tmp_path / 'a.mp4'))
+    disposer.when_disposed(str(tmp_path / 'a.mp4'), lambda: gate.release(reservation))
+    assert gate._reservations == [reservation]
+    disposer.flush()
+    assert gate._reservations == []
@@ -0,0 +1,203 @@
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+import compress
+
+
+class SleepingBackend:
+    """Backend de prueba: un encoder que escribe la salida y nunca termina por sí solo."""
+
+    def __init__(self, pid_path):
+        self.pid_path = pid_path
+
+    def label(self):
+        return 'sleep'
+
+    def software(self, mode):
+        return False
+
+    def describe(self, mode):
+        return 'prueba'
+
+    def progress(self, duration):
+        return compress.FfmpegProgress(duration)
+
+    def build_command(self, source_path, dest_path, mode, **kwargs):
+        script = (f"import os, time\nopen({str(self.pid_path)!r}, 'w').write(str(os.getpid()))\n"
+                  f"open({dest_path!r}, 'wb').write(b'x' * 8)\ntime.sleep(60)\n")
+        return [sys.executable, '-c', script]
+
+
+class CopyingBackend(SleepingBackend):
+    """Backend de prueba: la salida es una copia de un MP4 ya preparado."""
+
+    def __init__(self, output_path):
+        self.output_path = output_path
+
+    def build_command(self, source_path, dest_path, mode, **kwargs):
+        return [sys.executable, '-c',
+                f"import shutil; shutil.copyfile({self.output_path!r}, {dest_path!r})"]
+
+
+@pytest.fixture
+def farm(monkeypatch):
+    trashed = []
+    monkeypatch.setattr(compress, 'send2trash', trashed.append)
+    monkeypatch.setattr(compress, 'results_ledger', None)
+    monkeypatch.setattr(compress, 'space_gate', None)
+    monkeypatch.setattr(compress, 'scratch_stager', None)
+    monkeypatch.setattr(compress, 'stats', compress.CompressionStats())
+    return trashed
+
+
+def wait_for_exit(pid, seconds=15):
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return
+        time.sleep(0.1)
+    raise AssertionError('el encoder sigue en ejecución')
+
+
+def test_worker_cancels_job_when_lease_is_lost(tmp_path, monkeypatch, farm):
+    source = tmp_path / 'clip.mp4'
+    source.write_bytes(b'\0' * 4096)
+    pid_path = tmp_path / 'pid'
+    trashed, completed = farm, []
+    monkeypatch.setattr(compress, 'encoder_backend', SleepingBackend(pid_path))
+
+    coordinator = compress.EncodeCoordinator([str(source)], 'cpu', bind=('127.0.0.1', 0),
+                                             lease_seconds=2.0)
+    original_complete = coordinator.complete
+    monkeypatch.setattr(coordinator, 'complete',
+                        lambda *args: completed.append(args) or original_complete(*args))
+    server = threading.Thread(target=coordinator.server.serve_forever, daemon=True)
+    server.start()
+    worker = threading.Thread(target=compress.run_worker, args=(coordinator.url, None),
+                              kwargs={'worker_id': 'w1', 'retry_seconds': 0.1})
+    worker.start()
+    try:
+        deadline = time.monotonic() + 10
+        while not pid_path.exists() and time.monotonic() < deadline:
+            time.sleep(0.05)
+        pid = int(pid_path.read_text())
+
+        # El arriendo vence y el trabajo pasa a otro trabajador
+        with coordinator._cond:
+            lease = next(iter(coordinator._leases.values()))
+            lease['worker'] = 'w2'
+
+        # El encoder del trabajador que perdió el arriendo termina
+        wait_for_exit(pid)
+
+        # El otro trabajador termina el lote
+        with coordinator._cond:
+            coordinator._leases.clear()
+            coordinator._finished.add(lease['job']['id'])
+            coordinator._check_done_locked()
+        worker.join(timeout=30)
+        assert not worker.is_alive()
+    finally:
+        coordinator.server.shutdown()
+        coordinator.server.server_close()
+
+    assert not completed
+    assert not trashed
+    assert source.exists()
+    # La salida a medias quedaba en el directorio de trabajo del trabajador
+    assert not (tmp_path / 'clip_compressed.mp4').exists()
+    assert not [name for name in os.listdir(tmp_path) if compress.is_work_dir(name)]
+
+
+def test_worker_cancels_job_when_coordinator_is_unreachable(tmp_path, monkeypatch, farm):
+    source = tmp_path / 'clip.mp4'
+    source.write_bytes(b'\0' * 4096)
+    pid_path = tmp_path / 'pid'
+    monkeypatch.setattr(compress, 'encoder_backend', SleepingBackend(pid_path))
+
+    coordinator = compress.EncodeCoordinator([str(source)], 'cpu', bind=('127.0.0.1', 0),
+                                             lease_seconds=2.0)
+    server = threading.Thread(target=coordinator.server.serve_forever, daemon=True)
+    server.start()
+    worker = threading.Thread(target=compress.run_worker, args=(coordinator.url, None),
+                              kwargs={'worker_id': 'w1', 'retry_seconds': 0.1, 'max_retries': 3})
+    worker.start()
+    try:
+        deadline = time.monotonic() + 10
+        while not pid_path.exists() and time.monotonic() < deadline:
+            time.sleep(0.05)
+        pid = int(pid_path.read_text())
+    finally:
+        # Sin coordinador no llegan los latidos: el arriendo vence tras lease_seconds
+        coordinator.server.shutdown()
+        coordinator.server.server_close()
+
+    wait_for_exit(pid)
+    worker.join(timeout=30)
+    assert not worker.is_alive()
+    assert not farm
+    assert source.exists()
+    assert not (tmp_path / 'clip_compressed.mp4').exists()
+    assert not [name for name in os.listdir(tmp_path) if compress.is_work_dir(name)]
+
+
+def test_worker_moves_output_to_dest_after_complete(tmp_path, monkeypatch, farm, make_mp4):
+    source = make_mp4('clip.mp4', mdat_size=200_000)
+    output = make_mp4('encoded.bin', mdat_size=1024)
+    monkeypatch.setattr(compress, 'encoder_backend', CopyingBackend(output))
+    monkeypatch.setattr(compress, 'find_ffmpeg', lambda: None)
+
+    coordinator = compress.EncodeCoordinator([source], 'cpu', bind=('127.0.0.1', 0),
+                                             lease_seconds=5.0,
+                                             encode_options={'skip_thresholds': {}})
+    server = threading.Thread(target=coordinator.server.serve_forever, daemon=True)
+    server.start()
+    try:
+        compress.run_worker(coordinator.url, None, worker_id='w1', retry_seconds=0.1)
+    finally:
+        coordinator.server.shutdown()
+        coordinator.server.server_close()
+
+    dest = tmp_path / 'clip_compressed.mp4'
+    assert dest.read_bytes() == open(output, 'rb').read()
+    assert farm == [[source]]
+    assert compress.stats.total_videos == 1
+    assert not [name for name in os.listdir(tmp_path) if compress.is_work_dir(name)]
+
+
+def test_rejected_output_is_not_retried(tmp_path, monkeypatch, farm, make_mp4):
+    source = make_mp4('clip.mp4', mdat_size=1024)
+    output = make_mp4('encoded.bin', mdat_size=200_000)
+    backend = CopyingBackend(output)
+    commands = []
+    build_command = backend.build_command
+    monkeypatch.setattr(backend, 'build_command', lambda *args, **kwargs: commands.append(args)
+                        or build_command(*args, **kwargs))
+    monkeypatch.setattr(compress, 'encoder_backend', backend)
+    monkeypatch.setattr(compress, 'find_ffmpeg', lambda: None)
+
+    coordinator = compress.EncodeCoordinator([source], 'cpu', bind=('127.0.0.1', 0),
+                                             lease_seconds=5.0,
+                                             encode_options={'skip_thresholds': {}})
+    server = threading.Thread(target=coordinator.server.serve_forever, daemon=True)
+    server.start()
+    try:
+        compress.run_worker(coordinator.url, None, worker_id='w1', retry_seconds=0.1)
+    finally:
+        coordinator.server.shutdown()
+        coordinator.server.server_close()
+
+    # Un solo intento: la misma codificación volvería a ser rechazada
+    assert len(commands) == 1
+    assert not coordinator._attempts
+    assert compress.stats.failed_videos == 1
+    assert 'no es menor' in compress.stats.rejected[-1][1]
+    assert os.path.exists(source)
+    assert not farm
+    assert not (tmp_path / 'clip_compressed.mp4').exists()
@@ -0,0 +1,118 @@
+import os
+
+import pytest
+
+import compress
+
+
+@pytest.fixture
+def journal_path(tmp_path):
+    return str(tmp_path / 'journal.jsonl')
+
+
+def test_journal_replays_last_state(journal_path):
+    journal = compress.JobJournal(journal_path).open()
+    journal.record('/v/a.mp4', 'queued', original_size=100)
+    journal.record('/v/a.mp4', 'encoding', dest='/v/a_compressed.mp4')
+    journal.record('/v/a.mp4', 'encoded', compressed_size=40)
+    journal.record('/v/a.mp4', 'verified', sync=True)
+    journal.record('/v/b.mp4', 'queued', original_size=200)
+    journal.record('/v/c.mp4', 'trashed', original_size=300, compressed_size=90)
+    journal.close()
+
+    replayed = compress.JobJournal(journal_path).open()
+    assert len(replayed) == 3
+    job = replayed.get('/v/a.mp4')
+    assert job['state'] == 'verified'
+    assert (job['original_size'], job['compressed_size'], job['dest']) == (100, 40, '/v/a_compressed.mp4')
+    assert replayed.get('/v/b.mp4')['state'] == 'queued'
+    assert replayed.get('/v/missing.mp4') is None
+    assert sorted(job['source'] for job in replayed.completed()) == ['/v/a.mp4', '/v/c.mp4']
+    replayed.close()
+
+
+def test_journal_ignores_truncated_last_line(journal_path):
+    journal = compress.JobJournal(journal_path).open()
+    journal.record('/v/a.mp4', 'encoding', original_size=100)
+    journal.close()
+    with open(journal_path, 'a', encoding='utf-8') as f:
+        f.write('{"state":"enco')   # Caída a mitad de una escritura
+
+    journal = compress.JobJournal(journal_path).open()
+    assert journal.get('/v/a.mp4')['state'] == 'encoding'
+    journal.record('/v/a.mp4', 'failed')
+    journal.close()
+
+    replayed = compress.JobJournal(journal_path).open()
+    assert replayed.get('/v/a.mp4')['state'] == 'failed'
+    replayed.close()
+
+
+def test_journal_finished_batch_is_archived(journal_path):
+    journal = compress.JobJournal(journal_path).open()
+    journal.record('/v/a.mp4', 'trashed')
+    journal.close(finished=True)
+    assert not os.path.exists(journal_path)
+    assert os.path.exists(journal_path + '.done')
+    assert len(compress.JobJournal(journal_path).open()) == 0
+
+
+@pytest.fixture
+def resume(tmp_path, journal_path, monkeypatch, make_mp4):
+    """Origen de 10 s, su salida y un diario abierto; send2trash registra las rutas."""
+    trashed = []
+    monkeypatch.setattr(compress, 'send2trash', lambda paths: trashed.extend(paths))
+    monkeypatch.setattr(compress, 'stats', compress.CompressionStats())
+    source = make_mp4('clip.mp4', mdat_size=1 << 16)
+    dest = str(tmp_path / 'clip_compressed.mp4')
+    journal = compress.JobJournal(journal_path).open()
+
+    def run(state, output=True, **fields):
+        if output:
+            make_mp4('clip_compressed.mp4', mdat_size=1024)
+        job = dict({'state': state, 'original_size': os.path.getsize(source)}, **fields)
+        again = compress.resume_job(job, source, dest, journal, compress.JobConsole(live=False))
+        compress.source_disposer.flush()
+        return again
+
+    run.source, run.dest, run.journal, run.trashed = source, dest, journal, trashed
+    yield run
+    journal.close()
+
+
+def test_resume_verified_only_trashes_source(resume):
+    assert resume('verified') is False
+    assert resume.trashed == [resume.source]
+    assert os.path.exists(resume.dest)
+    assert resume.journal.get(resume.source)['state'] == 'trashed'
+
+
+def test_resume_encoded_verifies_output(resume):
+    assert resume('encoded', compressed_size=2000, elapsed=5.0) is False
+    assert resume.trashed == [resume.source]
+    assert compress.stats.total_videos == 1
+
+
+def test_resume_encoded_invalid_output_is_redone(resume, tmp_path):
+    (tmp_path / 'clip_compressed.mp4').write_bytes(b'\0' * 100)   # Salida a medio escribir
+    assert resume('encoded', output=False) is True
+    assert not os.path.exists(resume.dest)
+    assert resume.trashed == []
+
+
+@pytest.mark.parametrize('state', ['queued', 'encoding', 'failed'])
+def test_resume_unfinished_removes_partial_output(resume, state):
+    assert resume(state) is True
+    assert not os.path.exists(resume.dest)
+    assert resume.trashed == []
+
+
+def test_resume_trashed_keeps_output(resume):
+    assert resume('trashed') is False
+    assert os.path.exists(resume.dest)
+    assert resume.trashed == []
+
+
+def test_resume_changed_source_is_new(resume):
+    assert resume('verified', original_size=1) is True
+    assert resume.trashed == []
@@ -0,0 +1,16 @@
+import compress
+
+
+def test_metrics_follow_prometheus_naming():
+    metrics = compress.BatchMetrics()
+    metrics.enabled = True
+    metrics.on_event({'event': 'done', 'source': 'a.mp4', 'original_size': 3000,
+                      'compressed_size': 1000, 'elapsed': 12.0})
+    metrics.on_event({'event': 'done', 'source': 'b.mp4', 'original_size': 500,
+                      'compressed_size': 200, 'elapsed': 3.0})
+    text = metrics.render()
+    assert 'compress_saved_bytes_total 2300\n' in text
+    assert 'compress_video_saved_bytes_count 2\n' in text
+    types = dict(line.split()[2:4] for line in text.splitlines() if line.startswith('# TYPE'))
+    assert all(name.endswith('_total') for name, kind in types.items() if kind == 'counter')
+    assert not [name for name, kind in types.items() if kind != 'counter' and name.endswith('_total')]
@@ -0,0 +1,104 @@
+import struct
+
+import pytest
+
+import compress
+
+
+def test_parse_mp4_reads_video_and_audio_headers(make_mp4):
+    info = compress.parse_mp4(make_mp4(width=1280, height=720, fps=25, duration=8.0,
+                                       video_bitrate=2_000_000, audio_bitrate=128_000))
+    assert (info['width'], info['height']) == (1280, 720)
+    assert info['duration'] == pytest.approx(8.0)
+    assert info['duration_ms'] == 8000
+    assert info['fps'] == pytest.approx(25.0)
+    assert info['sample_count'] == 200
+    assert info['codec'] == 'h264' and info['fourcc'] == 'avc1'
+    assert info['bitrate'] == pytest.approx(2_000_000, rel=0.01)
+    assert info['audio_codec'] == 'aac'
+    assert info['audio_bitrate'] == pytest.approx(128_000, rel=0.01)
+    assert info['faststart'] is True
+
+
+def test_parse_mp4_moov_after_mdat(make_mp4):
+    info = compress.parse_mp4(make_mp4(faststart=False, mdat_size=1 << 16))
+    assert info['faststart'] is False
+    assert info['duration'] == pytest.approx(10.0)
+
+
+@pytest.mark.parametrize('fourcc, codec', [(b'hvc1', 'hevc'), (b'hev1', 'hevc'), (b'av01', 'av1'),
+                                           (b'apcn', 'prores'), (b'xyz1', 'xyz1')])
+def test_parse_mp4_codec_names(make_mp4, fourcc, codec):
+    info = compress.parse_mp4(make_mp4(fourcc=fourcc))
+    assert info['codec'] == codec
+    assert info['fourcc'] == fourcc.decode()
+
+
+def test_parse_mp4_without_audio(make_mp4):
+    info = compress.parse_mp4(make_mp4(audio=None))
+    assert info['audio_codec'] == ''
+    assert info['audio_bitrate'] == 0
+
+
+def test_parse_mp4_64_bit_box_sizes(tmp_path, make_mp4):
+    data = open(make_mp4(), 'rb').read()
+    # Reescribe mdat (la última caja) con el tamaño extendido de 64 bits
+    offset = data.rindex(b'mdat') - 4
+    size = struct.unpack_from('>I', data, offset)[0]
+    data = data[:offset] + struct.pack('>I4sQ', 1, b'mdat', size + 8) + data[offset + 8:]
+    path = tmp_path / 'large.mp4'
+    path.write_bytes(data)
+    assert compress.parse_mp4(str(path))['duration'] == pytest.approx(10.0)
+
+
+@pytest.mark.parametrize('content', [b'', b'1234567', b'\0\0\0\x10ftypisom' + bytes(8) + b'garbage'])
+def test_parse_mp4_rejects_non_mp4(tmp_path, content):
+    path = tmp_path / 'bad.mp4'
+    path.write_bytes(content)
+    with pytest.raises(compress.MP4ParseError):
+        compress.parse_mp4(str(path))
+
+
+def test_parse_mp4_truncated_moov(make_mp4):
+    with pytest.raises(compress.MP4ParseError):
+        compress.parse_mp4(make_mp4(faststart=False, mdat_size=4096, truncate=4200))
+
+
+def test_parse_mp4_requires_video_track(tmp_path, make_mp4):
+    data = open(make_mp4(), 'rb').read().replace(b'vide', b'text')
+    path = tmp_path / 'audio_only.mp4'
+    path.write_bytes(data)
+    with pytest.raises(compress.MP4ParseError, match="no hay pista de video"):
+        compress.parse_mp4(str(path))
+
+
+def test_keyframe_times_from_stss(make_mp4):
+    path = make_mp4(fps=30, duration=10.0, keyframes=[1, 61, 121, 241])
+    assert compress.mp4_keyframe_times(path) == pytest.approx([0.0, 2.0, 4.0, 8.0])
+
+
+def test_keyframe_times_variable_durations(make_mp4):
+    # 30 muestras de 1/30 s seguidas de 30 de 1/15 s
+    path = make_mp4(deltas=[(30, 3000), (30, 6000)], keyframes=[1, 31, 46])
+    assert compress.mp4_keyframe_times(path) == pytest.approx([0.0, 1.0, 2.0])
+
+
+def test_keyframe_times_without_stss(make_mp4):
+    path = make_mp4(fps=10, duration=1.0)
+    assert compress.mp4_keyframe_times(path) == pytest.approx([i / 10 for i in range(10)])
+
+
+def test_plan_split_cuts_at_nearest_keyframes(make_mp4, monkeypatch):
+    monkeypatch.setattr(compress, 'find_ffmpeg', lambda: '/usr/bin/ffmpeg')
+    # 40 min a 1 fps con un fotograma clave cada 7 s
+    path = make_mp4(fps=1, duration=2400.0, keyframes=list(range(1, 2401, 7)))
+    segments = compress.plan_split(path, {'duration': 2400.0}, 4, min_duration=60)
+    assert [start for start, _ in segments] == [0.0, 602.0, 1197.0, 1799.0]
+    assert segments[-1][1] is None
+    assert all(start + length == following for (start, length), (following, _)
+               in zip(segments, segments[1:]))
+
+
+def test_plan_split_short_video(make_mp4, monkeypatch):
+    monkeypatch.setattr(compress, 'find_ffmpeg', lambda: '/usr/bin/ffmpeg')
+    assert compress.plan_split(make_mp4(), {'duration': 10.0}, 4) == []
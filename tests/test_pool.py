@@ -0,0 +1,31 @@
+import threading
+
+import compress
+
+
+def test_vanished_source_fails_without_losing_the_worker(tmp_path, monkeypatch):
+    present = tmp_path / 'b.mp4'
+    present.write_bytes(b'\0' * 1000)
+    vanished = str(tmp_path / 'a.mp4')
+    encoded = []
+
+    def fake_compress(source_path, dest_path, mode, handbrake_path, **kwargs):
+        encoded.append(source_path)
+        return {'source': source_path, 'dest': dest_path, 'original_size': 1000,
+                'compressed_size': 100, 'elapsed': 1.0, 'energy': 0.0, 'work': 1.0}
+
+    # El archivo existía al escanearlo y desaparece antes de codificarse
+    monkeypatch.setattr(compress, 'prepare_paths',
+                        lambda path: (path, path.replace('.mp4', '_compressed.mp4')))
+    monkeypatch.setattr(compress, 'compress_video', fake_compress)
+    monkeypatch.setattr(compress, 'size_budget', compress.SizeBudget(ratio=0.5))
+    monkeypatch.setattr(compress, 'stats', compress.CompressionStats())
+
+    batch = threading.Thread(target=compress.process_videos,
+                             args=([vanished, str(present)], 'cpu', None), kwargs={'jobs': 1})
+    batch.start()
+    batch.join(timeout=30)
+    assert not batch.is_alive()
+    assert encoded == [str(present)]
+    assert compress.stats.failed_videos == 1
+    assert compress.stats.total_videos == 1
@@ -0,0 +1,50 @@
+import json
+import os
+
+import compress
+
+INFO = {'width': 1920, 'height': 1080, 'duration': 10.0, 'codec': 'h264', 'bitrate': 4_000_000, 'fps': 30.0}
+
+
+def videos(tmp_path, count):
+    paths = []
+    for i in range(count):
+        path = tmp_path / f'clip_{i:02d}.mp4'
+        path.write_bytes(b'\0' * (i + 1))
+        paths.append(str(path))
+    return paths
+
+
+def test_probe_cache_round_trip(tmp_path):
+    cache_path = str(tmp_path / 'probe_cache.json')
+    cache = compress.ProbeCache(cache_path)
+    path = videos(tmp_path, 1)[0]
+    cache.put(path, INFO)
+    cache.save()
+    reloaded = compress.ProbeCache(cache_path)
+    assert reloaded.get(path) == INFO
+    # Un archivo modificado vuelve a analizarse
+    with open(path, 'ab') as f:
+        f.write(b'\0')
+    assert reloaded.get(path) is None
+
+
+def test_probe_cache_file_is_bounded_in_bytes(tmp_path):
+    cache_path = str(tmp_path / 'probe_cache.json')
+    cache = compress.ProbeCache(cache_path, max_bytes=2048)
+    paths = videos(tmp_path, 30)
+    for path in paths:
+        cache.put(path, INFO)
+    cache.get(paths[0])   # Uso reciente: la primera entrada no se desaloja
+    cache.save()
+
+    assert os.path.getsize(cache_path) <= 2048
+    with open(cache_path, encoding='utf-8') as f:
+        kept = [key for key, _ in json.load(f)['entries']]
+    assert 0 < len(kept) < len(paths)
+    assert paths[0] in kept
+    assert paths[-1] in kept
+    assert paths[1] not in kept
+    reloaded = compress.ProbeCache(cache_path)
+    assert reloaded.get(paths[-1]) == INFO
+    assert reloaded.get(paths[1]) is None
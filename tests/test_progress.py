@@ -0,0 +1,90 @@
+import os
+import sys
+import time
+
+import pytest
+
+import compress
+
+
+FFMPEG_IDLE = "frame=    0 fps=0.0 q=0.0 size=       0kB time=00:00:00.00 bitrate=N/A speed=0x"
+FFMPEG_RUNNING = "frame= 1234 fps= 56 q=28.0 size=  1024kB time=00:00:41.13 bitrate= 204.0kbits/s speed=1.87x"
+
+
+def test_ffmpeg_progress_without_eta():
+    event = compress.FfmpegProgress(60).parse(FFMPEG_IDLE)
+    assert event.fps == 0.0
+    assert event.eta is None
+
+
+def test_ffmpeg_progress_with_eta():
+    event = compress.FfmpegProgress(60).parse(FFMPEG_RUNNING)
+    assert event.percent == pytest.approx(68.55, abs=0.01)
+    assert event.eta == int((60 - 41.13) / 1.87)
+
+
+@pytest.mark.parametrize('duration', [60, 0, None])
+def test_console_progress_accepts_fps_without_eta(duration, capsys):
+    event = compress.FfmpegProgress(duration).parse(FFMPEG_IDLE)
+    compress.JobConsole('x', live=True).progress(event)
+    out = capsys.readouterr().out
+    assert '0.0 fps' in out
+    assert 'ETA' not in out
+
+
+def test_console_progress_with_eta(capsys):
+    compress.JobConsole('x', live=True).progress(compress.ProgressEvent(50.0, fps=30.0, eta=3725))
+    assert 'ETA 01:02:05' in capsys.readouterr().out
+
+
+class ScriptBackend:
+    """Backend de prueba: cada segmento es un proceso de Python que imprime líneas de ffmpeg."""
+
+    def __init__(self, lines):
+        self.lines = lines
+
+    def software(self, mode):
+        return False
+
+    def progress(self, duration):
+        return compress.FfmpegProgress(duration)
+
+    def build_command(self, source_path, dest_path, mode, **kwargs):
+        script = (f"import sys\nfor line in {self.lines!r}:\n    print(line, flush=True)\n"
+                  f"open({dest_path!r}, 'wb').close()\n")
+        return [sys.executable, '-c', script]
+
+
+def test_segmented_progress_without_eta(tmp_path, monkeypatch):
+    fake_ffmpeg = tmp_path / 'ffmpeg'
+    fake_ffmpeg.write_text(f"#!{sys.executable}\nimport sys\nopen(sys.argv[-1], 'wb').close()\n")
+    fake_ffmpeg.chmod(0o755)
+    monkeypatch.setattr(compress, 'find_ffmpeg', lambda: str(fake_ffmpeg))
+    monkeypatch.setattr(compress, 'encoder_backend', ScriptBackend([FFMPEG_IDLE, FFMPEG_RUNNING]))
+
+    events = []
+    dest = tmp_path / 'out.mp4'
+    code = compress.encode_segmented(str(tmp_path / 'in.mp4'), str(dest), 'cpu', None,
+                                     {'duration': 120.0, 'width': 1920, 'audio_codec': ''},
+                                     [(0.0, 60.0), (60.0, None)], on_progress=events.append)
+    assert code == 0
+    assert dest.exists()
+    assert events
+
+
+def test_run_encoder_kills_process_on_callback_error(tmp_path):
+    pid_path = tmp_path / 'pid'
+    script = (f"import os, time\nopen({str(pid_path)!r}, 'w').write(str(os.getpid()))\n"
+              f"print({FFMPEG_RUNNING!r}, flush=True)\ntime.sleep(60)\n")
+
+    def fail(event):
+        raise ValueError('callback')
+
+    start = time.monotonic()
+    with pytest.raises(ValueError):
+        compress.run_encoder([sys.executable, '-c', script], on_progress=fail,
+                             progress=compress.FfmpegProgress(60))
+    assert time.monotonic() - start < 30
+    pid = int(pid_path.read_text())
+    with pytest.raises(ProcessLookupError):
+        os.kill(pid, 0)
@@ -0,0 +1,34 @@
+import os
+
+import pytest
+
+import compress
+
+
+@pytest.fixture
+def library(tmp_path):
+    (tmp_path / 'clip.mp4').write_bytes(b'x' * 16)
+    (tmp_path / 'clip_compressed.mp4').write_bytes(b'x' * 16)
+    (tmp_path / 'sub').mkdir()
+    (tmp_path / 'sub' / 'Other.MP4').write_bytes(b'x' * 16)
+    for prefix in ('segments_ab', 'tune_cd', 'sample_ef'):
+        work_dir = tmp_path / (compress.WORK_DIR_PREFIX + prefix)
+        work_dir.mkdir()
+        (work_dir / 'segment_000.mp4').write_bytes(b'x' * 16)
+    return tmp_path
+
+
+def test_iter_videos_skips_outputs_and_work_dirs(library):
+    found = sorted(os.path.relpath(path, library) for path in compress.iter_videos(str(library)))
+    assert found == ['clip.mp4', os.path.join('sub', 'Other.MP4')]
+
+
+@pytest.mark.parametrize('use_inotify', [True, False])
+def test_folder_watcher_skips_work_dirs(library, use_inotify):
+    watcher = compress.FolderWatcher(str(library), stable_seconds=0.0, poll_interval=0.05,
+                                     use_inotify=use_inotify)
+    videos = watcher.watch()
+    first = next(videos)
+    watcher.stop()
+    found = sorted(os.path.relpath(path, library) for path in [first, *videos])
+    assert found == ['clip.mp4', os.path.join('sub', 'Other.MP4')]
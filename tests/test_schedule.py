@@ -0,0 +1,63 @@
+import pytest
+
+import compress
+
+
+def job(cost, savings=0, name=None, size=0, known=True):
+    return {'source': name or f'{cost}.mp4', 'cost': cost, 'savings': savings, 'size': size,
+            'known': known, 'skip': False, 'measured': False}
+
+
+def test_single_worker_runs_jobs_back_to_back():
+    result = compress.simulate_schedule([job(10, 1), job(20, 1), job(30, 1)], 1)
+    assert result['makespan'] == 60
+    assert result['mean_completion'] == pytest.approx((10 + 30 + 60) / 3)
+
+
+def test_each_job_goes_to_the_first_free_worker():
+    # Con dos trabajadores: 2 y 3 en paralelo, el 4 entra al liberarse el de 2
+    result = compress.simulate_schedule([job(2), job(3), job(4)], 2)
+    assert result['makespan'] == 6
+
+
+def test_longest_first_shortens_the_makespan():
+    jobs = [job(1), job(1), job(1), job(1), job(4)]
+    walk = compress.simulate_schedule(jobs, 2)
+    lpt = compress.simulate_schedule(sorted(jobs, key=compress.ORDER_POLICIES['lpt']), 2)
+    assert walk['makespan'] == 6
+    assert lpt['makespan'] == 4
+
+
+def test_half_savings_is_reached_when_half_is_recovered():
+    jobs = [job(10, savings=100), job(5, savings=10), job(20, savings=300)]
+    result = compress.simulate_schedule(jobs, 1)
+    # Fines: 10 (100), 15 (110), 35 (410) -> la mitad (205) llega al final
+    assert result['half_savings'] == 35
+    ordered = sorted(jobs, key=compress.ORDER_POLICIES['savings'])
+    assert compress.simulate_schedule(ordered, 1)['half_savings'] == 20
+
+
+def test_empty_batch():
+    assert compress.simulate_schedule([], 4) == {'makespan': 0.0, 'mean_completion': 0.0,
+                                                 'half_savings': 0.0}
+
+
+def test_plan_order_fills_cost_of_unprobed_videos(monkeypatch):
+    predictions = {
+        'a.mp4': job(100, size=1000, name='a.mp4'),
+        'b.mp4': job(0, size=3000, name='b.mp4', known=False),
+        'c.mp4': job(50, size=1000, name='c.mp4'),
+    }
+    monkeypatch.setattr(compress, 'prepare_paths', lambda path: (path, None))
+    monkeypatch.setattr(compress, 'predict_job', lambda path, *args: dict(predictions[path]))
+
+    ordered = compress.plan_order(['a.mp4', 'b.mp4', 'c.mp4'], 'cpu', 'lpt')
+    # 150 s para 2000 bytes analizados -> 0.075 s/byte para el video sin analizar
+    assert [entry['source'] for entry in ordered] == ['b.mp4', 'a.mp4', 'c.mp4']
+    assert ordered[0]['cost'] == pytest.approx(225)
+    walk = compress.plan_order(['a.mp4', 'b.mp4', 'c.mp4'], 'cpu', 'walk')
+    assert [entry['source'] for entry in walk] == ['a.mp4', 'b.mp4', 'c.mp4']
+
+
+def test_hms():
+    assert compress.hms(3725.9) == '1h 02m 05s'
@@ -0,0 +1,114 @@
+import json
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+import compress
+
+
+class SegmentBackend:
+    """Backend de prueba: cada segmento escribe unos bytes (o se queda colgado si hang)."""
+
+    def __init__(self, hang=()):
+        self.hang = hang
+        self.commands = []
+
+    def label(self):
+        return 'segmentos'
+
+    def software(self, mode):
+        return False
+
+    def describe(self, mode):
+        return 'prueba'
+
+    def progress(self, duration):
+        return compress.FfmpegProgress(duration)
+
+    def build_command(self, source_path, dest_path, mode, start=None, **kwargs):
+        self.commands.append(dest_path)
+        if (start or 0) in self.hang:
+            return [sys.executable, '-c', "import time; time.sleep(60)"]
+        return [sys.executable, '-c', f"open({dest_path!r}, 'wb').write(b'x' * 8)"]
+
+
+@pytest.fixture
+def fake_ffmpeg(tmp_path, monkeypatch):
+    """ffmpeg de prueba: registra sus argumentos; el origen solo tiene una pista de video."""
+    log = tmp_path / 'ffmpeg.log'
+    script = tmp_path / 'ffmpeg'
+    script.write_text(f"#!{sys.executable}\nimport json, sys\nargs = sys.argv[1:]\n"
+                      f"open({str(log)!r}, 'a').write(json.dumps(args) + '\\n')\n"
+                      f"if args[-2] == '-i':\n"
+                      f"    sys.stderr.write('  Stream #0:0[0x1](und): Video: h264 (avc1)\\n')\n"
+                      f"    sys.exit(1)\n"
+                      f"if '-vn' in args:\n"
+                      f"    sys.exit(1)\n"
+                      f"open(args[-1], 'wb').write(b'mp4')\n")
+    script.chmod(0o755)
+    monkeypatch.setattr(compress, 'find_ffmpeg', lambda: str(script))
+    return lambda: [json.loads(line) for line in log.read_text().splitlines()]
+
+
+def test_probe_audio_stream(fake_ffmpeg, tmp_path):
+    assert not compress.probe_audio_stream(compress.find_ffmpeg(), str(tmp_path / 'clip.mov'))
+
+
+def test_segmented_encode_without_audio_info(fake_ffmpeg, tmp_path, monkeypatch):
+    # Análisis del escaneo de HandBrakeCLI: sin clave audio_codec
+    info = {'width': 1920, 'height': 1080, 'duration': 20.0}
+    backend = SegmentBackend()
+    monkeypatch.setattr(compress, 'encoder_backend', backend)
+    dest = str(tmp_path / 'clip_compressed.mp4')
+    returncode = compress.encode_segmented(str(tmp_path / 'clip.mov'), dest, 'cpu', None, info,
+                                           [(0.0, 10.0), (10.0, None)])
+    assert returncode == 0
+    assert os.path.exists(dest)
+    calls = fake_ffmpeg()
+    assert not [args for args in calls if '-vn' in args]
+    assert '1:a' not in calls[-1]
+    assert not [name for name in os.listdir(tmp_path) if compress.is_work_dir(name)]
+
+
+class FailingSegmentBackend(SegmentBackend):
+    """El segmento que empieza en fail termina con error; el resto se queda colgado."""
+
+    def __init__(self, fail):
+        super().__init__(hang=())
+        self.fail = fail
+
+    def build_command(self, source_path, dest_path, mode, start=None, **kwargs):
+        if (start or 0) == self.fail:
+            return [sys.executable, '-c', "import sys; sys.exit(1)"]
+        return [sys.executable, '-c', "import time; time.sleep(60)"]
+
+
+def test_failed_segment_stops_its_siblings(fake_ffmpeg, tmp_path, monkeypatch):
+    info = {'width': 1920, 'height': 1080, 'duration': 30.0, 'audio_codec': ''}
+    monkeypatch.setattr(compress, 'encoder_backend', FailingSegmentBackend(fail=20.0))
+    started = time.monotonic()
+    returncode = compress.encode_segmented(str(tmp_path / 'clip.mp4'), str(tmp_path / 'out.mp4'),
+                                           'cpu', None, info, [(0.0, 10.0), (10.0, 10.0), (20.0, None)])
+    assert returncode == 1
+    # Los segmentos colgados se terminan sin esperar a su propio tiempo máximo
+    assert time.monotonic() - started < 30
+
+
+def test_cancel_stops_segments_and_audio(tmp_path, monkeypatch):
+    script = tmp_path / 'ffmpeg'
+    script.write_text(f"#!{sys.executable}\nimport time\ntime.sleep(60)\n")
+    script.chmod(0o755)
+    monkeypatch.setattr(compress, 'find_ffmpeg', lambda: str(script))
+    monkeypatch.setattr(compress, 'encoder_backend', SegmentBackend(hang=(0.0, 10.0)))
+    info = {'width': 1920, 'height': 1080, 'duration': 20.0, 'audio_codec': 'aac'}
+    cancel = threading.Event()
+    threading.Timer(0.5, cancel.set).start()
+    started = time.monotonic()
+    with pytest.raises(compress.EncoderCancelled):
+        compress.encode_segmented(str(tmp_path / 'clip.mp4'), str(tmp_path / 'out.mp4'), 'cpu',
+                                  None, info, [(0.0, 10.0), (10.0, None)], cancel=cancel)
+    assert time.monotonic() - started < 30
+    assert not [name for name in os.listdir(tmp_path) if compress.is_work_dir(name)]
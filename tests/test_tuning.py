@@ -0,0 +1,55 @@
+import pytest
+
+import compress
+
+INFO = {'width': 1920, 'height': 1080, 'duration': 120.0, 'codec': 'h264', 'fps': 30.0,
+        'bitrate': 8_000_000}
+
+
+@pytest.fixture
+def tuning(tmp_path, monkeypatch):
+    cache = compress.TuningCache(str(tmp_path / 'tuning_cache.json'))
+    monkeypatch.setattr(compress, 'tuning_cache', cache)
+    monkeypatch.setattr(compress, 'find_ffmpeg', lambda: 'ffmpeg')
+    monkeypatch.setattr(compress, 'encoder_backend', compress.FfmpegBackend('ffmpeg', codec='libx264'))
+    calls = []
+
+    def use(results):
+        def evaluate(*args):
+            calls.append(args[-1])
+            return results(args[-1])
+        monkeypatch.setattr(compress, 'evaluate_candidate', evaluate)
+        return calls
+    return use
+
+
+def choose(tmp_path):
+    return compress.choose_tuning(str(tmp_path / 'clip.mp4'), INFO, 'cpu', None, {'target_ssim': 0.95},
+                                  console=compress.JobConsole(live=False))
+
+
+def test_failed_trials_are_not_cached(tuning, tmp_path):
+    calls = tuning(lambda candidate: None)
+    assert choose(tmp_path) is None
+    assert calls
+    # La siguiente vez se vuelve a buscar
+    calls.clear()
+    choose(tmp_path)
+    assert calls
+
+
+def test_measured_miss_is_cached(tuning, tmp_path):
+    calls = tuning(lambda candidate: dict(candidate, ssim=0.5, ratio=0.5))
+    assert choose(tmp_path) is None
+    calls.clear()
+    assert choose(tmp_path) is None
+    assert not calls
+
+
+def test_chosen_settings_are_cached(tuning, tmp_path):
+    calls = tuning(lambda candidate: dict(candidate, ssim=0.99, ratio=0.4))
+    chosen = choose(tmp_path)
+    assert chosen['preset'] == 'veryfast'
+    calls.clear()
+    assert choose(tmp_path)['quality'] == chosen['quality']
+    assert not calls
@@ -0,0 +1,98 @@
+import os
+import sys
+
+import pytest
+
+import compress
+
+
+def test_verify_output_accepts_smaller_complete_output(make_mp4):
+    path = make_mp4()
+    assert compress.verify_output(path, 10.0, os.path.getsize(path) + 1) is None
+
+
+@pytest.mark.parametrize('extra', [0, 1000])
+def test_verify_output_rejects_output_not_smaller(make_mp4, extra):
+    path = make_mp4()
+    assert 'no es menor' in compress.verify_output(path, 10.0, os.path.getsize(path) - extra)
+
+
+def test_verify_output_rejects_truncated_output(make_mp4):
+    path = make_mp4(faststart=False, mdat_size=4096, truncate=4000)
+    assert 'no se puede analizar' in compress.verify_output(path, 10.0)
+
+
+def test_verify_output_rejects_wrong_duration(make_mp4):
+    assert 'dura 5.0s' in compress.verify_output(make_mp4(duration=5.0), 60.0)
+    # Dentro de la tolerancia (2 s o 2 %)
+    assert compress.verify_output(make_mp4(duration=59.0), 60.0) is None
+
+
+@pytest.fixture
+def copying_ffmpeg(tmp_path, monkeypatch):
+    """ffmpeg de prueba que copia el origen tal cual al destino (un remux que no reduce)."""
+    script = tmp_path / 'ffmpeg'
+    script.write_text(f"#!{sys.executable}\nimport shutil, sys\n"
+                      f"shutil.copyfile(sys.argv[sys.argv.index('-i') + 1], sys.argv[-1])\n")
+    script.chmod(0o755)
+    monkeypatch.setattr(compress, 'find_ffmpeg', lambda: str(script))
+    monkeypatch.setattr(compress, 'results_ledger', None)
+    trashed = []
+    monkeypatch.setattr(compress, 'send2trash', trashed.append)
+    return trashed
+
+
+@pytest.fixture
+def faststart_ffmpeg(tmp_path, monkeypatch):
+    """ffmpeg de prueba que hace un remux con faststart: mueve la caja moov antes de mdat."""
+    script = tmp_path / 'ffmpeg'
+    script.write_text(f"#!{sys.executable}\nimport struct, sys\n"
+                      f"data = open(sys.argv[sys.argv.index('-i') + 1], 'rb').read()\n"
+                      f"boxes, offset = [], 0\n"
+                      f"while offset < len(data):\n"
+                      f"    size = struct.unpack('>I', data[offset:offset + 4])[0]\n"
+                      f"    boxes.append(data[offset:offset + size])\n"
+                      f"    offset += size\n"
+                      f"boxes.sort(key=lambda box: box[4:8] == b'mdat')\n"
+                      f"open(sys.argv[-1], 'wb').write(b''.join(boxes))\n")
+    script.chmod(0o755)
+    monkeypatch.setattr(compress, 'find_ffmpeg', lambda: str(script))
+    monkeypatch.setattr(compress, 'results_ledger', None)
+    trashed = []
+    monkeypatch.setattr(compress, 'send2trash', trashed.append)
+    return trashed
+
+
+def test_remux_that_fixes_faststart_is_kept(make_mp4, faststart_ffmpeg, tmp_path):
+    source = make_mp4(faststart=False)
+    dest = str(tmp_path / 'clip_compressed.mp4')
+    info = compress.parse_mp4(source)
+    assert not info['faststart']
+    result = compress.stream_copy_video(source, dest, 'cpu', info, 'remux', "sin faststart",
+                                        os.path.getsize(source), compress.JobConsole(live=False))
+    compress.source_disposer.flush()
+    assert result['stream_copy'] == 'remux'
+    assert result['compressed_size'] == os.path.getsize(source)
+    assert compress.parse_mp4(dest)['faststart']
+    assert faststart_ffmpeg == [[source]]
+
+
+def test_verify_output_remux_tolerance(make_mp4):
+    path = make_mp4()
+    size = os.path.getsize(path)
+    assert compress.verify_output(path, 10.0, size, compress.REMUX_SIZE_TOLERANCE) is None
+    assert compress.verify_output(path, 10.0, int(size / 1.005), compress.REMUX_SIZE_TOLERANCE) is None
+    assert 'supera' in compress.verify_output(path, 10.0, int(size / 1.05), compress.REMUX_SIZE_TOLERANCE)
+
+
+def test_audio_copy_that_does_not_shrink_is_rejected(make_mp4, copying_ffmpeg, tmp_path):
+    source = make_mp4()
+    dest = str(tmp_path / 'clip_compressed.mp4')
+    info = compress.parse_mp4(source)
+    result = compress.stream_copy_video(source, dest, 'cpu', info, 'copy', "audio a 320 kbps",
+                                        os.path.getsize(source), compress.JobConsole(live=False))
+    compress.source_disposer.flush()
+    assert result is None
+    assert os.path.exists(source)
+    assert not os.path.exists(dest)
+    assert not copying_ffmpeg